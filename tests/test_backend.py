@@ -0,0 +1,74 @@
+import hashlib
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox import utils, video_info
+from touchscreen_toolbox.pose_estimation import SyntheticBackend, get_backend, stream_analyze
+
+KEYPOINTS = cfg.MICE + cfg.REFE
+GENERATE = "from touchscreen_toolbox.pose_estimation import SyntheticBackend; import numpy as np, hashlib; " \
+           "print(hashlib.md5(SyntheticBackend(seed=3).generate(np.arange(500), 640, 480).tobytes()).hexdigest())"
+
+
+def test_deterministic_across_runs():
+    poses = SyntheticBackend(seed=3).generate(np.arange(500), 640, 480)
+    np.testing.assert_array_equal(poses, SyntheticBackend(seed=3).generate(np.arange(500), 640, 480))
+    assert not np.array_equal(poses, SyntheticBackend(seed=4).generate(np.arange(500), 640, 480))
+
+    # in a new process (e.g. another worker)
+    run = subprocess.run([sys.executable, "-c", GENERATE], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert run.stdout.strip() == hashlib.md5(poses.tobytes()).hexdigest()
+
+
+def test_blocks_same_as_whole():
+    backend = SyntheticBackend()
+    block = np.zeros((1, 480, 640, 3), np.uint8)
+    whole = backend.generate(np.arange(100), 640, 480)
+    blocks = np.concatenate([backend.analyze_frames(np.repeat(block, len(range(i, min(i + 8, 100))), 0),
+                                                    (i, min(i + 8, 100))) for i in range(0, 100, 8)])
+    np.testing.assert_array_equal(blocks, whole)
+
+
+def test_keypoint_order_and_shape():
+    backend = SyntheticBackend(dropout=0.1)
+    poses = backend.generate(np.arange(1000), 640, 480)
+    assert poses.shape == (1000, len(KEYPOINTS), 3)
+
+    # references at their positions, in cfg.REFE order after cfg.MICE
+    refe = poses[:, len(cfg.MICE):, :2].mean(axis=0)
+    np.testing.assert_allclose(refe, [np.multiply(backend.REFE_POSITIONS[k], (640, 480)) for k in cfg.REFE], atol=0.1)
+    # body trailing the snout, in cfg.MICE order
+    lengths = np.linalg.norm(poses[:, :len(cfg.MICE), :2] - poses[:, :1, :2], axis=-1).mean(axis=0)
+    np.testing.assert_allclose(lengths, [np.hypot(*backend.MICE_OFFSETS[k]) for k in cfg.MICE], atol=1)
+
+    confidence = poses[..., 2]
+    assert ((confidence > 0) & (confidence <= 1)).all()
+    assert 0.05 < (confidence < 0.5).mean() < 0.15  # dropped predictions
+
+
+def test_saved_result(tmp_path):
+    path = str(tmp_path / "1 - C1 - 01-02-03 10-00.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for _ in range(10):
+        writer.write(np.full((48, 64, 3), 100, np.uint8))
+    writer.release()
+
+    results = []  # generated from the probe / streamed (resized to cfg.RESOLUTION)
+    for analyze in (get_backend("synthetic").analyze_video, lambda v: stream_analyze(v, SyntheticBackend())):
+        vid_info = video_info.get_vid_info(path)
+        utils.initialize_folders(vid_info)
+        analyze(vid_info)
+        results.append(pd.read_hdf(os.path.join(vid_info["dir"], vid_info["dlc_result"])))
+
+    for data in results:
+        assert data.shape == (10, len(KEYPOINTS) * 3)
+        assert list(data.columns.get_level_values("bodyparts")[::3]) == list(KEYPOINTS)
+        assert list(data.columns.get_level_values("coords")[:3]) == ["x", "y", "likelihood"]
+    pd.testing.assert_frame_equal(results[0], results[1])
@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from touchscreen_toolbox import utils
+from touchscreen_toolbox.pose_estimation import preprocess
+
+
+@pytest.fixture
+def frames():
+    return np.random.default_rng(0).integers(0, 256, (20, 48, 64, 3), dtype=np.uint8)
+
+
+def per_frame(func, frames, start=0):
+    return np.stack([func(frame.copy(), count) for count, frame in enumerate(frames, start)])
+
+
+def in_blocks(func, frames, batch_size, start=0):
+    blocks = []
+    for i in range(0, len(frames), batch_size):
+        block = frames[i:i + batch_size].copy()
+        blocks.append(func(block, (start + i, start + i + len(block))).copy())
+    return np.concatenate(blocks)
+
+
+def text_writer_per_frame(data, col, position=(0, 0), fontScale=1):
+    """Per-frame text writer, as before it was batched"""
+    data = data[col]
+    frame_start_end = (data.index[0], data.index[-1])
+
+    def func(frame, count):
+        if count < frame_start_end[0] or count > frame_start_end[-1]:
+            return frame
+        text = f"{col}: {data.loc[count]}"
+        text_size = cv2.getTextSize(text=text, fontFace=cv2.FONT_HERSHEY_DUPLEX, fontScale=fontScale, thickness=1)
+        height = text_size[0][1]
+        position2 = (position[0], int(position[1] + height * 1.5))
+        return cv2.putText(frame, text, position2, cv2.FONT_HERSHEY_SIMPLEX, fontScale, (0, 0, 255), 1)
+
+    return func
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 8])
+def test_text_writer(frames, batch_size):
+    data = pd.DataFrame({"trial": np.arange(5, 15) * 3}, index=np.arange(5, 15))  # only some frames
+    expected = per_frame(text_writer_per_frame(data, "trial", (5, 5), 0.5), frames, start=2)
+    result = in_blocks(utils.text_writer(data, "trial", (5, 5), 0.5), frames, batch_size, start=2)
+    np.testing.assert_array_equal(result, expected)
+    assert not np.array_equal(expected, frames)
+
+
+@pytest.mark.parametrize("func", [
+    lambda frame, count: np.roll(frame, count, axis=1),  # same shape, written back into the block
+    lambda frame, count: cv2.resize(frame, (32, 24)) + np.uint8(count),  # new shape
+])
+def test_as_batch_func(frames, func):
+    assert not utils.is_batch_func(func)
+    batched = utils.as_batch_func(func)
+    assert utils.is_batch_func(batched) and utils.as_batch_func(batched) is batched
+    np.testing.assert_array_equal(in_blocks(batched, frames, 8, start=3), per_frame(func, frames, start=3))
+
+
+def test_fused_preprocessing(frames):
+    table = preprocess.get_gamma_table(0.5)
+    probe = {"width": 64, "height": 48}
+    func = preprocess.compose([preprocess.resolution(probe), preprocess.lut_func(table)])
+
+    expected = per_frame(lambda frame, count: cv2.LUT(cv2.resize(frame, (640, 480), interpolation=cv2.INTER_CUBIC),
+                                                      table), frames)
+    np.testing.assert_array_equal(in_blocks(func, frames, 8), expected)
+
+
+def test_map_batches_per_frame_and_batched(tmp_path, frames):
+    video = str(tmp_path / "video.mp4")
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+    def func(frame, count):
+        return cv2.LUT(frame, preprocess.get_gamma_table(0.5)) // (1 + count % 3)
+
+    expected = np.concatenate([block.copy() for _, block in utils.map_batches(func, video, batch_size=1)])
+    for n_workers in (0, 2):
+        result = np.concatenate([block.copy() for _, block in
+                                 utils.map_batches(utils.as_batch_func(func), video, batch_size=8, n_workers=n_workers)])
+        np.testing.assert_array_equal(result, expected)
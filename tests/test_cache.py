@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from touchscreen_toolbox import utils
+
+
+def pose():
+    return utils.PoseArray(np.arange(24, dtype="float32").reshape(4, 2, 3), ("snout", "tail1"), offset=10, fps=25)
+
+
+def features(data):
+    columns = pd.MultiIndex.from_tuples([("coordinate", "snout_x"), ("task", "trial"), ("task", "session_type")])
+    return pd.DataFrame({columns[0]: data.values[:, 0, 0],
+                         columns[1]: np.arange(len(data), dtype="int16"),
+                         columns[2]: pd.Categorical(["8-3"] * len(data))}, index=data.index)
+
+
+def stages(calls):
+    def stage(name, func):
+        return name, lambda value: calls.append(name) or func(value), {}, ("touchscreen_toolbox.utils.cache",)
+    return [stage("pose", lambda _: pose()), stage("engineering", features)]
+
+
+def test_stage_outputs_round_trip(tmp_path):
+    calls = []
+    expected = utils.run_stages(stages(calls), "key", tmp_path, "video")
+    assert calls == ["pose", "engineering"]
+
+    cached = utils.run_stages(stages(calls), "key", tmp_path, "video")
+    assert calls == ["pose", "engineering"]
+    pd.testing.assert_frame_equal(cached, expected)
+
+    data = utils.load_npz(next(tmp_path.glob("video.pose.*.npz")))
+    assert data.keypoints == ("snout", "tail1") and data.offset == 10
+    np.testing.assert_array_equal(data.values, pose().values)
+
+
+def test_stale_outputs_are_replaced(tmp_path):
+    calls = []
+    utils.run_stages(stages(calls), "key", tmp_path, "video")
+    utils.run_stages(stages(calls), "changed", tmp_path, "video")
+    assert calls == ["pose", "engineering"] * 2
+    assert sorted(name.split(".")[1] for name in os.listdir(tmp_path)) == ["engineering", "pose"]
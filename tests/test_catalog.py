@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from touchscreen_toolbox import catalog
+
+
+def write_video(path, n_frames=10):
+    video = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for i in range(n_frames):
+        video.write(np.full((48, 64, 3), i, np.uint8))
+    video.release()
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # log files
+    root = tmp_path / "project"
+    (root / "day1").mkdir(parents=True)
+    write_video(root / "day1" / "1 - C1 - 01-02-03 10-00.mp4")
+    return root
+
+
+def paths(rows):
+    return [os.path.relpath(row["path"], row["path"][:row["path"].index("project")]) for row in rows]
+
+
+def test_new_videos_are_cataloged(root):
+    assert paths(catalog.videos(root)) == ["project/day1/1 - C1 - 01-02-03 10-00.mp4"]
+
+    # recorded after the catalog was built
+    (root / "day2").mkdir()
+    shutil.copy(root / "day1" / "1 - C1 - 01-02-03 10-00.mp4", root / "day2" / "1 - C1 - 01-02-04 10-00.mp4")
+    shutil.copy(root / "day1" / "1 - C1 - 01-02-03 10-00.mp4", root / "day1" / "2 - C2 - 01-02-03 10-00.mp4")
+    assert paths(catalog.videos(root)) == ["project/day1/1 - C1 - 01-02-03 10-00.mp4",
+                                           "project/day1/2 - C2 - 01-02-03 10-00.mp4",
+                                           "project/day2/1 - C1 - 01-02-04 10-00.mp4"]
+
+    shutil.rmtree(root / "day2")
+    os.remove(root / "day1" / "2 - C2 - 01-02-03 10-00.mp4")
+    assert paths(catalog.videos(root)) == ["project/day1/1 - C1 - 01-02-03 10-00.mp4"]
+
+
+def test_unchanged_folders_are_not_listed(root, monkeypatch):
+    catalog.videos(root)
+    assert catalog.scan(root) == 0
+
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(path) or scandir(path))
+    catalog.videos(root)
+    assert str(root / "day1") not in listed
+
+
+def test_rescan_finds_videos_rewritten_in_place(root):
+    video = root / "day1" / "1 - C1 - 01-02-03 10-00.mp4"
+    catalog.videos(root)
+    catalog.videos(root)  # settled after the probe cache was written
+
+    mtime = os.stat(root / "day1").st_mtime_ns
+    write_video(video, n_frames=20)
+    os.utime(root / "day1", ns=(mtime, mtime))  # e.g. coarse directory mtimes
+    assert catalog.videos(root)[0]["frame_count"] == 10
+    assert catalog.videos(root, rescan=True)[0]["frame_count"] == 20
+
+
+def test_unreadable_videos_are_cataloged_once_readable(root):
+    video = root / "day1" / "2 - C2 - 01-02-03 10-00.mp4"
+    video.write_bytes(b"\0" * 1024)  # e.g. still being copied
+    assert paths(catalog.videos(root)) == ["project/day1/1 - C1 - 01-02-03 10-00.mp4"]
+
+    mtime = os.stat(root / "day1").st_mtime_ns
+    shutil.copy(root / "day1" / "1 - C1 - 01-02-03 10-00.mp4", video)
+    os.utime(root / "day1", ns=(mtime, mtime))
+    assert len(catalog.videos(root)) == 2
+
+
+def test_list_infos_finds_new_videos(root):
+    from touchscreen_toolbox.postprocess.statistics import list_infos
+
+    catalog.videos(root)
+    shutil.copy(root / "day1" / "1 - C1 - 01-02-03 10-00.mp4", root / "day1" / "2 - C2 - 01-02-03 10-00.mp4")
+    assert sorted(info["vid_name"] for info in list_infos(root / "day1")) == ["1 - C1 - 01-02-03 10-00",
+                                                                              "2 - C2 - 01-02-03 10-00"]
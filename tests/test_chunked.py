@@ -0,0 +1,90 @@
+import os
+
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox import postprocess, utils, video_info
+from touchscreen_toolbox.pose_estimation import SyntheticBackend, pose_to_dataframe, read_pose
+
+N_FRAMES = 3000
+OFFSET = 20  # 1st pose estimated frame
+FRAMES = (50, 2980)
+SHORT = (1000, 1148)  # across the start of the snout gap, ends with a 1 row chunk of 7
+
+
+def write_timestamps(path, n_trials=30, seed=0):
+    """Session of <n_trials> trials of 7 states, some states at the same time"""
+    rng = np.random.default_rng(seed)
+    states, t = [], 2.0
+    for _ in range(n_trials):
+        for state in (1, 3, 6, 7, 8, 9, 10):
+            states.append((state, t))
+            t += 0.001 if rng.random() < 0.05 else rng.uniform(0.02, 0.6)
+    left = rng.integers(0, 2, n_trials)
+    p_left = np.where(np.arange(n_trials) < n_trials // 2, 0.8, 0.3)
+    trials = np.stack([np.arange(1, n_trials + 1), 1 + (np.arange(n_trials) >= n_trials // 2), p_left, 1 - p_left,
+                       left, 1 - left, rng.integers(0, 2, n_trials), np.r_[0, left[:-1]]]).astype(float)
+
+    with h5py.File(path, "w") as f:
+        mouse = f.create_group("1")
+        mouse.attrs.update({"knockout": [1], "male": [0]})
+        session = mouse.create_group("010203")
+        session.attrs.update({"task_start": [2.0], "fs": [100.0], "DA_start": [1.0]})
+        session.create_dataset("states", data=np.transpose(states)).attrs["headers"] = ["state", "time"]
+        session.create_dataset("trials", data=trials).attrs["headers"] = [
+            "trial", "block", "P_left", "P_right", "left_response", "right_response", "reward", "prev_response"]
+        session.create_dataset("trace", data=rng.normal(size=int(100 * (t + 10))))
+
+
+@pytest.fixture(scope="module")
+def session(tmp_path_factory):
+    root = tmp_path_factory.mktemp("chunked")
+    os.mkdir(root / cfg.RST_FOLDER)
+    timestamps = str(root / "timestamps.h5")
+    write_timestamps(timestamps)
+
+    poses = SyntheticBackend(dropout=0.1).generate(np.arange(OFFSET, OFFSET + N_FRAMES), 640, 480)
+    poses[990:2100, 0, 2] = 0.01  # gap across chunks
+    poses[:40, 1, 2] = 0  # leading gap
+    poses[-30:, 2, 2] = 0  # trailing gap
+    poses[:, 7, 2] = 0  # never valid
+    pose_to_dataframe(poses).to_hdf(root / "pose.h5", key="df_with_missing", format="table", mode="w")
+
+    vid_info = {"dir": str(root), "dlc_result": "pose.h5", "frames": FRAMES, "frame_offset": OFFSET,
+                "fps": 25, "mouse_id": "1", "exp_date": "010203"}
+    return vid_info, timestamps
+
+
+def whole(vid_info, timestamps, csv):
+    data = utils.PoseArray.from_dataframe(read_pose(vid_info), fps=vid_info["fps"])
+    data = postprocess.engineering(postprocess.standardize_data(postprocess.refine_data(data)))
+    video_info.save_data(vid_info, postprocess.merge(vid_info, data, timestamps), csv=csv)
+
+
+def read_result(vid_info, csv):
+    path = os.path.join(vid_info["dir"], vid_info["post_result"])
+    if csv:
+        with open(path) as f:
+            return f.read()
+    return pd.read_hdf(path, key=vid_info["mouse_id"] + "-" + vid_info["exp_date"])
+
+
+# chunks dividing / not dividing the window, and close to the refine & feature margins
+@pytest.mark.parametrize("chunk_size, frames", [(1000, FRAMES), (997, FRAMES), (7, SHORT)])
+@pytest.mark.parametrize("csv", [True, False])
+def test_chunked_same_as_whole(session, chunk_size, frames, csv):
+    vid_info, timestamps = session
+    vid_info = dict(vid_info, frames=frames)
+    expected = dict(vid_info, vid_name=f"whole_{chunk_size}_{csv}")
+    whole(expected, timestamps, csv)
+
+    chunked = dict(vid_info, vid_name=f"chunked_{chunk_size}_{csv}")
+    postprocess.process_chunked(chunked, timestamps, chunk_size=chunk_size, csv=csv)
+
+    if csv:
+        assert read_result(chunked, csv) == read_result(expected, csv)
+    else:
+        pd.testing.assert_frame_equal(read_result(chunked, csv), read_result(expected, csv))
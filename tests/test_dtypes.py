@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from touchscreen_toolbox.utils import compact_dtypes
+
+SCHEMA = {"coordinate": "float32", "trial": ("int16", 0), "reward": ("int8", -1)}
+
+
+def session(n_trials):
+    trial = np.r_[np.nan, np.arange(1, n_trials + 1)]
+    return pd.DataFrame({("coordinate", "snout_x"): np.linspace(0, 1, n_trials + 1),
+                         ("task", "trial"): trial,
+                         ("task", "reward"): trial % 2,
+                         ("task", "count"): np.arange(n_trials + 1)})
+
+
+def test_schema_dtypes_do_not_depend_on_values():
+    short, long = compact_dtypes(session(10), SCHEMA), compact_dtypes(session(1000), SCHEMA)
+    expected = {("coordinate", "snout_x"): np.float32, ("task", "trial"): np.int16, ("task", "reward"): np.int8}
+    for col, dtype in expected.items():
+        assert short[col].dtype == long[col].dtype == dtype
+
+
+def test_nan_replaced_by_sentinel():
+    data = compact_dtypes(session(10), SCHEMA)
+    assert data[("task", "trial")].tolist()[:2] == [0, 1]
+    assert data[("task", "reward")].tolist()[:2] == [-1, 1]
+
+
+def test_other_columns_are_inferred():
+    assert compact_dtypes(session(10), SCHEMA)[("task", "count")].dtype == np.int8
+    assert compact_dtypes(session(1000), SCHEMA)[("task", "count")].dtype == np.int16
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox import utils
+from touchscreen_toolbox.postprocess import engineering
+
+KEYPOINTS = cfg.MICE + cfg.REFE
+REFERENCE = os.path.join(os.path.dirname(__file__), "data", "engineering.csv")  # from the original engineering
+
+
+def coordinates():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(np.round(rng.uniform(-100, 100, (12, 2 * len(KEYPOINTS))), 2),
+                        columns=[f"{k}_{c}" for k in KEYPOINTS for c in "xy"])
+
+
+def test_engineering_matches_reference():
+    expected = pd.read_csv(REFERENCE, header=[0, 1], index_col=0)
+    data = coordinates()
+    for result in (engineering(data), engineering(utils.PoseArray.from_dataframe(data))):
+        assert list(result.columns) == list(expected.columns)
+        np.testing.assert_allclose(result.to_numpy(dtype=float), expected.to_numpy(dtype=float),
+                                   atol=10 ** -cfg.DECIMALS)
+
+
+def test_distances_and_angles_of_single_points():
+    assert utils.dist1((3, 4)) == 5
+    assert utils.dist2(np.array([1, 1]), np.array([4, 5])) == 5
+    assert utils.dist1(np.array([[3, 4], [3, 4]])) == pytest.approx(np.sqrt(50))  # norm of the whole array
+
+    np.testing.assert_array_equal(utils.batch_dist2([[0, 0], [1, 1]], [[3, 4], [1, 1]]), [5, 0])
+
+    assert utils.convert_angles(-np.pi / 2, radians=False) == 270
+    assert utils.angle1(np.array([0, -1])) == 270
+    angles = np.array([-1, 1])  # integers, converted in a copy
+    np.testing.assert_allclose(utils.convert_angles(angles, radians=True), [2 * np.pi - 1, 1])
+    np.testing.assert_array_equal(angles, [-1, 1])
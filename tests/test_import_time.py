@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+HEAVY = ("deeplabcut", "cv2", "h5py", "scipy.signal", "moviepy", "joblib", "tables", "tensorflow")
+BUDGET = 2.0  # (sec) cumulative, generous for slow CI machines, ~0.5 s locally
+
+
+def import_times() -> dict:
+    """Cumulative import time (sec) of each module imported by `import touchscreen_toolbox`"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import touchscreen_toolbox"],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_heavy_dependencies_are_not_imported():
+    imported = [name for name in import_times() if any(name == h or name.startswith(h + ".") for h in HEAVY)]
+    assert not imported
+
+
+def test_import_time_budget():
+    assert import_times()["touchscreen_toolbox"] < BUDGET
+
+
+def test_utils_exports_no_imported_modules():
+    from touchscreen_toolbox import utils
+    assert not [name for name in ("sys", "importlib", "hashlib", "tempfile", "h5py") if hasattr(utils, name)]
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from touchscreen_toolbox import utils
+
+N_FRAMES = 30
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "video.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for i in range(N_FRAMES):
+        writer.write(np.full((48, 64, 3), 8 * i, np.uint8))
+    writer.release()
+    return path
+
+
+@utils.batch_func
+def summarize(block, frames):
+    """(frame number, mean) of each frame, later blocks finish first"""
+    time.sleep(0.02 / (1 + frames[0]))
+    return np.stack([np.arange(*frames), block.mean(axis=(1, 2, 3))], axis=1)
+
+
+def collect(blocks):
+    return [(start, result.copy()) for start, result in blocks]
+
+
+def assert_same(blocks, expected):
+    assert [start for start, _ in blocks] == [start for start, _ in expected]
+    for (_, result), (_, reference) in zip(blocks, expected):
+        np.testing.assert_array_equal(result, reference)
+
+
+@pytest.mark.parametrize("window", [None, (5, 17), (25, 100)])
+def test_threaded_same_as_serial(video, window):
+    expected = collect(utils.map_batches(summarize, video, batch_size=3, window=window))
+    blocks = collect(utils.map_batches(summarize, video, batch_size=3, n_workers=4, queue_size=2, window=window))
+    assert_same(blocks, expected)
+
+    start, stop = window or (0, N_FRAMES)
+    frames = np.concatenate([result[:, 0] for _, result in blocks])
+    np.testing.assert_array_equal(frames, np.arange(start, min(stop, N_FRAMES)))
+    assert [s for s, _ in blocks] == list(range(start, min(stop, N_FRAMES), 3))
+
+
+def test_early_close_stops_threads(video):
+    threads = threading.active_count()
+    blocks = utils.map_batches(summarize, video, batch_size=2, n_workers=2, queue_size=1)
+    start, _ = next(blocks)
+    assert start == 0
+    blocks.close()
+    assert threading.active_count() == threads
+
+
+def test_exception_is_raised_in_order(video):
+    @utils.batch_func
+    def fail(block, frames):
+        if frames[0] >= 9:
+            raise ValueError(f"failed at {frames[0]}")
+        return summarize(block, frames)
+
+    threads = threading.active_count()
+    blocks = utils.map_batches(fail, video, batch_size=3, n_workers=4)
+    assert [start for _, (start, _) in zip(range(3), blocks)] == [0, 3, 6]
+    with pytest.raises(ValueError, match="failed at 9"):
+        next(blocks)
+    assert threading.active_count() == threads
@@ -0,0 +1,66 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox import utils, video_info
+from touchscreen_toolbox.pose_estimation import preprocess
+
+
+def write_video(path, n_frames=10, value=10):
+    video = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for _ in range(n_frames):
+        video.write(np.full((48, 64, 3), value, np.uint8))
+    video.release()
+
+
+@pytest.fixture
+def vid_info(tmp_path):
+    path = tmp_path / "1 - C1 - 01-02-03 10-00.mp4"
+    write_video(path)  # small & dark
+    return video_info.get_vid_info(str(path))
+
+
+def test_transforms_are_fused_into_one_video(vid_info):
+    preprocess.preprocess_video(vid_info)
+
+    assert vid_info["prep"] == ["r", "b"]
+    assert vid_info["target_path"] == vid_info["path"][:-len(".mp4")] + "_r_b.mp4"
+    videos = [name for name in os.listdir(vid_info["dir"]) if name.endswith(".mp4")]
+    assert sorted(videos) == sorted([vid_info["file_name"], os.path.basename(vid_info["target_path"])])
+    assert preprocess.is_preprocess(vid_info["target_path"])
+
+    probe = utils.probe_video(vid_info["target_path"])
+    assert (probe["width"], probe["height"]) == (cfg.RESOLUTION["width"], cfg.RESOLUTION["height"])
+    assert probe["frame_count"] == 10
+    assert probe["brightness"] > utils.probe_video(vid_info["path"])["brightness"]
+
+
+def test_cut_alone_is_not_encoded(tmp_path):
+    path = tmp_path / "1 - C1 - 01-02-03 10-00.mp4"
+    width, height = cfg.RESOLUTION["width"], cfg.RESOLUTION["height"]
+    video = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, (width, height))
+    for _ in range(10):
+        video.write(np.full((height, width, 3), 100, np.uint8))  # bright, at the configured resolution
+    video.release()
+
+    vid_info = video_info.get_vid_info(str(path))
+    vid_info["pose_window"] = (3, 8)
+    preprocess.preprocess_video(vid_info)
+
+    assert vid_info["prep"] == []
+    assert vid_info["target_path"] == vid_info["path"]
+    assert vid_info["frame_offset"] == 0
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".mp4")] == [path.name]
+
+
+def test_cut_with_other_transforms(vid_info):
+    vid_info["pose_window"] = (3, 8)
+    preprocess.preprocess_video(vid_info)
+
+    assert vid_info["prep"] == ["c", "r", "b"]
+    assert vid_info["target_path"].endswith("_c_r_b.mp4")
+    assert vid_info["frame_offset"] == 3
+    assert utils.probe_video(vid_info["target_path"])["frame_count"] == 5
@@ -0,0 +1,45 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from touchscreen_toolbox import utils
+from touchscreen_toolbox.pose_estimation import preprocess
+
+
+def write_video(path, n_frames=10, value=100):
+    video = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for _ in range(n_frames):
+        video.write(np.full((48, 64, 3), value, np.uint8))
+    video.release()
+
+
+def test_probes_are_cached_per_video(tmp_path):
+    videos = [tmp_path / f"{i}.mp4" for i in range(3)]
+    for n_frames, video in enumerate(videos, 5):
+        write_video(video, n_frames)
+        utils.probe_video(video)
+
+    for n_frames, video in enumerate(videos, 5):
+        with open(tmp_path / f".{video.name}.probe.json") as f:
+            assert json.load(f)["frame_count"] == n_frames
+
+
+def test_unreadable_video_raises(tmp_path):
+    video = tmp_path / "broken.mp4"
+    video.write_bytes(b"\0" * 1024)
+
+    for _ in range(2):  # not cached
+        with pytest.raises(ValueError, match="Unreadable video"):
+            utils.probe_video(video)
+    assert not (tmp_path / ".broken.mp4.probe.json").exists()
+    with pytest.raises(ValueError, match="Unreadable video"):
+        preprocess.brightness_check(str(video))
+
+
+def test_dark_video_is_brightened(tmp_path):
+    write_video(tmp_path / "dark.mp4", value=10)
+    write_video(tmp_path / "bright.mp4", value=200)
+    assert preprocess.brightness_check(str(tmp_path / "dark.mp4"))
+    assert not preprocess.brightness_check(str(tmp_path / "bright.mp4"))
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox.pose_estimation import dlc
+
+KEYPOINTS = cfg.MICE + cfg.REFE
+
+
+@pytest.fixture
+def result():
+    columns = pd.MultiIndex.from_product([["scorer"], KEYPOINTS, ["x", "y", "likelihood"]])
+    return pd.DataFrame(np.random.default_rng(0).random((100, len(columns))), columns=columns)
+
+
+@pytest.mark.parametrize("format", ["table", "fixed"])
+def test_reads_keypoints_in_frame_window(tmp_path, result, format):
+    path = str(tmp_path / "result.h5")
+    result.to_hdf(path, key="df_with_missing", format=format, mode="w")
+
+    data = dlc.read_pose(path, frames=(30, 60), offset=10, keypoints=("snout", "tail1"))
+    assert data.index[0] == 31 and data.index[-1] == 60
+    assert list(data.columns) == ["snout_x", "snout_y", "snout_cfd", "tail1_x", "tail1_y", "tail1_cfd"]
+    expected = result.loc[21:50, (slice(None), ["snout", "tail1"])].to_numpy(dtype=cfg.POSE_DTYPE)
+    np.testing.assert_array_equal(data.to_numpy(), expected)
+
+
+def test_h5_and_csv_agree(tmp_path, result):
+    result.to_hdf(tmp_path / "result.h5", key="df_with_missing", format="table", mode="w")
+    result.to_csv(tmp_path / "result.csv")
+    pd.testing.assert_frame_equal(dlc.read_pose(str(tmp_path / "result.h5"), frames=(0, 50)),
+                                  dlc.read_pose(str(tmp_path / "result.csv"), frames=(0, 50)))
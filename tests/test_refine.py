@@ -0,0 +1,22 @@
+import numpy as np
+
+from touchscreen_toolbox.postprocess.refine import savgol_array
+
+
+def test_savgol_propagates_nan_to_windows():
+    values = np.tile(np.arange(20, dtype=float)[:, None], (1, 3))
+    values[1, 0] = np.nan  # in the edge fit
+    values[10, 1] = np.nan
+
+    smoothed = savgol_array(values)
+    np.testing.assert_array_equal(np.flatnonzero(np.isnan(smoothed[:, 0])), [0, 1, 2, 3])
+    np.testing.assert_array_equal(np.flatnonzero(np.isnan(smoothed[:, 1])), [8, 9, 10, 11, 12])
+    np.testing.assert_allclose(smoothed[:, 2], values[:, 2], atol=1e-9)  # linear, unchanged
+    np.testing.assert_allclose(smoothed[4:, 0], values[4:, 0], atol=1e-9)
+
+
+def test_savgol_all_nan_column():
+    values = np.ones((10, 2))
+    values[:, 1] = np.nan
+    smoothed = savgol_array(values)
+    assert np.isnan(smoothed[:, 1]).all() and not np.isnan(smoothed[:, 0]).any()
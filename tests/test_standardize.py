@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox.postprocess import fill_gaps, fillna, standardize_array, transform_points
+
+KEYPOINTS = cfg.MICE + cfg.REFE
+nan = np.nan
+
+
+def column(*values):
+    return np.array(values, dtype=float)[:, None]
+
+
+def test_fill_gaps_steps_between_neighbours_and_fills_edges():
+    values = np.hstack([column(nan, 1, nan, nan, 4, nan), column(nan, nan, nan, nan, nan, nan)])
+    fill_gaps(values)
+    np.testing.assert_array_equal(values[:, 0], [1, 1, 2.5, 4, 4, 4])  # bfill, 1 + k * 3 / 2, ffill
+    assert np.isnan(values[:, 1]).all()
+
+
+def test_fill_gaps_leaves_long_gaps():
+    values = column(nan, nan, nan, 0, nan, 2, nan, nan, nan, 6, nan)
+    fill_gaps(values, max_gap=1)
+    np.testing.assert_array_equal(values[:, 0], [nan, nan, nan, 0, 2, 2, nan, nan, nan, 6, 6])
+
+
+def test_fill_gaps_in_chunks_same_as_whole():
+    values = np.random.default_rng(0).random((50, 3))
+    values[np.random.default_rng(1).random(values.shape) < 0.4] = nan
+    values[:5, 0] = values[-5:, 1] = nan
+    expected = fill_gaps(values.copy())
+
+    chunks = np.split(values.copy(), [20])
+    valid = ~np.isnan(values)
+    last = [np.max(np.nonzero(valid[:20, c])[0], initial=-1) for c in range(3)]
+    first = [np.min(np.nonzero(valid[20:, c])[0], initial=30) for c in range(3)]
+    before = (np.array(last) - 20, np.array([values[r, c] if r >= 0 else nan for c, r in enumerate(last)]))
+    after = (np.array(first) + 20, np.array([values[20 + r, c] if r < 30 else nan for c, r in enumerate(first)]))
+    fill_gaps(chunks[0], after=after)
+    fill_gaps(chunks[1], before=before)
+    np.testing.assert_allclose(np.concatenate(chunks), expected)
+
+
+def test_fillna_keeps_frame():
+    data = pd.DataFrame({"a": [1, nan, 3]}, index=[5, 6, 7])
+    pd.testing.assert_frame_equal(fillna(data), pd.DataFrame({"a": [1.0, 3, 3]}, index=[5, 6, 7]))
+
+
+@pytest.mark.parametrize("m_screen", [(100, 100), (400, 400)])  # above the food port / rotated 90 degrees
+def test_transform_to_task_coordinates(m_screen):
+    points = np.random.default_rng(0).uniform(0, 480, (20, len(KEYPOINTS), 2))
+    refe = [KEYPOINTS.index(k) for k in cfg.REFE]
+    points[:, KEYPOINTS.index("food_port")] = (100, 400)
+    points[:, KEYPOINTS.index("m_screen")] = m_screen
+    points[3, refe] = 0  # outlier, references are fixed at their medians
+    raw = points.copy()
+
+    transform_points(points)
+    np.testing.assert_allclose(points[:, KEYPOINTS.index("food_port")], 0, atol=1e-9)
+    np.testing.assert_allclose(points[:, KEYPOINTS.index("m_screen")], np.tile([0, cfg.TRAY_WIDTH], (20, 1)), atol=1e-9)
+    assert np.ptp(points[:, refe], axis=0).max() < 1e-9
+
+    # rigid transformation scaled from pixels
+    scale = cfg.TRAY_WIDTH / 300
+    snout, tail = KEYPOINTS.index("snout"), KEYPOINTS.index("tail1")
+    np.testing.assert_allclose(np.linalg.norm(points[:, snout] - points[:, tail], axis=1),
+                               scale * np.linalg.norm(raw[:, snout] - raw[:, tail], axis=1))
+    # y is flipped, so mid screen above the food port gives the same orientation as the video
+    if m_screen == (100, 100):
+        np.testing.assert_allclose(points[:, snout], scale * (raw[:, snout] - (100, 400)) * (1, -1))
+
+
+def test_standardize_array_fills_and_rounds():
+    points = np.random.default_rng(0).uniform(0, 480, (10, len(KEYPOINTS), 2))
+    points[:, KEYPOINTS.index("food_port")] = (100, 400)
+    points[:, KEYPOINTS.index("m_screen")] = (100, 100)
+    points[4:6, KEYPOINTS.index("snout")] = nan
+
+    standardize_array(points)
+    assert not np.isnan(points).any()
+    np.testing.assert_array_equal(points, np.round(points, cfg.DECIMALS))
@@ -0,0 +1,81 @@
+import os
+
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox import utils, video_info
+from touchscreen_toolbox.pose_estimation import stream_analyze, read_pose
+
+KEYPOINTS = cfg.MICE + cfg.REFE
+N_FRAMES = 30
+
+
+def shade(frame):
+    return 100 + 4 * frame  # bright (no brightness step) & distinct per frame
+
+
+@pytest.fixture
+def vid_info(tmp_path):
+    path = str(tmp_path / "1 - C1 - 01-02-03 10-00.mp4")
+    width, height = cfg.RESOLUTION["width"], cfg.RESOLUTION["height"]  # no resolution step
+    video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (width, height))
+    for i in range(N_FRAMES):
+        video.write(np.full((height, width, 3), shade(i), np.uint8))
+    video.release()
+
+    vid_info = video_info.get_vid_info(path)
+    utils.initialize_folders(vid_info)
+    return vid_info
+
+
+def decoded_shades(path):
+    cap = cv2.VideoCapture(path)
+    shades = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        shades.append(frame.mean())
+    cap.release()
+    return np.array(shades)
+
+
+def estimator(block, frames):
+    """x: shade of the decoded frame, y: frame number it was given as"""
+    poses = np.ones((len(block), len(KEYPOINTS), 3))
+    poses[:, :, 0] = block.mean(axis=(1, 2, 3))[:, None]
+    poses[:, :, 1] = np.arange(*frames)[:, None]
+    return poses
+
+
+@pytest.mark.parametrize("window", [None, (5, 20)])
+def test_stream_analyze_aligns_frames(vid_info, window):
+    if window:
+        vid_info["pose_window"] = window
+    stream_analyze(vid_info, estimator)
+
+    start, stop = window or (0, N_FRAMES)
+    assert vid_info["prep"] == (["c"] if window else [])
+    assert vid_info["frame_offset"] == start
+    assert vid_info["files"] == [os.path.join(cfg.DLC_FOLDER, vid_info["vid_name"] + "DLC_stream" + ext)
+                                 for ext in (".h5", ".csv")]
+
+    saved = pd.read_hdf(os.path.join(vid_info["dir"], vid_info["dlc_result"]))
+    assert len(saved) == stop - start
+    frames = np.arange(start, stop)
+    np.testing.assert_array_equal(saved.xs("y", axis=1, level="coords").to_numpy(),
+                                  np.repeat(frames[:, None], len(KEYPOINTS), 1))
+    np.testing.assert_allclose(saved.xs("x", axis=1, level="coords").to_numpy(),
+                               np.repeat(decoded_shades(vid_info["path"])[frames, None], len(KEYPOINTS), 1))
+
+    # read back in video frame numbers, the 1st row is dropped
+    vid_info["frames"] = (start, stop - 1)
+    data = read_pose(vid_info)
+    assert list(data.index) == list(range(start + 1, stop))
+    np.testing.assert_array_equal(data["snout_y"], data.index)
+
+    csv = os.path.join(vid_info["dir"], vid_info["files"][1])
+    pd.testing.assert_frame_equal(read_pose(csv, vid_info["frames"], start), data)
@@ -0,0 +1,126 @@
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+from touchscreen_toolbox.postprocess import timestamp
+
+nan = np.nan
+
+
+def states(frames, values):
+    return pd.DataFrame({"state": values}, index=pd.Index(frames, name="frame"))
+
+
+def test_count_trials():
+    data = states([0, 1, 2, 3, 4], [nan, 1, 3, 1, nan])
+    np.testing.assert_array_equal(timestamp.count_trials(data)["trial"], [nan, 1, 1, 2, 2])
+
+
+def test_count_trials_after_previous_chunks():
+    data = states([10, 11, 12], [3, 1, nan])
+    np.testing.assert_array_equal(timestamp.count_trials(data, started=4)["trial"], [4, 5, 5])
+
+
+def test_count_trials_with_several_states_in_a_frame():
+    # frame 2 has 2 states, the 2nd starting a trial; both rows get the new trial
+    data = states([0, 1, 2, 2, 3, 4], [nan, 1, 3, 1, nan, 1])
+    np.testing.assert_array_equal(timestamp.count_trials(data)["trial"], [nan, 1, 2, 2, 2, 3])
+
+
+def test_consecutive_reward():
+    data = timestamp.consecutive_reward(pd.DataFrame({"reward": [1, 1, 0, 0, 0, 1, 0, 1, 1]}))
+    np.testing.assert_array_equal(data["cons_reward"], [1, 2, -1, -2, -3, 1, -1, 1, 2])
+    np.testing.assert_array_equal(data["unexpectation"], [0, 0, -2, 0, 0, 3, -1, 1, 0])
+
+
+def test_reward_streak_continues_across_blocks():
+    trials = pd.DataFrame({
+        "trial": [1, 2, 3, 4, 5, 6], "block": [1, 1, 1, 2, 2, 2],
+        "P_left": [.8, .8, .8, .3, .3, .3], "P_right": [.2, .2, .2, .7, .7, .7],
+        "left_response": [1, 1, 1, 0, 0, 1], "right_response": [0, 0, 0, 1, 1, 0],
+        "reward": [0, 1, 1, 1, 1, 0], "prev_response": [0, 1, 1, 1, 0, 0],
+    })
+    data = timestamp.process_trials(trials)
+    np.testing.assert_array_equal(data["cons_reward"], [-1, 1, 2, 3, 4, -1])
+    np.testing.assert_array_equal(data["unexpectation"], [0, 1, 0, 0, 0, -4])
+    np.testing.assert_array_equal(data["trial_2nd"], [-3, -2, -1, 4, 5, 6])
+
+
+def increment_duplicates_loop(values):
+    """Reference, each value not above the (incremented) previous one is incremented by 1"""
+    values = list(values)
+    for i in range(1, len(values)):
+        if values[i] <= values[i - 1]:
+            values[i] += 1
+    return values
+
+
+def test_increment_duplicates():
+    df = pd.DataFrame({"frame": [3, 3, 4, 4, 4, 7, 7, 8, 2]})
+    timestamp.increment_duplicates(df, "frame")
+    np.testing.assert_array_equal(df["frame"], [3, 4, 5, 5, 5, 7, 8, 9, 3])
+
+    values = np.sort(np.random.default_rng(0).integers(0, 40, 100))
+    df = pd.DataFrame({"frame": values})
+    timestamp.increment_duplicates(df, "frame")
+    np.testing.assert_array_equal(df["frame"], increment_duplicates_loop(values))
+
+
+def test_reward_streak_is_joined_at_trial_starts():
+    trial_headers = ["trial", "block", "P_left", "P_right", "left_response", "right_response", "reward",
+                     "prev_response"]
+    session = {
+        "mouse_attrs": {"knockout": [1]},
+        "states": np.array([[1, 0.5], [3, 0.7], [1, 1.0], [1, 1.5]]), "state_headers": ["state", "time"],
+        "trials": np.array([[1, 1, .8, .2, 1, 0, 1, 0], [2, 1, .8, .2, 1, 0, 1, 1], [3, 1, .8, .2, 1, 0, 0, 1]]),
+        "trial_headers": trial_headers,
+    }
+    trace = pd.DataFrame({"DA": np.arange(20.0)}, index=pd.Index(np.arange(20), name="frame"))
+    data = timestamp.align_task(np.arange(20), session, trace, fps=10)
+
+    np.testing.assert_array_equal(data["trial"], np.repeat([nan, 1, 2, 3], 5))
+    np.testing.assert_array_equal(data["cons_reward"], np.repeat([nan, 1, 2, -1], 5))
+    np.testing.assert_array_equal(data["unexpectation"], np.repeat([nan, 0, 0, -2], 5))
+    np.testing.assert_array_equal(data["DA"], np.arange(20))
+
+
+FS, START_CUT, FPS = 100.0, 0.013, 25.0
+
+
+def groupby_reference(trace, how, offset=0):
+    frames = ((np.arange(offset, offset + len(trace)) / FS + START_CUT) * FPS).round().astype(int)
+    return pd.DataFrame(trace.reshape(len(trace), -1)).groupby(frames).agg(how)
+
+
+@pytest.mark.parametrize("how", ["first", "mean", "min", "max"])
+@pytest.mark.parametrize("channels", [(), (2,)])
+def test_resample_trace_matches_groupby(how, channels):
+    trace = np.random.default_rng(0).normal(size=(1003, *channels))
+    data = timestamp.resample_trace(trace, FS, START_CUT, FPS, how=how)
+
+    expected = groupby_reference(trace, how)
+    assert list(data.columns) == (["DA"] if not channels else ["DA_0", "DA_1"])
+    np.testing.assert_array_equal(data.index, expected.index)
+    np.testing.assert_allclose(data.to_numpy(), expected.to_numpy())
+
+
+def test_resample_trace_rejects_unknown_reduction():
+    with pytest.raises(ValueError):
+        timestamp.resample_trace(np.zeros(10), FS, START_CUT, FPS, how="median")
+
+
+@pytest.mark.parametrize("frames", [(0, 10), (37, 120), (200, 260)])
+def test_trace_window_read_from_h5(tmp_path, frames):
+    trace = np.random.default_rng(0).normal(size=(2, 1003))  # (channels, samples) as in the timestamps h5
+    with h5py.File(tmp_path / "ts.h5", "w") as f:
+        f["trace"] = trace
+
+    start, stop = timestamp.trace_window(frames, FS, START_CUT, FPS, trace.shape[-1])
+    with h5py.File(tmp_path / "ts.h5", "r") as f:
+        window = np.transpose(f["trace"][..., start:stop])
+    data = timestamp.resample_trace(window, FS, START_CUT, FPS, how="mean", offset=start)
+
+    expected = groupby_reference(trace.T, "mean").loc[frames[0]:frames[1]]
+    np.testing.assert_allclose(data.loc[frames[0]:frames[1]].to_numpy(), expected.to_numpy())
+    np.testing.assert_array_equal(data.loc[frames[0]:frames[1]].index, expected.index)
@@ -0,0 +1,45 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from touchscreen_toolbox import utils
+
+
+def write_timestamps(path, sessions):
+    with h5py.File(path, "w") as f:
+        for key, n_states in sessions.items():
+            group = f.require_group(key)
+            group.parent.attrs["knockout"] = [1]
+            group.attrs["task_start"] = [10.0]
+            states = np.stack([np.arange(n_states) % 10, 10.0 + np.arange(n_states)])
+            group.create_dataset("states", data=states).attrs["headers"] = ["state", "time"]
+            group.create_dataset("trace", data=np.zeros(100 * n_states))
+
+
+def test_session_is_read_from_the_index(tmp_path):
+    timestamps = tmp_path / "ts.h5"
+    write_timestamps(timestamps, {"1/010203": 5, "2/010203": 8})
+
+    session = utils.timestamp_session(timestamps, "2", "010203")
+    assert os.path.isfile(tmp_path / ".ts.h5.index.h5")
+    assert session["states"].shape == (8, 2)
+    assert list(session["state_headers"]) == ["state", "time"]
+    assert session["end"] == 17.0
+    assert session["trace_length"] == 800
+    assert session["mouse_attrs"]["knockout"][0] == 1
+    assert session["attrs"]["task_start"][0] == 10.0
+
+    with pytest.raises(KeyError):
+        utils.timestamp_session(timestamps, "3", "010203")
+
+
+def test_index_is_rebuilt_when_timestamps_change(tmp_path):
+    timestamps = tmp_path / "ts.h5"
+    write_timestamps(timestamps, {"1/010203": 5})
+    assert utils.timestamp_session(timestamps, "1", "010203")["end"] == 14.0
+
+    write_timestamps(timestamps, {"1/010203": 9})
+    os.utime(timestamps, ns=(0, 0))  # changed even on file systems with coarse mtimes
+    assert utils.timestamp_session(timestamps, "1", "010203")["end"] == 18.0
@@ -0,0 +1,180 @@
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from touchscreen_toolbox import core
+from touchscreen_toolbox.watch import Watcher
+from touchscreen_toolbox.pose_estimation import PoseBackend
+
+SETTLE = 30
+RETRY = 600
+
+
+def write_video(path, n_frames=10):
+    video = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for i in range(n_frames):
+        video.write(np.full((48, 64, 3), i, np.uint8))
+    video.release()
+
+
+def copy_in_chunks(src, dst, n_chunks=2):
+    """Copy <src> to <dst>, yielding after each chunk as a recorder / copy still in progress"""
+    data = open(src, "rb").read()
+    size = -(-len(data) // n_chunks)
+    with open(dst, "wb") as f:
+        for i in range(0, len(data), size):
+            f.write(data[i:i + size])
+            f.flush()
+            yield
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.mp4"
+    write_video(path)
+    return path
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # log files
+    root = tmp_path / "project"
+    root.mkdir()
+    return root
+
+
+def test_returns_video_after_settle_window(root, source):
+    watcher = Watcher(root, settle=SETTLE)
+    video = str(root / "1 - C1 - 01-02-03 10-00.mp4")
+
+    copying = copy_in_chunks(source, video)
+    next(copying)
+    assert watcher.poll(now=0) == []
+    next(copying, None)
+    assert watcher.poll(now=SETTLE) == []  # changed since last poll, settle window restarts
+    assert watcher.poll(now=2 * SETTLE - 1) == []
+    assert watcher.poll(now=2 * SETTLE) == [(video, False)]
+
+    watcher.finish(video, True, now=2 * SETTLE)
+    assert watcher.poll(now=10 * SETTLE) == []
+
+
+def test_changed_video_is_returned_as_changed(root, source):
+    watcher = Watcher(root, settle=SETTLE, recheck=1)
+    video = str(root / "1 - C1 - 01-02-03 10-00.mp4")
+    shutil.copy(source, video)
+
+    assert watcher.poll(now=0) == []
+    assert watcher.poll(now=SETTLE) == [(video, False)]
+    watcher.finish(video, True, now=SETTLE)
+
+    # rewritten in place, not changing the directory mtime
+    with open(video, "ab") as f:
+        f.write(b"\0" * 16)
+    assert watcher.poll(now=2 * SETTLE) == []
+    assert watcher.poll(now=3 * SETTLE) == [(video, True)]
+
+
+def test_failed_video_is_retried(root, source):
+    watcher = Watcher(root, settle=SETTLE, retry=RETRY)
+    video = str(root / "1 - C1 - 01-02-03 10-00.mp4")
+    shutil.copy(source, video)
+
+    watcher.poll(now=0)
+    assert watcher.poll(now=SETTLE) == [(video, False)]
+    watcher.finish(video, False, now=SETTLE)
+
+    assert watcher.poll(now=2 * SETTLE) == []
+    assert watcher.poll(now=SETTLE + RETRY) == [(video, False)]
+
+
+def test_skips_generated_folders_and_processed_videos(root, source):
+    (root / "DLC").mkdir()
+    shutil.copy(source, root / "DLC" / "1 - C1 - 01-02-03 10-00.mp4")
+    shutil.copy(source, root / "1 - C1 - 01-02-03 10-00DLC_resnet.mp4")
+
+    watcher = Watcher(root, settle=0)
+    assert watcher.poll(now=0) == []
+
+
+def test_watch_folder_analyzes_changed_video_from_scratch(root, monkeypatch):
+    video = str(root / "1 - C1 - 01-02-03 10-00.mp4")
+    finished = []
+
+    class StubWatcher:
+        polls = 0
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def poll(self):
+            self.polls += 1
+            return [(video, True)]
+
+        def finish(self, path, success):
+            finished.append((path, success))
+
+    calls = []
+    monkeypatch.setattr(core, "Watcher", StubWatcher)
+    monkeypatch.setattr(core, "analyze_video", lambda path, **kwargs: calls.append(kwargs) or False)
+    core.watch_folder(str(root), interval=0, max_polls=1)
+
+    assert calls[0]["force_pose"] and calls[0]["overwrite"]
+    assert finished == [(video, False)]
+
+
+class CountingBackend(PoseBackend):
+    """Records estimated videos, without pose estimating"""
+
+    def __init__(self):
+        self.videos = []
+
+    def analyze_frames(self, block, frames):
+        raise NotImplementedError
+
+    def analyze_video(self, vid_info):
+        self.videos.append(vid_info["frame_count"])
+        vid_info["dlc_result"] = "DLC/result.h5"
+
+
+def test_force_pose_and_overwrite_reestimate(root):
+    video = root / "1 - C1 - 01-02-03 10-00.mp4"
+    write_video(video, n_frames=10)
+    backend = CountingBackend()
+
+    assert core.analyze_video(str(video), pose=True, backend=backend)
+    assert core.analyze_video(str(video), pose=True, backend=backend)
+    assert backend.videos == [10]  # saved result is reused
+
+    assert core.analyze_video(str(video), pose=True, backend=backend, force_pose=True)
+    assert backend.videos == [10, 10]
+
+    write_video(video, n_frames=20)  # re-recorded
+    assert core.analyze_video(str(video), pose=True, backend=backend, force_pose=True, overwrite=True)
+    assert backend.videos == [10, 10, 20]
+
+
+def test_failing_video_is_given_up(root, source):
+    from touchscreen_toolbox import catalog
+
+    watcher = Watcher(root, settle=SETTLE, retry=RETRY, attempts=2)
+    video = str(root / "1 - C1 - 01-02-03 10-00.mp4")
+    shutil.copy(source, video)
+
+    watcher.poll(now=0)
+    assert watcher.poll(now=SETTLE) == [(video, False)]
+    watcher.finish(video, False, now=SETTLE)
+    assert watcher.poll(now=SETTLE + RETRY) == [(video, False)]
+    watcher.finish(video, False, now=SETTLE + RETRY)
+
+    assert watcher.poll(now=10 * RETRY) == []
+    assert [row["status"] for row in catalog.query(root)] == ["failed"]
+    assert Watcher(root, settle=0).poll(now=0) == []  # e.g. after a restart
+
+    # until re-recorded
+    write_video(video, n_frames=20)
+    watcher = Watcher(root, settle=0)
+    assert watcher.poll(now=0) == [(video, False)]
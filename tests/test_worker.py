@@ -0,0 +1,82 @@
+import os
+
+import cv2
+import h5py
+import numpy as np
+import pytest
+
+from touchscreen_toolbox.pose_estimation import PoseBackend, PoseWorker, SyntheticBackend, read_pose
+
+
+def write_video(path, n_frames=10):
+    video = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    for i in range(n_frames):
+        video.write(np.full((48, 64, 3), i, np.uint8))
+    video.release()
+
+
+class BrokenBackend(PoseBackend):
+    """Backend whose model fails to load"""
+
+    def load(self):
+        raise FileNotFoundError("no model")
+
+    def analyze_frames(self, block, frames):
+        raise AssertionError("analyze_frames called without a model")
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # log files
+    root = tmp_path / "project"
+    root.mkdir()
+    return root
+
+
+def test_results_per_video(root):
+    videos = [str(root / f"{mouse} - C1 - 01-02-03 10-00.mp4") for mouse in (1, 2)]
+    for video in videos:
+        write_video(video)
+    missing = str(root / "3 - C1 - 01-02-03 10-00.mp4")
+
+    with PoseWorker(SyntheticBackend) as worker:
+        for video in videos + [missing]:
+            worker.submit(video)
+        results = {video: (result, error) for video, result, error in worker.collect()}
+
+    assert set(results) == set(videos + [missing])
+    for video in videos:
+        result, error = results[video]
+        assert error is None
+        assert os.path.dirname(result) == os.path.join(str(root), "DLC")
+        assert os.path.basename(result).startswith(os.path.splitext(os.path.basename(video))[0])
+        assert len(read_pose(result)) == 9  # 1st frame dropped when reading
+
+    result, error = results[missing]
+    assert result is None and error
+
+
+def test_session_not_in_timestamps(root):
+    video = str(root / "1 - C1 - 01-02-03 10-00.mp4")
+    write_video(video)
+    timestamps = str(root / "timestamps.h5")
+    h5py.File(timestamps, "w").close()
+
+    with PoseWorker(SyntheticBackend, timestamps=timestamps) as worker:
+        worker.submit(video)
+        [(path, result, error)] = worker.collect()
+    assert path == video and result is None and error
+
+
+def test_load_failure_fails_every_video(root):
+    videos = [str(root / f"{mouse} - C1 - 01-02-03 10-00.mp4") for mouse in (1, 2)]
+    for video in videos:
+        write_video(video)
+
+    with PoseWorker(BrokenBackend) as worker:
+        for video in videos:
+            worker.submit(video)
+        results = list(worker.collect())
+
+    assert sorted(path for path, _, _ in results) == sorted(videos)
+    assert all(result is None and "no model" in error for _, result, error in results)
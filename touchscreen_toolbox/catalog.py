@@ -0,0 +1,274 @@
+# Project level catalog of videos in a SQLite file at the project root,
+# for discovery & queries without listing every folder or loading per video info
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+from natsort import os_sorted
+
+from . import utils
+from . import config as cfg
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (  # (name, type) of indexed fields, the full vid_info is kept in 'info'
+    ("path", "TEXT PRIMARY KEY"),
+    ("dir", "TEXT"),
+    ("vid_name", "TEXT"),
+    ("mouse_id", "TEXT"),
+    ("chamber", "TEXT"),
+    ("exp_date", "TEXT"),
+    ("exp_time", "TEXT"),
+    ("size", "INTEGER"),
+    ("mtime", "REAL"),
+    ("fps", "REAL"),
+    ("frame_count", "INTEGER"),
+    ("duration", "REAL"),
+    ("width", "INTEGER"),
+    ("height", "INTEGER"),
+    ("status", "TEXT"),  # new / pose / post, see video_status, or failed (see mark_failed)
+    ("dlc_result", "TEXT"),
+    ("post_result", "TEXT"),
+    ("info", "TEXT"),
+    ("updated", "REAL"),
+)
+INDEXES = (("mouse_id", "exp_date"), ("exp_date",), ("status",), ("dir",))
+
+_initialized = set()  # catalog files with schema checked in this process
+
+
+def connect(root: str) -> sqlite3.Connection:
+    """
+    Open the catalog of the project containing <root>, created at <root> if none,
+    the schema & journal mode (cfg.CATALOG_JOURNAL) are set up once per process
+    """
+    path = os.path.join(find_catalog(root) or os.path.abspath(root), cfg.CATALOG)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    if path not in _initialized:
+        conn.execute(f"PRAGMA journal_mode={cfg.CATALOG_JOURNAL}")
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS videos ({', '.join(' '.join(c) for c in COLUMNS)})")
+            for index in INDEXES:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{'_'.join(index)} ON videos ({', '.join(index)})")
+            conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER, subdirs TEXT)")
+        _initialized.add(path)
+    return conn
+
+
+@contextmanager
+def transaction(root: str):
+    """Connection to the catalog of <root>, committed (or rolled back on error) and closed on exit"""
+    conn = connect(root)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def under(root: str) -> tuple:
+    """WHERE clause & parameters of paths under <root>, as a range over the primary key"""
+    prefix = os.path.join(os.path.abspath(root), "")
+    return "path >= ? AND path < ?", (prefix, prefix + chr(0x10FFFF))
+
+
+def find_catalog(path: str) -> str:
+    """Project root of the catalog containing <path> (searching parent folders), None if not cataloged"""
+    path = os.path.abspath(path)
+    while True:
+        if os.path.isfile(os.path.join(path, cfg.CATALOG)):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def scan(root: str, full: bool = False) -> int:
+    """
+    Update the catalog of the project containing <root> (or a new one at <root>) with videos under <root>,
+    skipping generated folders
+
+    Only directories whose mtime changed since the last scan are listed, and only new or changed
+    (size / mtime) videos in them have their info read; videos & directories no longer found are removed.
+    Unreadable videos (see utils.probe_video) are skipped, their directory is listed again next scan.
+    With <full>, every directory is listed, for videos rewritten in place (not changing the directory mtime).
+
+    Returns
+    -------
+    number of videos added or updated
+    """
+    from . import video_info
+
+    root = os.path.abspath(root)
+    where, params = under(root)
+    with transaction(root) as conn:
+        known_dirs = {row["path"]: (row["mtime"], json.loads(row["subdirs"])) for row in
+                      conn.execute(f"SELECT * FROM dirs WHERE path = ? OR ({where})", (root, *params))}
+
+    listed, removed, changed = {}, [], []
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            removed.append(path)
+            continue
+
+        known = known_dirs.get(path)
+        if known is not None and known[0] == mtime and not full:
+            stack += known[1]
+            continue
+
+        subdirs, videos = [], {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not utils.is_generated(entry.name):
+                        subdirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1] in cfg.FORMATS and 'DLC' not in entry.name:
+                    stat = entry.stat()
+                    videos[entry.path] = (stat.st_size, stat.st_mtime)
+        listed[path] = (mtime, subdirs, videos)
+        if known is not None:
+            removed += [subdir for subdir in known[1] if subdir not in subdirs]
+        stack += subdirs
+
+    # new / changed videos in listed directories
+    with transaction(root) as conn:
+        for path, (_, _, videos) in listed.items():
+            saved = {row["path"]: (row["size"], row["mtime"])
+                     for row in conn.execute("SELECT path, size, mtime FROM videos WHERE dir = ?", (path,))}
+            changed += [video for video, signature in videos.items() if saved.get(video) != signature]
+            removed += [video for video in saved if video not in videos]
+    rows = []
+    for video in changed:
+        try:
+            rows.append(catalog_row(video_info.get_vid_info(video, verbose=False)))
+        except ValueError as err:
+            logger.warning(f"Skipped {video}: {err}")
+            path = os.path.dirname(video)
+            listed[path] = (None, *listed[path][1:])  # not scanned, so listed again
+
+    # in a single transaction
+    with transaction(root) as conn:
+        for path in removed:
+            sub_where, sub_params = under(path)
+            for table in ("videos", "dirs"):
+                conn.execute(f"DELETE FROM {table} WHERE path = ? OR ({sub_where})", (path, *sub_params))
+        if rows:
+            conn.executemany(f"INSERT OR REPLACE INTO videos ({', '.join(rows[0])}) "
+                             f"VALUES ({', '.join('?' * len(rows[0]))})", [tuple(row.values()) for row in rows])
+        conn.executemany("INSERT OR REPLACE INTO dirs (path, mtime, subdirs) VALUES (?, ?, ?)",
+                         [(path, mtime, json.dumps(subdirs)) for path, (mtime, subdirs, _) in listed.items()])
+
+    logger.info(f"Cataloged {root}: listed {len(listed)} changed folders, {len(rows)} new or changed videos")
+    return len(rows)
+
+
+def record(vid_info: dict, root: str = None) -> bool:
+    """
+    Add / update <vid_info> in the catalog of the project containing <root>
+    (default to the catalog containing the video), atomically in a single transaction
+
+    Returns
+    -------
+    whether the video is cataloged
+    """
+    root = root or find_catalog(vid_info["dir"])
+    if root is None:
+        return False
+
+    row = catalog_row(vid_info)
+    with transaction(root) as conn:
+        conn.execute(f"INSERT OR REPLACE INTO videos ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                     tuple(row.values()))
+    return True
+
+
+def mark_failed(path: str, root: str = None) -> bool:
+    """
+    Mark video <path> as failed in the catalog (status 'failed'), until the video changes
+    or is recorded again; returns whether the video is cataloged (not if it cannot be read)
+    """
+    from . import video_info
+
+    root = root or find_catalog(os.path.dirname(os.path.abspath(path)))
+    if root is None:
+        return False
+    try:
+        row = catalog_row(video_info.get_vid_info(path, verbose=False))
+    except ValueError as err:
+        logger.warning(f"Failed to catalog {path}: {err}")
+        return False
+
+    row["status"] = "failed"
+    with transaction(root) as conn:
+        conn.execute(f"INSERT OR REPLACE INTO videos ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                     tuple(row.values()))
+    return True
+
+
+def catalog_row(vid_info: dict) -> dict:
+    """Catalog fields (see COLUMNS) of <vid_info>"""
+    path = os.path.abspath(vid_info["path"])
+    probe = utils.probe_video(path)
+    return {
+        "path": path,
+        "dir": os.path.dirname(path),
+        "vid_name": vid_info["vid_name"],
+        **{k: vid_info.get(k) for k in ("mouse_id", "chamber", "exp_date", "exp_time", "dlc_result", "post_result")},
+        **{k: probe[k] for k in ("size", "mtime", "fps", "frame_count", "duration", "width", "height")},
+        "status": video_status(vid_info),
+        "info": json.dumps(vid_info, sort_keys=True, default=str),
+        "updated": time.time(),
+    }
+
+
+def query(root: str, mouse_id: str = None, exp_date: str = None, status: str = None, **fields) -> list:
+    """
+    Cataloged videos under <root> matching all given fields (see COLUMNS), sorted by path
+
+    Returns
+    -------
+    rows: list[dict]
+        catalog fields, with the full vid_info under 'info'
+    """
+    fields.update(mouse_id=mouse_id, exp_date=exp_date, status=status)
+    fields = {k: v for k, v in fields.items() if v is not None}
+    unknown = set(fields) - {name for name, _ in COLUMNS}
+    if unknown:
+        raise KeyError(f"Invalid catalog fields {unknown}")
+    where, params = under(root)
+    where = " AND ".join([f"{k} = ?" for k in fields] + [where])
+
+    with transaction(root) as conn:
+        rows = conn.execute(f"SELECT * FROM videos WHERE {where}", (*fields.values(), *params)).fetchall()
+
+    rows = [dict(row) for row in rows]
+    for row in rows:
+        row["info"] = json.loads(row["info"])
+    return os_sorted(rows, key=lambda row: row["path"])
+
+
+def videos(root: str, rescan: bool = False, **fields) -> list:
+    """
+    Cataloged videos under <root> (see query), after an incremental scan for new / changed videos,
+    with <rescan> every directory is listed (see scan)
+    """
+    scan(root, full=rescan)
+    return query(root, **fields)
+
+
+def video_status(vid_info: dict) -> str:
+    """Latest stage finished for a video, 'post' / 'pose' / 'new'"""
+    if "post_result" in vid_info:
+        return "post"
+    elif "dlc_result" in vid_info:
+        return "pose"
+    return "new"
@@ -15,9 +15,19 @@ REFE = ("food_port", "ll_corner", "lr_corner", "l_screen", "m_screen", "r_screen
 
 # files naming
 DLC_CONFIG = "touchscreen_toolbox/DLC/config.yaml"  # path of deeplabcut config
+DLC_MODEL = "touchscreen_toolbox/DLC/exported-models"  # path of exported model for streamed inference
+POSE_BACKEND = "dlc"  # default pose estimation backend, see pose_estimation/backend.py
+DLC_CSV = True  # also save pose estimation result in csv, results are read from h5
+POSE_DTYPE = "float32"  # dtype of pose estimation data read for postprocessing
 DLC_FOLDER = "DLC"  # name of subfolder to put files from DLC (h5 & pickle)
 RST_FOLDER = "results"  # name of subfolder to put analyzed results (csv)
 INF_FOLDER = "info"
+PROBE_CACHE = ".probe.json"  # suffix of hidden file caching the probe of a video, next to it
+CATALOG = ".catalog.sqlite"  # name of hidden video catalog at the project root, see catalog.py
+CATALOG_JOURNAL = "WAL"  # SQLite journal mode of the catalog, WAL lets workers read while one writes,
+                         # but needs shared memory: use "DELETE" if the project is on a network file system
+TS_INDEX = ".index.h5"  # suffix of hidden sidecar indexing a timestamps file, next to it
+CACHE_FOLDER = "cache"  # name of subfolder to cache outputs of postprocessing stages
 STATS_NAME = "statistics.csv"
 FORMATS = [".mp4"]
 
@@ -42,9 +52,57 @@ INFO_LS = [
 # preprocess
 # ------
 B_THRESHOLD = 45  # threshold for increasing brightness
+FRAME2READ = 5  # frame to sample brightness from
+PREP_WORKERS = 8  # frame worker threads for preprocessing, 0 for serial
+BATCH_SIZE = 8  # frames per block for batch frame functions, preprocessing is decode bound so larger blocks
+                # don't run faster but buffer (PREP_WORKERS + 3) x BATCH_SIZE frames (1.4 GB at 256, 640x480)
 TIME_BUFFER = (-1, 10)  # (sec)
 
 
+# results
+# ------
+CHUNK_SIZE = 10000  # frames per chunk for chunked postprocessing
+TRACE_RESAMPLE = "first"  # reduction of photometry samples in a frame, first / mean / min / max
+CACHE = False  # cache outputs of every postprocessing stage (disk space ~ results x stages), unchanged stages are skipped on re-runs
+FLOAT_DTYPE = "float32"  # dtype of coordinates, features & other continuous results
+INT_DTYPES = ("int8", "int16", "int32", "int64")  # candidates for integer results, smallest fitting is used
+SCHEMA = {  # explicit dtypes by column / top level column, others are inferred (see utils.compact_dtypes)
+    "coordinate": FLOAT_DTYPE,
+    "internal": FLOAT_DTYPE,
+    "external": FLOAT_DTYPE,
+    "DA": FLOAT_DTYPE,
+    "session_type": "category",
+    # task, (dtype, sentinel) for frames without a state / before the first trial (NaN)
+    "knockout": "int8",
+    "male": "int8",
+    "state": ("int8", -1),
+    "state_": "int8",
+    "trial": ("int16", 0),
+    "block": ("int8", 0),
+    "block_trial": ("int16", 0),
+    "trial_2nd": ("int16", 0),  # negative in the 1st block, never 0
+    "left_response": ("int8", -1),
+    "reward": ("int8", -1),
+    "optimal": ("int8", -1),
+    "rare": ("int8", -1),
+    "switch": ("int8", -1),
+    "prev_reward": ("int8", -1),
+    "win_stay": ("int8", -1),
+    "cons_reward": ("int16", 0),  # runs of rewards count up from 1, losses down from -1
+    "unexpectation": FLOAT_DTYPE,  # no free sentinel, NaN kept
+    "P_contrast": FLOAT_DTYPE,
+}
+
+
+# watch mode
+# ------
+WATCH_INTERVAL = 10  # (sec) between polls
+WATCH_SETTLE = 30  # (sec) a new / changed video must be unchanged for, before it is processed
+WATCH_RETRY = 600  # (sec) before a video that failed is processed again
+WATCH_ATTEMPTS = 3  # attempts at a video before it is marked failed in the catalog, until it changes
+WATCH_RECHECK = 30  # polls between full listings of the watched tree, for in-place rewrites
+
+
 # auto generated variables
 # ------
 # for quick access of columns
@@ -52,6 +110,7 @@ HEADERS = [j for i in (MICE + REFE) for j in (i + "_x", i + "_y", i + "_cfd")]
 XCOLS = [i for i in HEADERS if "_x" in i]
 YCOLS = [i for i in HEADERS if "_y" in i]
 CCOLS = [i for i in HEADERS if "_cfd" in i]
+XYCOLS = [i for i in HEADERS if "_cfd" not in i]
 
 # template for statistics.csv
 HEAD1 = INFO_LS + ["frame"] + [i[:-4] for i in CCOLS for j in "12345"]
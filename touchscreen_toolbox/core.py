@@ -1,15 +1,15 @@
 import os
-import glob
+import time
 import logging
 from typing import Union
-from natsort import os_sorted
-from joblib import Parallel, delayed
 
 from . import utils
+from . import catalog
 from . import video_info
 from . import postprocess
 from . import config as cfg
 from . import pose_estimation as pe
+from .watch import Watcher
 
 logger = logging.getLogger(__name__)
 
@@ -21,24 +21,50 @@ def analyze_video(
     post: bool = False, 
     timestamps: str = False, 
     raise_exception: bool = False,
-    force_pose: bool = False
-) -> None:
+    force_pose: bool = False,
+    stream: bool = False,
+    backend=None,
+    window: bool = False,
+    chunked: bool = False,
+    overwrite: bool = False
+) -> bool:
     """
-    Analyze a video
+    Analyze a video, returns whether it succeeded
+
+    <backend>: pose estimation backend, name / class / instance (see pose_estimation.get_backend)
+
+    With <stream>, preprocessed frames are fed straight into the backend
+    without writing intermediate videos
+
+    With <window>, only frames in the task window (from <timestamps>) are pose estimated
+
+    With <chunked>, postprocessing runs in chunks of cfg.CHUNK_SIZE frames, in memory O(chunk size)
+    but for the reference coordinates of all frames (see postprocess.process_chunked),
+    and the result is saved chunk by chunk
+
+    With <overwrite>, saved video info is ignored and read again from the video (e.g. a re-recorded video),
+    so earlier results are not reused
     """
+    utils.setup_logging()
     try:
         logger.info(f"Analyzing '{video_path}'...")
 
         # initialize result folders + get video info
-        vid_info = initialize(video_path)
+        vid_info = initialize(video_path, overwrite=overwrite)
 
         # pose estimate
         if pose:
-            if not (('dlc_result' in vid_info) or force_pose):
+            if force_pose or 'dlc_result' not in vid_info:
                 logger.info("Pose estimating...")
-                pe.preprocess_video(vid_info)
-                pe.dlc_analyze(vid_info)
-                pe.cleanup(vid_info)
+                if not pe.set_pose_window(vid_info, timestamps if window else None):
+                    logger.warning(f"\n\nGet time failed for {video_path}")
+                    return False
+
+                backend = pe.get_backend(backend)
+                if stream:
+                    pe.stream_analyze(vid_info, backend)
+                else:
+                    backend.analyze_video(vid_info)
                 video_info.save_info(vid_info)
             else:
                 logger.info("Skipped pose estimation")
@@ -50,29 +76,66 @@ def analyze_video(
             success = video_info.get_time(vid_info, timestamps)
             if not success:
                 logger.warning(f"\n\nGet time failed for {video_path}")
-                return None
+                return False
             
-            data = pe.read_dlc_csv(vid_info)
-            data = postprocess.refine_data(data)
-            data = postprocess.standardize_data(data)
-            data = postprocess.engineering(data)
-            data = postprocess.merge(vid_info, data, timestamps)
-            video_info.save_data(vid_info, data)
+            if chunked:
+                postprocess.process_chunked(vid_info, timestamps)
+            else:
+                data = postprocess_pose(vid_info)
+                data = postprocess.merge(vid_info, data, timestamps)
+                video_info.save_data(vid_info, data)
             video_info.save_info(vid_info)
 
         logger.info("Done!")
+        return True
         
     except Exception as e:
         logger.warning(f"\n\nException encountered for {video_path}")
         logger.exception(e)
         if raise_exception:
             raise e
+        return False
 
 
-def initialize(video_path: str) -> dict:
+def postprocess_pose(vid_info: dict, cache: bool = cfg.CACHE):
+    """
+    Read pose estimation result -> refine -> standardize -> engineering,
+    with <cache>, stage outputs are cached in the cache folder keyed by their inputs
+    (upstream result, config values & code), and unchanged stages are skipped
+    """
+    stages = [
+        ("pose", lambda _: utils.PoseArray.from_dataframe(pe.read_pose(vid_info), fps=vid_info.get("fps", cfg.FPS)),
+         {"frames": vid_info.get("frames"), "frame_offset": vid_info.get("frame_offset", 0),
+          "fps": vid_info.get("fps", cfg.FPS), "keypoints": cfg.MICE + cfg.REFE, "dtype": cfg.POSE_DTYPE},
+         ("touchscreen_toolbox.pose_estimation.dlc", "touchscreen_toolbox.utils.pose_array")),
+        ("refine", postprocess.refine_data,
+         {"P_CUTOFF": cfg.P_CUTOFF},
+         ("touchscreen_toolbox.postprocess.refine",)),
+        ("standardize", postprocess.standardize_data,
+         {"TRAY_WIDTH": cfg.TRAY_WIDTH, "DECIMALS": cfg.DECIMALS, "REFE": cfg.REFE},
+         ("touchscreen_toolbox.postprocess.standardize", "touchscreen_toolbox.utils.arithmetic")),
+        ("engineering", postprocess.engineering,
+         {"DECIMALS": cfg.DECIMALS, "MICE": cfg.MICE, "SCHEMA": cfg.SCHEMA,
+          "FLOAT_DTYPE": cfg.FLOAT_DTYPE, "INT_DTYPES": cfg.INT_DTYPES},
+         ("touchscreen_toolbox.postprocess.feature", "touchscreen_toolbox.utils.arithmetic",
+          "touchscreen_toolbox.utils.dtypes")),
+    ]
+
+    if not cache:
+        data = None
+        for _, func, _, _ in stages:
+            data = func(data)
+        return data
+
+    pose_path = os.path.join(vid_info["dir"], vid_info["dlc_result"])
+    return utils.run_stages(stages, utils.file_hash(pose_path),
+                            os.path.join(vid_info["dir"], cfg.CACHE_FOLDER), vid_info["vid_name"])
+
+
+def initialize(video_path: str, overwrite: bool = False) -> dict:
     """Initialize result folders and get video info"""
 
-    vid_info = video_info.get_vid_info(video_path)
+    vid_info = video_info.get_vid_info(video_path, overwrite=overwrite)
     utils.initialize_folders(vid_info)
 
     return vid_info
@@ -83,6 +146,7 @@ def analyze_folder(folder_path: str, recursive: bool = False, **kwargs) -> None:
     Analyze a folder (recursively)
     """
 
+    utils.setup_logging()
     if recursive and utils.is_generated(folder_path):
         logger.info(f"Skipping folder {folder_path}...")
         return None
@@ -101,11 +165,56 @@ def analyze_folder(folder_path: str, recursive: bool = False, **kwargs) -> None:
     postprocess.record_stats(folder_path)
 
 
-def parallel_postprocessing(root_folder, **kwargs) -> None:
-    all_videos = os_sorted(list(filter(lambda x: 'DLC' not in x, 
-                                glob.glob(os.path.join(root_folder, "**/*.mp4"), recursive=True))))
+def watch_folder(root_folder: str, interval: float = cfg.WATCH_INTERVAL, settle: float = cfg.WATCH_SETTLE,
+                 max_polls: int = None, **kwargs) -> None:
+    """
+    Watch <root_folder> for new or changed videos, and analyze each (pose + post) once the recorder
+    has finished writing it (see watch.Watcher), until interrupted or after <max_polls> polls
+
+    kwargs are passed to analyze_video, changed videos are analyzed from scratch (info read again,
+    pose estimated again), failed videos are retried after cfg.WATCH_RETRY seconds,
+    and marked failed in the catalog after cfg.WATCH_ATTEMPTS attempts
+    """
+    utils.setup_logging()
+    logger.info(f"Watching {root_folder}...")
+    watcher = Watcher(root_folder, settle=settle)
+    try:
+        while max_polls is None or watcher.polls < max_polls:
+            for video, changed in watcher.poll():
+                success = analyze_video(video, pose=True, post=True,
+                                        **{"force_pose": changed, "overwrite": changed, **kwargs})
+                watcher.finish(video, success)
+            if max_polls is None or watcher.polls < max_polls:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info(f"Stopped watching {root_folder}")
+
+
+def parallel_postprocessing(root_folder, rescan: bool = False, **kwargs) -> None:
+    """
+    Postprocess all videos under <root_folder>, listed from the project catalog
+    (updated from changed folders, or every folder with <rescan>, see catalog.scan)
+    """
+    utils.setup_logging()
+    if kwargs.get("timestamps"):
+        utils.timestamp_index(kwargs["timestamps"])  # built once, workers load the sidecar
+    all_videos = [row['path'] for row in catalog.videos(root_folder, rescan=rescan)]
+    from joblib import Parallel, delayed
     _ = Parallel(n_jobs=8)(delayed(analyze_video)(video, **kwargs) for video in all_videos)
 
+
+def parallel_pose_estimation(root_folder, n_processes: int = 1, backend=None, timestamps: str = None,
+                             rescan: bool = False) -> dict:
+    """
+    Pose estimate all videos under <root_folder> with persistent workers,
+    each worker loads the model once for the whole batch,
+    videos are listed from the project catalog (see parallel_postprocessing)
+    """
+    utils.setup_logging()
+    all_videos = [row['path'] for row in catalog.videos(root_folder, rescan=rescan)]
+    with pe.PoseWorker(backend, n_processes=n_processes, timestamps=timestamps) as worker:
+        return worker.map(all_videos)
+
     
     
 def label_video(video: Union[str, dict]) -> None:
@@ -1,20 +1,20 @@
 import os
-import glob
 import logging
 import pandas as pd
 from natsort import natsorted
 from collections import defaultdict
-from joblib import Parallel, delayed
 
 from . import utils
-from . import video_info
+from . import catalog
 
 logger = logging.getLogger(__name__)
 
 
-def export_results(root: str, dest: str, n_jobs=8) -> None:
-    """Export results from <root> to <dest>"""
-    results, skipped = list_results(root)
+def export_results(root: str, dest: str, n_jobs=8, rescan: bool = False) -> None:
+    """Export results from <root> to <dest>, with <rescan> every folder is listed again (see catalog.scan)"""
+    from joblib import Parallel, delayed
+    utils.setup_logging()
+    results, skipped = list_results(root, rescan=rescan)
 
     for animal in results.keys():
         # read all result for the animal into memory
@@ -24,7 +24,7 @@ def export_results(root: str, dest: str, n_jobs=8) -> None:
         save_path = os.path.join(dest, str(animal) + '.h5')
         (pd.concat(ls, axis=0)
          .sort_index(level=['ko', 'id', 'block', 'frame'], sort_remaining=False)
-         .to_hdf(save_path, str(animal)))
+         .to_hdf(save_path, key=str(animal)))
         
         logger.info(f"Saved results for {animal}")
 
@@ -41,8 +41,11 @@ def _get_result(f: str, animal_id: int) -> pd.DataFrame:
     return multiindex_row(utils.read_result(f), int(animal_id))
 
 
-def list_results(root: str) -> (defaultdict, list):
+def list_results(root: str, rescan: bool = False) -> (defaultdict, list):
     """
+    List results of videos under <root> from the project catalog, updated from changed folders
+    (every folder with <rescan>)
+
     Returns
     ------
     results: dict
@@ -52,19 +55,14 @@ def list_results(root: str) -> (defaultdict, list):
     skipped: list
         list of skipped videos (no 'post_result' found)
     """
-    all_videos = glob.glob(os.path.join(root, "**/*.mp4"), recursive=True)
-    all_videos = list(filter(lambda x: 'DLC' not in x, all_videos))  # filter out videos created by preprocess
-
     skipped = []
     results = defaultdict(list)
-    for f in all_videos:
-        try:
-            # read saved vid_info to locate postprocessing result
-            info = video_info.get_vid_info(f, verbose=False)
-            results[info['mouse_id']].append(os.path.join(info['dir'], info['post_result']))
-        except KeyError:
+    for row in catalog.videos(root, rescan=rescan):
+        if row['post_result']:
+            results[row['mouse_id']].append(os.path.join(row['dir'], row['post_result']))
+        else:
             # post_result not found
-            skipped.append(f)
+            skipped.append(row['path'])
 
     return results, skipped
 
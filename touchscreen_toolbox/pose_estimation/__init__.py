@@ -1,2 +1,5 @@
 from .dlc import *
 from .preprocess import *
+from .stream import *
+from .backend import *
+from .worker import *
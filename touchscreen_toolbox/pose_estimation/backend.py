@@ -0,0 +1,178 @@
+# Pluggable pose estimation backends
+
+import os
+import logging
+import numpy as np
+from abc import ABC, abstractmethod
+import touchscreen_toolbox.utils as utils
+import touchscreen_toolbox.config as cfg
+from touchscreen_toolbox.utils import lazy_import
+from .dlc import dlc_analyze, cleanup
+from .preprocess import preprocess_video, plan_preprocess, output_dim, pose_offset
+from .stream import stream_analyze, save_pose
+
+cv2 = lazy_import("cv2")
+logger = logging.getLogger(__name__)
+
+
+class PoseBackend(ABC):
+    """
+    Pose estimation backend interface, subclasses implement analyze_frames
+
+    analyze_frames: (N, H, W, C) block of BGR frames [start, stop) -> (N, keypoints, 3) array
+        of (x, y, likelihood), keypoints in cfg.MICE + cfg.REFE order
+
+    analyze_video: pose estimate vid_info['path'], saving the result in DLC format
+        and recording it in vid_info['dlc_result'] (see stream.save_pose)
+    """
+
+    scorer = "DLC_stream"  # scorer name in saved results
+
+    def load(self) -> None:
+        """Load the model, called once by PoseWorker before the 1st video (default to loading on first use)"""
+
+    @abstractmethod
+    def analyze_frames(self, block: np.ndarray, frames: tuple) -> np.ndarray:
+        """(N, keypoints, 3) poses of a (N, H, W, C) <block> of BGR frames [start, stop) = <frames>"""
+
+    def analyze_video(self, vid_info: dict) -> None:
+        """Default to streaming preprocessed frames into analyze_frames"""
+        stream_analyze(vid_info, self)
+
+    def __call__(self, block: np.ndarray, frames: tuple) -> np.ndarray:
+        return self.analyze_frames(block, frames)
+
+
+class DLCBackend(PoseBackend):
+    """
+    DeepLabCut backend, videos are analyzed with deeplabcut (from <config>, the model is rebuilt per video),
+    frames (streamed / PoseWorker) with DeepLabCut-Live from <model_path>, loaded once
+
+    Streamed inference needs the optional deeplabcut-live package and the model of <config> exported
+    with deeplabcut.export_model to <model_path> (see README)
+    """
+
+    def __init__(self, config: str = cfg.DLC_CONFIG, model_path: str = cfg.DLC_MODEL):
+        self.config = config
+        self.model_path = model_path
+        self.live = None
+        self.initialized = False
+
+    def load(self) -> None:
+        try:
+            from dlclive import DLCLive
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("Streamed DLC inference needs deeplabcut-live (pip install deeplabcut-live)") \
+                from None
+        if not os.path.isdir(self.model_path):
+            raise FileNotFoundError(f"No exported DLC model at {self.model_path}, "
+                                    f"export it with deeplabcut.export_model({self.config!r})")
+        self.live = DLCLive(self.model_path)
+
+    def analyze_frames(self, block: np.ndarray, frames: tuple) -> np.ndarray:
+        # DLC is trained on RGB frames
+        rgb = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in block]
+        if self.live is None:
+            self.load()
+        if not self.initialized:
+            self.live.init_inference(rgb[0])
+            self.initialized = True
+        return np.stack([self.live.get_pose(frame) for frame in rgb])
+
+    def analyze_video(self, vid_info: dict) -> None:
+        preprocess_video(vid_info)
+        dlc_analyze(vid_info)
+        cleanup(vid_info)
+
+
+class SyntheticBackend(PoseBackend):
+    """
+    Fast deterministic backend without a model, for benchmarking the pipeline
+
+    The mouse wanders smoothly around the arena with its body trailing along the heading,
+    reference points are fixed with small jitter, and a fraction <dropout> of predictions
+    have low confidence. Output only depends on <seed> and frame numbers.
+    """
+
+    scorer = "DLC_synthetic"
+
+    # keypoint positions, mouse relative to snout (pixels behind, pixels to the left at 640 wide),
+    # references as fractions of the frame
+    MICE_OFFSETS = {"snout": (0, 0), "lEar": (12, 8), "rEar": (12, -8), "spine1": (25, 0),
+                    "spine2": (45, 0), "tail1": (65, 0), "tail2": (85, 0), "tail3": (105, 0)}
+    REFE_POSITIONS = {"food_port": (0.5, 0.92), "ll_corner": (0.08, 0.92), "lr_corner": (0.92, 0.92),
+                      "l_screen": (0.25, 0.08), "m_screen": (0.5, 0.08), "r_screen": (0.75, 0.08)}
+
+    def __init__(self, seed: int = 0, dropout: float = 0.05):
+        self.seed = seed
+        self.dropout = dropout
+
+    def analyze_frames(self, block: np.ndarray, frames: tuple) -> np.ndarray:
+        return self.generate(np.arange(*frames), block.shape[2], block.shape[1])
+
+    def analyze_video(self, vid_info: dict) -> None:
+        """
+        Generate poses for the (windowed) frames from the video probe, without decoding,
+        in the coordinates of the preprocessed frames (same as streamed)
+        """
+        probe = utils.probe_video(vid_info["path"])
+        start, stop = vid_info.get("pose_window") or (0, probe["frame_count"])
+
+        vid_info["prep"] = [suffix for suffix, _ in plan_preprocess(vid_info)]
+        vid_info["frame_offset"] = pose_offset(vid_info)
+        frames = np.arange(start, min(stop, probe["frame_count"]))
+        save_pose(vid_info, self.generate(frames, *output_dim(probe, vid_info["prep"])), self.scorer)
+
+    def generate(self, frames: np.ndarray, width: int, height: int) -> np.ndarray:
+        """(frames, keypoints, 3) poses for <frames> in a <width> x <height> video"""
+        t = frames / cfg.FPS
+        phase = np.array([0.3, 1.1, 2.3, 4.2]) * (self.seed + 1)
+
+        # snout path & heading (from the analytic velocity)
+        x = width * (0.5 + 0.3 * np.sin(0.13 * t + phase[0]) + 0.1 * np.sin(0.71 * t + phase[1]))
+        y = height * (0.5 + 0.3 * np.sin(0.17 * t + phase[2]) + 0.1 * np.sin(0.59 * t + phase[3]))
+        vx = 0.3 * 0.13 * np.cos(0.13 * t + phase[0]) + 0.1 * 0.71 * np.cos(0.71 * t + phase[1])
+        vy = 0.3 * 0.17 * np.cos(0.17 * t + phase[2]) + 0.1 * 0.59 * np.cos(0.59 * t + phase[3])
+        heading = np.arctan2(vy * height, vx * width)
+        u = np.stack([np.cos(heading), np.sin(heading)], axis=-1)[:, None, :]  # forward
+        n = np.stack([-np.sin(heading), np.cos(heading)], axis=-1)[:, None, :]  # left
+
+        scale = width / 640
+        offsets = np.array([self.MICE_OFFSETS.get(k, (0, 0)) for k in cfg.MICE], dtype=float) * scale
+        mice = (np.stack([x, y], axis=-1)[:, None, :]
+                - offsets[None, :, :1] * u
+                + offsets[None, :, 1:] * n)
+
+        refe = np.array([self.REFE_POSITIONS.get(k, (0.5, 0.5)) for k in cfg.REFE]) * (width, height)
+        refe = np.broadcast_to(refe, (len(frames),) + refe.shape)
+
+        poses = np.empty((len(frames), len(cfg.MICE + cfg.REFE), 3))
+        poses[:, :, :2] = np.concatenate([mice, refe], axis=1)
+        poses[:, :, :2] += self.noise(frames, poses.shape[1], 2) - 0.5  # +- 0.5 pixel jitter
+
+        confidence = 0.9 + 0.1 * self.noise(frames, poses.shape[1], 1)[..., 0]
+        dropped = self.noise(frames, poses.shape[1], 1, salt=1)[..., 0] < self.dropout
+        poses[:, :, 2] = np.where(dropped, confidence * 0.05, confidence)
+        return poses
+
+    def noise(self, frames: np.ndarray, n_keypoints: int, n_values: int, salt: int = 0) -> np.ndarray:
+        """Deterministic uniform [0, 1) noise of shape (frames, n_keypoints, n_values), hashed from frame numbers"""
+        k = np.arange(n_keypoints * n_values).reshape(n_keypoints, n_values)
+        h = np.sin(frames[:, None, None] * 12.9898 + k * 78.233 + (self.seed + salt * 101) * 37.719) * 43758.5453
+        return h - np.floor(h)
+
+
+BACKENDS = {"dlc": DLCBackend, "synthetic": SyntheticBackend}
+
+
+def get_backend(backend=None) -> PoseBackend:
+    """
+    Get pose backend from its name in BACKENDS, a backend class or instance,
+    default to cfg.POSE_BACKEND
+    """
+    backend = backend or cfg.POSE_BACKEND
+    if isinstance(backend, str):
+        backend = BACKENDS[backend]
+    if isinstance(backend, type):
+        backend = backend()
+    return backend
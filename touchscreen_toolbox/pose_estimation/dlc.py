@@ -2,12 +2,14 @@
 
 import os
 import logging
+import numpy as np
 import pandas as pd
-import deeplabcut as dlc
 from typing import Union
 import touchscreen_toolbox.utils as utils
 import touchscreen_toolbox.config as cfg
+from touchscreen_toolbox.utils import lazy_import
 
+h5py = lazy_import("h5py")
 logger = logging.getLogger(__name__)
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
@@ -24,17 +26,19 @@ def dlc_analyze(vid_info: dict) -> None:
         logger.info("Vid info contain processed files, skipping...")
         return None
 
+    import deeplabcut as dlc
     curr_files = utils.find_files(vid_info["dir"])
 
     dlc.analyze_videos(
         cfg.DLC_CONFIG, vid_info["target_path"], videotype=".mp4", batchsize=32
     )
-    dlc.analyze_videos_converth5_to_csv(vid_info["dir"], videotype=".mp4")
+    if cfg.DLC_CSV:
+        dlc.analyze_videos_converth5_to_csv(vid_info["dir"], videotype=".mp4")
 
-    new_files = [f for f in utils.find_files(vid_info["dir"]) if f not in curr_files]
-    csv = [f for f in new_files if f.endswith(".csv")][0]
+    new_files = [os.path.basename(f) for f in utils.find_files(vid_info["dir"]) if f not in curr_files]
+    h5 = [f for f in new_files if f.endswith(".h5")][0]
     vid_info["files"] = new_files
-    vid_info["dlc_result"] = csv
+    vid_info["dlc_result"] = h5
 
 
 def cleanup(vid_info: dict) -> None:  # TODO:  enter/exit to cover all files (e.g. _r.mp4)
@@ -53,29 +57,117 @@ def cleanup(vid_info: dict) -> None:  # TODO:  enter/exit to cover all files (e.
     vid_info["dlc_result"] = os.path.join(cfg.DLC_FOLDER, vid_info["dlc_result"])
 
 
-def read_dlc_csv(path: Union[str, dict], frames: tuple = None) -> pd.DataFrame:
+def read_dlc_csv(path: Union[str, dict], frames: tuple = None, offset: int = 0) -> pd.DataFrame:
     """
-    Read pose estimation result produced by DLC
+    Read pose estimation result produced by DLC (h5 or csv) in float64,
+    frame numbers are shifted by <offset> if only a window of the video is estimated
+    """
+    return read_pose(path, frames, offset, dtype=float)
+
+
+def read_pose(
+    path: Union[str, dict],
+    frames: tuple = None,
+    offset: int = 0,
+    keypoints: tuple = None,
+    dtype=cfg.POSE_DTYPE
+) -> pd.DataFrame:
+    """
+    Read pose estimation result produced by DLC, directly from its h5 or from csv,
+    only <keypoints> (default all) and the rows in <frames> are read
+
+    Args
+    -------
+    path: str or dict
+        path to the h5 / csv result, or vid_info
+
+    frames: tuple[int]
+        frames[0] + 1 to frames[1] are returned, as the 1st row is always dropped (with the csv header)
+
+    offset: int
+        frame number of the 1st row, if only a window of the video is estimated
+
+    keypoints: tuple[str]
+        keypoints to read, in cfg.MICE + cfg.REFE order
+
+    dtype:
+        dtype of returned values
     """
     if type(path) == dict:  # vid_info
-        if 'frames' in path:
-            return read_dlc_csv(os.path.join(path["dir"], path["dlc_result"]), path['frames'])
-        else:
-            return read_dlc_csv(os.path.join(path["dir"], path["dlc_result"]))
-    
-    elif type(path) == str:  # csv path
-        data = pd.read_csv(path,
-                           skiprows=[0, 1, 2, 3],
-                           names=(["frame"] + cfg.HEADERS)
-                           ).set_index("frame")
-        if frames is not None:
-            return data.iloc[frames[0]:frames[1], :]
-        else:
-            return data
-    else:
+        return read_pose(os.path.join(path["dir"], path["dlc_result"]), path.get('frames'),
+                         path.get('frame_offset', 0), keypoints, dtype)
+
+    elif type(path) != str:
         raise TypeError("Invalid input type")
 
-        
+    start, stop = pose_rows(frames, offset)
+    return read_pose_rows(path, start, stop, offset, keypoints, dtype)
+
+
+def pose_rows(frames: tuple = None, offset: int = 0) -> tuple:
+    """Rows [start, stop) of pose estimation result holding <frames> (see read_pose), stop is None for all"""
+    start = 1 if frames is None else max(1, frames[0] + 1 - offset)
+    stop = None if frames is None else max(start, frames[1] + 1 - offset)
+    return start, stop
+
+
+def read_pose_rows(
+    path: str,
+    start: int,
+    stop: int = None,
+    offset: int = 0,
+    keypoints: tuple = None,
+    dtype=cfg.POSE_DTYPE
+) -> pd.DataFrame:
+    """Read rows [start, stop) of pose estimation result from h5 / csv, indexed by frame (row + <offset>)"""
+
+    # column projection
+    all_keypoints = cfg.MICE + cfg.REFE
+    keypoints = [k for k in all_keypoints if k in (keypoints or all_keypoints)]
+    cols = [3 * all_keypoints.index(k) + i for k in keypoints for i in range(3)]
+    headers = [k + suffix for k in keypoints for suffix in ("_x", "_y", "_cfd")]
+
+    if path.endswith(".h5"):
+        values = read_h5_block(path, start, stop, cols).astype(dtype, copy=False)
+    else:
+        values = pd.read_csv(path, header=None, skiprows=3 + start,
+                             nrows=None if stop is None else stop - start,
+                             usecols=[c + 1 for c in cols], dtype=dtype).to_numpy()
+
+    index = pd.RangeIndex(start + offset, start + offset + len(values), name="frame")
+    return pd.DataFrame(values, index=index, columns=headers)
+
+
+def read_h5_block(path: str, start: int, stop: int = None, cols: list = None) -> np.ndarray:
+    """
+    Rows [start, stop) & columns <cols> (positions, increasing) of the values of a DLC result h5,
+    read from the values block of pandas' table / fixed format without building the full DataFrame;
+    the fixed format block is only read for <cols>, the table format is stored by row
+    """
+    with h5py.File(path, "r") as f:
+        group = f[next(iter(f))]
+        if "table" in group and group["table"].dtype.names == ("index", "values_block_0"):
+            block = group["table"].fields("values_block_0")[start:stop]
+            return block if cols is None else block[:, cols]
+        if "block0_values" in group and "block1_values" not in group:
+            return group["block0_values"][start:stop, slice(None) if cols is None else cols]
+
+    # other layouts, e.g. mixed dtypes
+    values = pd.read_hdf(path, start=start, stop=stop).to_numpy()
+    return values if cols is None else values[:, cols]
+
+
+def count_rows(path: str) -> int:
+    """Number of rows in pose estimation result (h5 / csv)"""
+    if path.endswith(".h5"):
+        with pd.HDFStore(path, "r") as store:
+            storer = store.get_storer(store.keys()[0])
+            return storer.nrows if storer.is_table else storer.shape[0]
+    with open(path) as f:
+        return sum(1 for _ in f) - 3  # header
+
+
 def dlc_label_video(video_path: str):
+    import deeplabcut as dlc
     return dlc.create_labeled_video(cfg.DLC_CONFIG, os.path.abspath(video_path),
                                     videotype='mp4', save_frames = False, filtered=False)
\ No newline at end of file
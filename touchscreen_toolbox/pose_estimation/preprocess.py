@@ -1,52 +1,122 @@
 import os
-import cv2
 import logging
 import numpy as np
 import touchscreen_toolbox.config as cfg
-import ffmpeg
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
+import touchscreen_toolbox.utils as utils
+import touchscreen_toolbox.video_info as video_info
+from touchscreen_toolbox.utils import probe_video, lazy_import
 
+cv2 = lazy_import("cv2")
 logger = logging.getLogger(__name__)
 
 
 def preprocess_video(vid_info: dict):
     """
     Check video quality then apply preprocessing if required,
+    all planned transforms are fused into a single decode -> map -> encode pass
+
+    The output is encoded by cv2 (mp4v) at the encoder's default bitrate, as cv2 cannot set it,
+    so resized videos no longer keep the bitrate of the source
+
+    The pose window (see set_pose_window) is only cut along with other transforms,
+    otherwise the original video is estimated whole, with frame_offset 0
     """
 
     vid_info["prep"] = []  # to record preprocess applied
-    resolution(vid_info)
-    brightness(vid_info)
+    steps = plan_preprocess(vid_info)
+    if [suffix for suffix, _ in steps] == ["c"]:
+        steps = []  # a cut alone is not worth a re-encode, the whole video is estimated instead
+    vid_info["frame_offset"] = pose_offset(vid_info) if steps else 0
+    if not steps:
+        return None
 
+    source = vid_info["target_path"]
+    for suffix, _ in steps:
+        vid_info["target_path"] = add_suffix(vid_info, "_" + suffix)
+        vid_info["prep"].append(suffix)
 
-# --- functions for video resolution ---
+    logger.info(f"Preprocessing '{source}' ({', '.join(vid_info['prep'])})...")
 
-def resolution(vid_info):
-    width = cfg.RESOLUTION['width']
-    height = cfg.RESOLUTION['height']
-    target_video = vid_info["target_path"]
-    probe_info = get_ffprobe_info(target_video)
+    # overwrite
+    if os.path.exists(vid_info["target_path"]):
+        os.remove(vid_info["target_path"])
+
+    probe = probe_video(source)
+    map_video(compose([func for _, func in steps]), source, vid_info["target_path"],
+              fps=probe["fps"], dim=output_dim(probe, vid_info["prep"]), window=vid_info.get("pose_window"))
+
+
+def plan_preprocess(vid_info: dict) -> list:
+    """
+    Plan preprocessing from the video probe
+
+    Returns
+    -------
+    steps: list[tuple[str, function]]
+        (suffix, frame function) of each transform, in the order to apply
+    """
+    probe = probe_video(vid_info["target_path"])
+    steps = [("c", cut(vid_info)),
+             ("r", resolution(probe)),
+             ("b", brightness(probed_brightness(vid_info["target_path"])))]
+    return [(suffix, func) for suffix, func in steps if func is not None]
+
+
+def set_pose_window(vid_info: dict, timestamps: str = None) -> bool:
+    """
+    Restrict pose estimation to the task window (+ buffer) from <timestamps>,
+    or to the whole video if not given
+    """
+    vid_info.pop("pose_window", None)
+    if not timestamps:
+        return True
+
+    if not video_info.get_time(vid_info, timestamps):
+        return False
 
-    if (probe_info['height'] != height) or (probe_info['width'] != width):
-        logger.info(f"Rescaling '{target_video}'...")
+    # decode 1 extra frame, as the 1st row is dropped when reading results
+    vid_info["pose_window"] = (vid_info["frames"][0], vid_info["frames"][1] + 1)
+    return True
 
-        vid_info["target_path"] = add_suffix(vid_info, "_r")
-        vid_info["prep"].append("r")
 
-        resize_video(target_video, vid_info["target_path"], probe_info, width, height)
+def cut(vid_info: dict):
+    """Keep only frames in vid_info['pose_window'] (the task window), if set"""
+    if vid_info.get("pose_window"):
+        return utils.batch_func(lambda block, frames: block)
 
 
-def get_ffprobe_info(video_path):
-    """Extract video information using ffprobe"""
-    probe = ffmpeg.probe(video_path)
-    return next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
+def pose_offset(vid_info: dict) -> int:
+    """Frame number of the first pose estimated frame in the original video"""
+    return int(vid_info["pose_window"][0]) if vid_info.get("pose_window") else 0
 
 
-def resize_video(video_path, output_path, probe_info, width, height):
-    """Resize video resolution"""
-    video = ffmpeg.input(video_path)
-    # probe = ffmpeg.probe(video_path)
-    video.filter('scale', width=width, height=height).output(output_path, video_bitrate=probe_info['bit_rate']).run()
+def compose(funcs: list):
+    """Compose batch frame functions, applied from left to right"""
+    @utils.batch_func
+    def func(block, frames):
+        for f in funcs:
+            block = f(block, frames)
+        return block
+    return func
+
+
+def output_dim(probe: dict, prep: list) -> tuple:
+    """(width, height) of the preprocessed video"""
+    if "r" in prep:
+        return cfg.RESOLUTION['width'], cfg.RESOLUTION['height']
+    return probe['width'], probe['height']
+
+
+# --- functions for video resolution ---
+
+def resolution(probe: dict):
+    """Rescale frames if video resolution differs from config"""
+    width = cfg.RESOLUTION['width']
+    height = cfg.RESOLUTION['height']
+
+    if (probe['height'] != height) or (probe['width'] != width):
+        return utils.as_batch_func(
+            lambda x, count: cv2.resize(x, (width, height), interpolation=cv2.INTER_CUBIC))
 
 
 # -------
@@ -58,6 +128,9 @@ def map_video(
         fourcc: str = "mp4v",
         fps: int = 25,
         dim=(640, 480),
+        batch_size: int = 0,
+        n_workers: int = cfg.PREP_WORKERS,
+        window: tuple = None,
 ):
     """
     Map video with the given [func]
@@ -70,56 +143,58 @@ def map_video(
     video_out : str
         path to output video
 
-    func : (:: ndarray -> ndarray)
+    func : (:: ndarray -> ndarray) or batch function (see utils.batch_func)
         function to be mapped to each frame
 
+    batch_size : int
+        number of frames per block, 0 for the default of [func]
+
+    n_workers : int
+        number of worker threads, 0 to map serially
+
+    window : tuple[int]
+        [start, stop) frames to map
+
     """
+    if not utils.is_batch_func(func):
+        func = (lambda f: lambda frame, count: f(frame))(func)
 
-    try:
-        # initialize opencv
-        cap = cv2.VideoCapture(video_in)
-        fourcc = cv2.VideoWriter_fourcc(*fourcc)
-        writer = cv2.VideoWriter(video_out, fourcc, fps, dim)
-
-        # iterate each frame and apply function
-        while cap.isOpened():
-            ret, frame = cap.read()
-
-            if ret:
-                frame = func(frame)
-                writer.write(frame)
-            else:
-                break
-    except Exception as exc:
-        raise exc
-    # release file before terminating
-    finally:
-        try:
-            cap.release()
-            writer.release()
-        except NameError:
-            pass
-
-
-def lut(frame, lut_table):
-    return cv2.LUT(frame, lut_table)
+    utils.map_video(func, video_in, video_out, fourcc=fourcc, fps=fps, dim=dim,
+                    batch_size=batch_size, n_workers=n_workers, window=window)
 
 
-# brightness related functions
-# ---------------------------------------------------------
+def lut(frame, lut_table, out=None):
+    """Apply <lut_table> to a frame, or to a contiguous (N, H, W, C) block of frames in one call"""
+    src = frame.reshape(-1, *frame.shape[-2:])
+    dst = None if out is None else out.reshape(src.shape)
+    return cv2.LUT(src, lut_table, dst=dst).reshape(frame.shape)
+
 
-FRAME2READ = 5
+def lut_func(lut_table):
+    """Batch function applying <lut_table> in place"""
+    return utils.batch_func(lambda block, frames: lut(block, lut_table, out=block))
 
 
+# brightness related functions
+# ---------------------------------------------------------
+
 # functions for checking brightness
 def brightness_check(video: str):
-    return np.median(get_brightness(video)) <= cfg.B_THRESHOLD
+    return probed_brightness(video) <= cfg.B_THRESHOLD
+
+
+def probed_brightness(video: str) -> float:
+    """Sampled brightness of <video> (see utils.probe_video), raise ValueError if no frame could be read"""
+    value = probe_video(video)["brightness"]
+    if value is None:
+        raise ValueError(f"Unreadable video, no frame to sample brightness from: {video}")
+    return value
 
 
 def get_brightness(video: str):
     # read 1st frame
     cap = cv2.VideoCapture(video)
-    for _ in range(FRAME2READ):
+    for _ in range(cfg.FRAME2READ):
         ret, frame = cap.read()
         if not ret:
             break
@@ -131,23 +206,13 @@ def get_brightness(video: str):
     return dist
 
 
-def brightness(vid_info):
+def brightness(value: float):
     """
-    Bright preprocessing using gamma correction, if video brightness is too low
+    Bright preprocessing using gamma correction, if video brightness <value> is too low
     (set brightness threshold in config)
     """
-
-    target_video = vid_info["target_path"]
-
-    # only apply preprocessing if the average brightness is lower than threshold
-    if brightness_check(target_video):
-        logger.info(f"Increasing brightness for '{target_video}'...")
-
-        vid_info["target_path"] = add_suffix(vid_info, "_b")
-
-        gamma_correction(target_video, vid_info["target_path"], gamma=0.5)
-
-        vid_info["prep"].append("b")
+    if value <= cfg.B_THRESHOLD:
+        return lut_func(get_gamma_table(0.5))
 
 
 # functions for gamma correction
@@ -165,12 +230,12 @@ def gamma_correction(video_in: str, video_out: str, gamma: float = 0.5):
         os.remove(video_out)
 
     lut_table = get_gamma_table(gamma)
-    map_video(lambda x: lut(x, lut_table), video_in, video_out)
+    map_video(lut_func(lut_table), video_in, video_out)
 
 
 # ---------------------------------------------------------
 
-P_SUFFIX = ["_b.mp4", "_c.mp4"]  # possible preprocessed video suffix
+P_SUFFIX = ["_r.mp4", "_b.mp4", "_c.mp4"]  # possible preprocessed video suffix
 
 
 def is_preprocess(name):
@@ -191,6 +256,7 @@ def cut_video(vid_info):
     Cut video according to vid_info['time'] entry,
     """
 
+    from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
     logger.info(f"Cutting '{vid_info['target_path']}'...")
 
     # retrieve time info
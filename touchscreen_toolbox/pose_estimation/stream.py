@@ -0,0 +1,79 @@
+# Stream preprocessed frames straight into pose estimation,
+# without writing intermediate videos
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+import touchscreen_toolbox.utils as utils
+import touchscreen_toolbox.config as cfg
+from .preprocess import plan_preprocess, compose, pose_offset
+
+logger = logging.getLogger(__name__)
+
+SCORER = "DLC_stream"  # scorer name of streamed results
+
+
+def stream_analyze(vid_info: dict, estimator, source=None) -> None:
+    """
+    Pose estimate a video by feeding frames from <source> directly into <estimator>,
+    result is saved in DLC format to the DLC folder
+
+    Args
+    -------
+    vid_info: dict
+
+    estimator: (:: ndarray, (int, int) -> ndarray)
+        maps an (N, H, W, C) block of BGR frames [start, stop) to (N, keypoints, 3) array
+        of (x, y, likelihood), keypoints in cfg.MICE + cfg.REFE order (e.g. a PoseBackend)
+
+    source: (:: dict -> iterator)
+        frame source, yields (start, block) of frames to estimate,
+        default to the preprocessed frames of the video (see frame_source)
+    """
+
+    source = source or frame_source
+
+    poses = []
+    for start, block in source(vid_info):
+        poses.append(np.array(estimator(block, (start, start + len(block))), dtype=float))
+    poses = np.concatenate(poses) if poses else np.empty((0, len(cfg.MICE + cfg.REFE), 3))
+
+    save_pose(vid_info, poses, getattr(estimator, "scorer", SCORER))
+
+
+def frame_source(vid_info: dict, batch_size: int = cfg.BATCH_SIZE, n_workers: int = cfg.PREP_WORKERS):
+    """
+    Generator of (start, block) of preprocessed frames,
+    the transforms planned by preprocess are applied in memory
+    """
+    steps = plan_preprocess(vid_info)
+    vid_info["prep"] = [suffix for suffix, _ in steps]
+    vid_info["frame_offset"] = pose_offset(vid_info)
+
+    yield from utils.map_batches(compose([func for _, func in steps]), vid_info["path"], batch_size=batch_size,
+                                 n_workers=n_workers, window=vid_info.get("pose_window"))
+
+
+def save_pose(vid_info: dict, poses: np.ndarray, scorer: str = SCORER) -> None:
+    """Save (frames, keypoints, 3) pose array as DLC h5 (+ csv) in the DLC folder"""
+
+    file_name = os.path.join(cfg.DLC_FOLDER, vid_info["vid_name"] + scorer)
+    data = pose_to_dataframe(poses, scorer)
+
+    data.to_hdf(os.path.join(vid_info["dir"], file_name + ".h5"), key="df_with_missing", format="table", mode="w")
+    vid_info["files"] = [file_name + ".h5"]
+    if cfg.DLC_CSV:
+        data.to_csv(os.path.join(vid_info["dir"], file_name + ".csv"))
+        vid_info["files"].append(file_name + ".csv")
+
+    vid_info["dlc_result"] = file_name + ".h5"
+
+
+def pose_to_dataframe(poses: np.ndarray, scorer: str = SCORER) -> pd.DataFrame:
+    """Format pose array into DLC dataframe"""
+    columns = pd.MultiIndex.from_product(
+        [[scorer], cfg.MICE + cfg.REFE, ["x", "y", "likelihood"]],
+        names=["scorer", "bodyparts", "coords"]
+    )
+    return pd.DataFrame(poses.reshape(len(poses), -1), columns=columns)
@@ -0,0 +1,123 @@
+# Persistent pose estimation worker,
+# keeps the model loaded across a batch of videos
+
+import os
+import queue
+import logging
+import multiprocessing
+import touchscreen_toolbox.utils as utils
+import touchscreen_toolbox.video_info as video_info
+from .preprocess import set_pose_window
+from .stream import stream_analyze
+from .backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+
+class PoseWorker:
+    """
+    Long-lived pose estimation process(es), each loads the model once
+    then estimates videos from a shared queue
+
+    Args
+    -------
+    backend: str or type
+        name in BACKENDS or PoseBackend class, built & loaded in the worker process,
+        default to cfg.POSE_BACKEND; videos are streamed into backend.analyze_frames,
+        i.e. DeepLabCut-Live & the exported model for the DLC backend (see DLCBackend)
+
+    n_processes: int
+        number of worker processes, each holding its own model
+
+    timestamps: str
+        path to timestamps file, restrict pose estimation to the task window if given
+
+    Usage
+    -------
+    with PoseWorker(n_processes=2) as worker:
+        results = worker.map(videos)  # {video_path: dlc_result path or None if failed}
+
+    or submit / collect for (video_path, dlc_result, error) of each video, error is None or repr of the exception
+    """
+
+    def __init__(self, backend=None, n_processes: int = 1, timestamps: str = None):
+        ctx = multiprocessing.get_context("spawn")
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.pending = 0
+        self.processes = [
+            ctx.Process(target=serve, args=(backend, self.tasks, self.results, timestamps), daemon=True)
+            for _ in range(n_processes)
+        ]
+        for p in self.processes:
+            p.start()
+
+    def submit(self, video_path: str) -> None:
+        """Queue a video for pose estimation"""
+        self.tasks.put(video_path)
+        self.pending += 1
+
+    def collect(self):
+        """Generator of (video_path, dlc_result, error) for submitted videos, as they finish"""
+        while self.pending:
+            try:
+                item = self.results.get(timeout=1)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self.processes):
+                    raise RuntimeError("All pose workers exited with videos pending")
+                continue
+            self.pending -= 1
+            yield item
+
+    def map(self, video_paths: list) -> dict:
+        """Pose estimate <video_paths>, returns {video_path: dlc_result}"""
+        for video_path in video_paths:
+            self.submit(video_path)
+        return {video_path: result for video_path, result, _ in self.collect()}
+
+    def close(self) -> None:
+        """Stop workers after the queued videos are done"""
+        for _ in self.processes:
+            self.tasks.put(None)
+        for p in self.processes:
+            p.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def serve(backend, tasks, results, timestamps: str = None) -> None:
+    """
+    Worker loop, load the model once then estimate videos from <tasks> until None,
+    if the model fails to load every video is reported failed with the load error
+    """
+    utils.setup_logging()
+    try:
+        backend = get_backend(backend)
+        backend.load()
+        load_error = None
+    except Exception as err:
+        logger.exception(err)
+        load_error = repr(err)
+
+    for video_path in iter(tasks.get, None):
+        if load_error:
+            results.put((video_path, None, load_error))
+            continue
+        try:
+            vid_info = video_info.get_vid_info(video_path)
+            utils.initialize_folders(vid_info)
+            if not set_pose_window(vid_info, timestamps):
+                raise KeyError(f"Get time failed for {video_path}")
+
+            stream_analyze(vid_info, backend)
+            video_info.save_info(vid_info)
+            results.put((video_path, os.path.join(vid_info["dir"], vid_info["dlc_result"]), None))
+
+        except Exception as err:
+            logger.warning(f"\n\nException encountered for {video_path}")
+            logger.exception(err)
+            results.put((video_path, None, repr(err)))
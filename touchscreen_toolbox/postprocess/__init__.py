@@ -2,4 +2,5 @@ from .refine import *
 from .feature import *
 from .timestamp import *
 from .statistics import *
+from .chunked import *
 from .standardize import *
\ No newline at end of file
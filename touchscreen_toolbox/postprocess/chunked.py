@@ -0,0 +1,134 @@
+# Chunked postprocessing of long sessions, memory is O(chunk size) but for the reference coordinates
+
+import os
+import numpy as np
+import pandas as pd
+import touchscreen_toolbox.config as cfg
+from touchscreen_toolbox import video_info
+from touchscreen_toolbox.utils import PoseArray
+from touchscreen_toolbox.pose_estimation.dlc import pose_rows, read_pose_rows, count_rows
+from .refine import refine_array
+from .standardize import transform_points, fill_gaps
+from .feature import engineering
+from .timestamp import merge_task
+
+REFINE_MARGIN = 4  # overlapping rows for refine filters (median then savgol, window 5)
+REFINE_EDGE = 7  # rows at either end of the session for the savgol edge fit (over the last 5 medians)
+FEATURE_MARGIN = 2  # previous rows for feature velocities & accelerations
+
+
+def process_chunked(vid_info: dict, timestamps: str, chunk_size: int = cfg.CHUNK_SIZE, csv: bool = True) -> None:
+    """
+    Postprocess pose estimation result of a video in chunks of <chunk_size> frames,
+    same as refine_data -> standardize_data -> engineering -> merge -> save_data,
+    with the result saved chunk by chunk
+
+    Two passes over the pose estimation result:
+    1. reference medians over all frames & next valid coordinates after each chunk (for gap filling)
+    2. refine, standardize, engineer & merge each chunk, carrying the last valid coordinates
+        and the previous rows (for velocities) over to the next chunk
+
+    Memory is O(<chunk_size>), plus the reference coordinates of all frames kept for their exact medians
+    (8 bytes per reference keypoint per frame, e.g. ~4 MB for 1 hour at 25 fps with the 6 of cfg.REFE)
+    """
+    path = os.path.join(vid_info["dir"], vid_info["dlc_result"])
+    offset = vid_info.get("frame_offset", 0)
+    start, stop = pose_rows(vid_info.get("frames"), offset)
+    stop = count_rows(path) if stop is None else min(stop, count_rows(path))
+    keypoints = cfg.MICE + cfg.REFE
+
+    # 1st pass
+    medians, after = scan_pose(path, start, stop, offset, chunk_size)
+
+    # 2nd pass
+    before = (np.full(2 * len(keypoints), -1), np.full(2 * len(keypoints), np.nan))  # last valid (row, value)
+    previous = None  # previous standardized rows
+    for i, (lo, hi, points) in enumerate(refine_chunks(path, start, stop, offset, chunk_size)):
+
+        # standardize
+        transform_points(points, keypoints, medians)
+        values = points.reshape(len(points), -1)
+        valid = ~np.isnan(values)
+        next_valid = (after[i][0] - lo, transform_points(after[i][1], keypoints, medians).reshape(-1))
+        fill_gaps(values, before=before, after=next_valid)
+        before = carry_valid(before, valid, values, len(points))
+        np.round(points, cfg.DECIMALS, out=points)
+
+        # features, with previous rows for velocities
+        extended = points if previous is None else np.concatenate([previous, points])
+        margin = len(extended) - len(points)
+        previous = extended[-FEATURE_MARGIN:]
+        data = engineering(PoseArray(extended, keypoints, lo + offset - margin, vid_info.get("fps", cfg.FPS), points.dtype))
+
+        # task information, with trials counted from the 1st frame
+        task = merge_task(vid_info, pd.RangeIndex(lo + offset, hi + offset, name="frame"), timestamps, start + offset)
+        data = data.iloc[margin:].join(task, how='outer')
+        video_info.save_data(vid_info, data, csv=csv, append=i > 0)
+
+
+def chunks(start: int, stop: int, chunk_size: int):
+    """(lo, hi) rows of chunks in [start, stop)"""
+    for lo in range(start, stop, chunk_size):
+        yield lo, min(lo + chunk_size, stop)
+
+
+def refine_chunks(path: str, start: int, stop: int, offset: int, chunk_size: int):
+    """Generator of (lo, hi, refined (hi - lo, keypoints, 2) coordinates) of chunks of rows [start, stop)"""
+    for lo, hi in chunks(start, stop, chunk_size):
+        lo_ = max(start, min(lo - REFINE_MARGIN, stop - REFINE_EDGE))
+        hi_ = min(stop, max(hi + REFINE_MARGIN, start + REFINE_EDGE))
+        values = read_pose_rows(path, lo_, hi_, offset).to_numpy(copy=True)  # refined in place
+        points = refine_array(values).reshape(hi_ - lo_, -1, 2)
+        yield lo, hi, points[lo - lo_:hi - lo_].copy()
+
+
+def scan_pose(path: str, start: int, stop: int, offset: int, chunk_size: int):
+    """
+    1st pass of process_chunked
+
+    Returns
+    -------
+    medians: ndarray
+        (references, 2) medians of flipped reference coordinates
+
+    after: list[tuple]
+        for each chunk, (rows, (1, keypoints, 2) coordinates) of the next valid refined coordinates
+        of each keypoint after the chunk (stop, NaN if none)
+    """
+    keypoints = cfg.MICE + cfg.REFE
+    refe = [keypoints.index(k) for k in cfg.REFE]
+
+    references = np.empty((max(0, stop - start), len(refe), 2), dtype=cfg.POSE_DTYPE)  # O(frames)
+    firsts = []  # first valid (row, coordinates) in each chunk
+    for lo, hi, points in refine_chunks(path, start, stop, offset, chunk_size):
+        references[lo - start:hi - start] = points[:, refe]
+
+        valid = ~np.isnan(points).any(axis=-1)
+        first = np.where(valid.any(axis=0), valid.argmax(axis=0), len(points))
+        coordinates = np.full((1, len(keypoints), 2), np.nan, dtype=points.dtype)
+        coordinates[0, first < len(points)] = points[first[first < len(points)], np.flatnonzero(first < len(points))]
+        firsts.append((np.where(first < len(points), lo + first, stop), coordinates))
+
+    references[..., 1] *= -1
+    medians = np.nanmedian(references, axis=0)
+
+    # next valid coordinates after each chunk, scanning backwards
+    after = []
+    rows, coordinates = np.full(len(keypoints), stop), np.full((1, len(keypoints), 2), np.nan)
+    for first_rows, first_coordinates in firsts[::-1]:
+        after.append((rows, coordinates))
+        found = first_rows < stop
+        rows = np.where(found, first_rows, rows)
+        coordinates = np.where(found[None, :, None], first_coordinates, coordinates)
+    after = after[::-1]
+
+    # per column (x, y of each keypoint)
+    return medians, [(np.repeat(rows, 2), coordinates.astype(references.dtype)) for rows, coordinates in after]
+
+
+def carry_valid(before: tuple, valid: np.ndarray, values: np.ndarray, n: int) -> tuple:
+    """Last valid (row, value) of each column, relative to the next chunk, from a chunk of <n> rows"""
+    found = valid.any(axis=0)
+    last = n - 1 - valid[::-1].argmax(axis=0)
+    rows = np.where(found, last, before[0]) - n
+    return rows, np.where(found, values[last, np.arange(values.shape[1])], before[1])
@@ -10,134 +10,283 @@
 
 import numpy as np
 import pandas as pd
+from typing import Union
+from itertools import combinations
 from touchscreen_toolbox import utils
 from touchscreen_toolbox import config as cfg
+from touchscreen_toolbox.utils import PoseArray
 
+INTERNAL_KEYPOINTS = ("snout", "spine1", "spine2", "tail1")
+TARGETS = ("l_screen", "m_screen", "r_screen", "food_port")
 
-def engineering(data: pd.DataFrame) -> pd.DataFrame:
-    """Feature engineering (*hardcoded)"""
 
-    internal = internal_behaviour(data).set_index(data.index)
-    external = external_behaviour(data).set_index(data.index)
+def engineering(data: Union[pd.DataFrame, PoseArray], features: list = None) -> pd.DataFrame:
+    """
+    Feature engineering
 
-    data = pd.concat([multiindex_col(data, 'coordinate'),
-                      multiindex_col(internal, 'internal'),
-                      multiindex_col(external, 'external')], axis=1)
+    <features>: names of registered features and/or groups ('internal', 'external') to compute,
+    default to all; only their dependencies are computed
+    """
+    features = select_features(features)
+    values = compute(data, features)
 
-    return data.round(decimals=cfg.DECIMALS)
+    coordinates = data.to_dataframe() if isinstance(data, PoseArray) else data
+    data = pd.concat([multiindex_col(coordinates, 'coordinate'),
+                      multiindex_col(values, [FEATURES[f].group for f in features])], axis=1)
 
+    return utils.compact_dtypes(data.round(decimals=cfg.DECIMALS))
 
-def internal_behaviour(data: pd.DataFrame):
-    """Body configuration & movement"""
-    from itertools import combinations
-    new = pd.DataFrame()
 
-    keypoints = ("snout", "spine1", "spine2", "tail1")
+def internal_behaviour(data: Union[pd.DataFrame, PoseArray], out: np.ndarray = None):
+    """
+    Body configuration & movement
 
-    # body length
-    for pair in list(combinations(keypoints, 2)):
-        pair_name = '-'.join(pair)
-        new['d-' + pair_name] = get_distance(data, pair[0], pair[1])
-        new['v-' + pair_name] = velocity1(new, 'd-' + pair_name)
+    Columns: d, v for each pair of keypoints, ang, angv for each triplet, v, a for each keypoint
+    <out>: optional (frames, columns) buffer to write into
+    """
+    return compute(data, feature_names('internal'), out)
 
-    # body (relative) angle
-    for triplet in list(combinations(keypoints, 3)):
-        trip_name = '-'.join(triplet)
-        new['ang-' + trip_name] = utils.angle3(select_bodypart(data, triplet[0]),
-                                               select_bodypart(data, triplet[1]),
-                                               select_bodypart(data, triplet[2]))
-        new['angv-' + trip_name] = velocity1(new, 'ang-' + trip_name)
 
-    # velocity, acceleration
-    for point in keypoints:
-        new['v-' + point] = velocity2(data, point)
-        new['a-' + point] = velocity1(new, 'v-' + point)
+def external_behaviour(data: Union[pd.DataFrame, PoseArray], out: np.ndarray = None):
+    """
+    Behaviour relative to task stimuli
 
-    return new.round(decimals=cfg.DECIMALS)
+    Columns: head_ang, head_angv, then d, v, ang, angv for each target
+    <out>: optional (frames, columns) buffer to write into
+    """
+    return compute(data, feature_names('external'), out)
 
 
-def external_behaviour(data: pd.DataFrame):
-    """Behaviour relative to task stimuli"""
+# feature registry
+# ----------------
+class Feature:
+    """Node of the feature graph, computed as <func>(*<inputs>)"""
 
-    new = pd.DataFrame()
+    def __init__(self, name: str, func, inputs: tuple, group: str = None):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.group = group
 
-    # orientation
-    neck = (select_bodypart(data, 'spine1') + select_bodypart(data, 'lEar') + select_bodypart(data, 'rEar')) / 3
-    h_angle = utils.absangle(select_bodypart(data, 'snout'), neck)
-    new['head_ang'] = h_angle
-    new['head_angv'] = get_angv(h_angle)
 
-    #  relative to key points
-    for col in ("l_screen", "m_screen", "r_screen", "food_port"):
-        new_col = "snout-" + col
+FEATURES = {}  # name -> Feature, in order of registration (= order of output columns)
 
-        # distance & velocity
-        dist = get_distance(data, "snout", col).values
-        new["d-" + new_col] = dist
-        new["v-" + new_col] = np.diff(dist, prepend=dist[0])
 
-        # relative angle to the target (snout-neck-screen/port)
-        angle = utils.angle3(select_bodypart(data, 'snout'),
-                             neck,
-                             select_bodypart(data, col))
-        angle -= (angle > 180).astype(int) * 360  # -> [-180, 180]
-        new['ang-' + new_col] = angle
+def register(name: str, inputs: tuple, group: str = None):
+    """
+    Decorator registering a function as feature <name>, computed from <inputs>
+    (names of keypoints or other registered features)
 
-        # angular velocity relative to the target
-        angv = get_angv(angle)
+    Features with a <group> ('internal' / 'external') are (frames,) output columns,
+    the others are shared intermediates
+    """
+    def decorator(func):
+        FEATURES[name] = Feature(name, func, tuple(inputs), group)
+        return func
+    return decorator
 
-        # reverse the sign of angv if angle > 0
-        # so that a positive angv means getting closer to 0 degrees (orienting towards the target)
-        # negative means getting closer to (+/-)180 degrees (orienting away from the target)
-        angv = -angv * (angle > 0).astype(int) + angv * (angle < 0).astype(int)
-        new['angv-' + new_col] = angv
 
-    return new.round(decimals=cfg.DECIMALS)
+def feature_names(group: str = None) -> list:
+    """Names of output features (in <group>), in order of registration"""
+    return [f.name for f in FEATURES.values() if f.group and (group is None or f.group == group)]
 
 
-def multiindex_col(df: pd.DataFrame, name: str):
-    """Add a top layer index <name> to all columns in <df>"""
+def select_features(features: list = None) -> list:
+    """Output features from names / groups in <features> (default to all), in order of registration"""
+    if features is None:
+        return feature_names()
+
+    groups = {f.group for f in FEATURES.values() if f.group}
+    unknown = set(features) - set(feature_names()) - groups
+    if unknown:
+        raise KeyError(f"Unknown features {sorted(unknown)}")
+    return [f for f in feature_names() if f in features or FEATURES[f].group in features]
+
+
+def compute(data: Union[pd.DataFrame, PoseArray], features: list, out: np.ndarray = None) -> pd.DataFrame:
+    """
+    Compute <features> from keypoint coordinates in <data>,
+    every dependency is computed once and shared
+
+    <out>: optional (frames, features) buffer to write into
+    """
+    memo = {}
+
+    def evaluate(name):
+        if name not in memo:
+            if name in FEATURES:
+                feature = FEATURES[name]
+                memo[name] = feature.func(*[evaluate(i) for i in feature.inputs])
+            elif name in cfg.MICE + cfg.REFE:
+                memo[name] = select_bodypart(data, name)
+            else:
+                raise KeyError(f"Unknown feature '{name}'")
+        return memo[name]
+
+    columns = [evaluate(name) for name in features]
+    out = new_buffer(select_bodypart(data, 'snout'), len(features)) if out is None else out
+    for i, column in enumerate(columns):
+        out[:, i] = column
+
+    np.round(out, cfg.DECIMALS, out=out)
+    return pd.DataFrame(out, index=data.index, columns=features)
+
+
+def take(i: int):
+    """Feature function selecting column <i> of a batched intermediate"""
+    def func(values):
+        return values[:, i]
+    return func
+
+
+# features
+# --------
+def stack(*points):
+    """(frames, points, 2) array of keypoints"""
+    return np.stack(points, axis=1)
+
+
+def centroid(*points):
+    return sum(points) / len(points)
+
+
+def pair_distance(points):
+    """Distance between each pair of <points>"""
+    pairs = np.array(list(combinations(range(points.shape[1]), 2)))
+    return utils.batch_dist2(points[:, pairs[:, 1]], points[:, pairs[:, 0]])
+
+
+def triplet_angle(points):
+    """Angle of each triplet of <points>, taking the middle one as vertice"""
+    triplets = np.array(list(combinations(range(points.shape[1]), 3)))
+    return utils.angle3(points[:, triplets[:, 0]], points[:, triplets[:, 1]], points[:, triplets[:, 2]])
+
+
+def point_velocity(points):
+    return utils.batch_dist1(velocity(points))
+
+
+def target_distance(snout, targets):
+    return utils.batch_dist2(targets, snout[:, None])
+
+
+def target_angle(snout, neck, targets):
+    """Relative angle to the targets (snout-neck-screen/port), in [-180, 180]"""
+    angle = utils.angle3(snout[:, None], neck[:, None], targets)
+    np.subtract(angle, 360, out=angle, where=angle > 180)
+    return angle
+
+
+def target_angv(angle):
+    """
+    Angular velocity relative to the targets
+
+    reverse the sign of angv if angle > 0
+    so that a positive angv means getting closer to 0 degrees (orienting towards the target)
+    negative means getting closer to (+/-)180 degrees (orienting away from the target)
+    """
+    angv = get_angv(angle)
+    angv *= np.subtract(angle < 0, angle > 0, dtype=angv.dtype)
+    return angv
+
+
+def multiindex_col(df: pd.DataFrame, name: Union[str, list]):
+    """Add a top layer index <name> (or one name per column) to all columns in <df>"""
     df = df.copy()
-    multi_index_level_0 = [name for _col in df.columns]
+    multi_index_level_0 = [name for _col in df.columns] if isinstance(name, str) else name
     multi_index = [multi_index_level_0, df.columns.values]
     df.columns = pd.MultiIndex.from_arrays(multi_index)
-    return df.convert_dtypes()
+    return df
 
 
 # helpers
 # -------
-def get_distance(data: pd.DataFrame, pt1: str, pt2: str):
+def new_buffer(points: np.ndarray, n_columns: int) -> np.ndarray:
+    """Empty (frames, n_columns) buffer of floats for features of <points>"""
+    return np.empty((len(points), n_columns), dtype=np.result_type(points.dtype, np.float32))
+
+
+def get_distance(data: Union[pd.DataFrame, PoseArray], pt1: str, pt2: str):
     """Distance between a pair of keypoints"""
-    dx = data[pt1 + "_x"] - data[pt2 + "_x"]
-    dy = data[pt1 + "_y"] - data[pt2 + "_y"]
-    return np.sqrt(dx ** 2 + dy ** 2)
+    return utils.batch_dist2(select_bodypart(data, pt2), select_bodypart(data, pt1))
+
+
+def velocity(x: np.ndarray, out: np.ndarray = None):
+    """Difference to the previous frame along axis 0 (0 for the 1st frame)"""
+    out = np.empty_like(x) if out is None else out
+    np.subtract(x[1:], x[:-1], out=out[1:])
+    np.subtract(x[:1], x[:1], out=out[:1])
+    return out
 
 
 def velocity1(data: pd.DataFrame, col: str):
     """1D Velocity of scalar values (from distance)"""
-    return np.diff(data[col], prepend=data[col].iloc[0])
+    return velocity(np.asarray(data[col]))
 
 
-def velocity2(data: pd.DataFrame, col: str):
+def velocity2(data: Union[pd.DataFrame, PoseArray], col: str):
     """2D Velocity of vector values (from coordinates)"""
-    dx = np.diff(data[col + "_x"], prepend=data[col + "_x"].iloc[0])
-    dy = np.diff(data[col + "_y"], prepend=data[col + "_y"].iloc[0])
-    return np.sqrt(dx ** 2 + dy ** 2)
+    return utils.batch_dist1(velocity(select_bodypart(data, col)))
 
 
-def select_bodypart(data, bodypart):
+def select_bodypart(data: Union[pd.DataFrame, PoseArray], bodypart: str):
     """Index bodypart coordinates as 2d array"""
+    if isinstance(data, PoseArray):
+        return data[bodypart]
     return data[[bodypart + '_x', bodypart + '_y']].values
 
 
-def get_angv(angles: pd.DataFrame):
-    """Continuous angular velocity"""
+def get_angv(angles: np.ndarray, out: np.ndarray = None):
+    """Continuous angular velocity, along axis 0"""
 
     # raw velocity
     # range ~ [-360, 360]
-    angv = np.diff(angles, prepend=angles[0])
+    angv = velocity(angles, out=out)
 
     # continuous velocity
     # if angv is outside [-180,180], plus/minus 360 to map into [-180,180]
-    angv -= (np.abs(angv) > 180).astype(int) * 360 * ((angv > 0).astype(int) * 2 - 1)
+    wrap = np.abs(angv) > 180
+    angv[wrap] -= 360 * np.sign(angv[wrap])
     return angv
+
+
+# registry
+# --------
+def register_default_features():
+    """Register the default features (and their intermediates)"""
+
+    # shared intermediates
+    register("body", INTERNAL_KEYPOINTS)(stack)
+    register("neck", ("spine1", "lEar", "rEar"))(centroid)
+    register("targets", TARGETS)(stack)
+    register("body_length", ("body",))(pair_distance)
+    register("body_length_v", ("body_length",))(velocity)
+    register("body_angle", ("body",))(triplet_angle)
+    register("body_angv", ("body_angle",))(velocity)
+    register("body_v", ("body",))(point_velocity)
+    register("body_a", ("body_v",))(velocity)
+    register("target_d", ("snout", "targets"))(target_distance)
+    register("target_v", ("target_d",))(velocity)
+    register("target_ang", ("snout", "neck", "targets"))(target_angle)
+    register("target_angv", ("target_ang",))(target_angv)
+
+    # internal: body configuration & movement
+    for i, pair in enumerate(combinations(INTERNAL_KEYPOINTS, 2)):
+        register('d-' + '-'.join(pair), ("body_length",), "internal")(take(i))
+        register('v-' + '-'.join(pair), ("body_length_v",), "internal")(take(i))
+    for i, triplet in enumerate(combinations(INTERNAL_KEYPOINTS, 3)):
+        register('ang-' + '-'.join(triplet), ("body_angle",), "internal")(take(i))
+        register('angv-' + '-'.join(triplet), ("body_angv",), "internal")(take(i))
+    for i, point in enumerate(INTERNAL_KEYPOINTS):
+        register('v-' + point, ("body_v",), "internal")(take(i))
+        register('a-' + point, ("body_a",), "internal")(take(i))
+
+    # external: behaviour relative to task stimuli
+    register("head_ang", ("snout", "neck"), "external")(utils.absangle)
+    register("head_angv", ("head_ang",), "external")(get_angv)
+    for i, target in enumerate(TARGETS):
+        for prefix, batched in (('d-', "target_d"), ('v-', "target_v"), ('ang-', "target_ang"), ('angv-', "target_angv")):
+            register(prefix + 'snout-' + target, (batched,), "external")(take(i))
+
+
+register_default_features()
@@ -1,68 +1,102 @@
 import numpy as np
 import pandas as pd
-import scipy.signal
 
 import touchscreen_toolbox.config as cfg
+from typing import Union
+from touchscreen_toolbox.utils import lazy_import, PoseArray
+
+signal = lazy_import("scipy.signal")
 
 
 # prediction refinement
 # ----------------------------------------------
-def refine_data(data: pd.DataFrame) -> pd.DataFrame:
-    """Refine pose estimation data"""
-    data = data.copy()
-    data = cutoff(data)
-    data = data.drop(columns=cfg.CCOLS)
-    data = median_filter(data)
-    data = savgol_filter(data)
-    return data
+def refine_data(data: Union[pd.DataFrame, PoseArray]) -> Union[pd.DataFrame, PoseArray]:
+    """Refine pose estimation data, (x, y, confidence) -> (x, y)"""
+    if isinstance(data, PoseArray):
+        values = refine_array(data.values.reshape(len(data), -1).copy())
+        return data.replace(values.reshape(len(data), -1, 2))
 
+    columns = [c for c in data.columns if c not in cfg.CCOLS]
+    values = refine_array(data.to_numpy(copy=True))
+    return pd.DataFrame(values, index=data.index, columns=columns)
 
-def cutoff(data: pd.DataFrame, p_cutoff: float = cfg.P_CUTOFF):
+
+def refine_array(values: np.ndarray, p_cutoff: float = cfg.P_CUTOFF, window_len: int = 5) -> np.ndarray:
     """
-    Drop low confidence prediction
+    Refine (frames, keypoints * 3) array of (x, y, confidence), modified in place,
+    returns (frames, keypoints * 2) array of (x, y)
     """
+    values = cutoff_array(values, p_cutoff)
+    values = values.reshape(len(values), -1, 3)[:, :, :2].reshape(len(values), -1)
+    values = median_array(values, window_len)
+    return savgol_array(values, window_len)
 
-    data = data.copy()
-
-    # iterate columns in group of three (x, y, confidence) for each body part
-    for i in range(0, data.shape[1], 3):
-        idx = np.where(data.iloc[:, i + 2] < p_cutoff)
-        data.iloc[idx, i] = np.NaN
-        data.iloc[idx, i + 1] = np.NaN
 
-    return data
+def cutoff(data: pd.DataFrame, p_cutoff: float = cfg.P_CUTOFF):
+    """
+    Drop low confidence prediction
+    """
+    return data.__class__(cutoff_array(data.to_numpy(copy=True), p_cutoff), index=data.index, columns=data.columns)
 
 
 def median_filter(data: pd.DataFrame, window_len: int = 5):
     """
     Apply sliding median filter to all columns in <df>
     """
+    return data.__class__(median_array(data.to_numpy(), window_len), index=data.index, columns=data.columns)
+
 
-    data = data.copy()
+def savgol_filter(data: pd.DataFrame, window_len: int = 5, polyorder: int = 1, deriv=0, delta=1.0) -> pd.DataFrame:
+    """
+    Smooth trajectory with Savitzky-Golay filter
+    """
+    return data.__class__(savgol_array(data.to_numpy(), window_len, polyorder, deriv, delta),
+                          index=data.index, columns=data.columns)
 
-    # apply filter to each column
-    # keep NaN
-    for i in range(data.shape[1]):
-        idx = np.where(np.isnan(data.iloc[:, i]))
-        data.iloc[:, i] = (
-            data.iloc[:, i]
-            .rolling(window_len, min_periods=1, center=True)
-            .median(skipna=False)
-        )
-        data.iloc[idx, i] = np.NaN
 
-    return data
+# array kernels
+# ----------------------------------------------
+def cutoff_array(values: np.ndarray, p_cutoff: float = cfg.P_CUTOFF) -> np.ndarray:
+    """Set (x, y) to NaN where confidence < <p_cutoff>, on (frames, keypoints * 3) array in place"""
+    points = values.reshape(len(values), -1, 3)
+    points[..., :2][points[..., 2] < p_cutoff] = np.nan
+    return values
 
 
-def savgol_filter(data: pd.DataFrame, window_len: int = 5, polyorder: int = 1, deriv=0, delta=1.0) -> pd.DataFrame:
+def median_array(values: np.ndarray, window_len: int = 5) -> np.ndarray:
     """
-    Smooth trajectory with Savitzky-Golay filter
+    Centered sliding median along axis 0 of 2D array, ignoring NaN in windows (truncated at the edges),
+    original NaN are kept
     """
+    left = window_len // 2
+    padded = np.full((len(values) + window_len - 1, values.shape[1]), np.nan, dtype=values.dtype)
+    padded[left:left + len(values)] = values
+
+    # sort windows (NaN last) and average the middle pair of valid values
+    windows = np.sort(np.lib.stride_tricks.sliding_window_view(padded, window_len, axis=0), axis=-1)
+    n_valid = window_len - np.isnan(windows).sum(axis=-1, keepdims=True)
+    medians = (np.take_along_axis(windows, (n_valid - 1) // 2, axis=-1)
+               + np.take_along_axis(windows, n_valid // 2, axis=-1))[..., 0] / 2
 
-    data = data.copy()
+    medians[np.isnan(values)] = np.nan
+    return medians
 
-    for i in range(data.shape[1]):
-        data.iloc[:, i] = scipy.signal.savgol_filter(data.iloc[:, i], window_len, polyorder=polyorder, deriv=deriv,
-                                                     delta=delta)
 
-    return data
+def savgol_array(values: np.ndarray, window_len: int = 5, polyorder: int = 1, deriv=0, delta=1.0) -> np.ndarray:
+    """
+    Savitzky-Golay filter along axis 0 of 2D array,
+    outputs with NaN in their window (the first / last window at the edges) are NaN
+    """
+    nan = np.isnan(values)
+    if not nan.any():
+        return signal.savgol_filter(values, window_len, polyorder=polyorder, deriv=deriv, delta=delta, axis=0)
+
+    # scipy >= 1.17 rejects NaN in the edge fits, NaN are propagated explicitly instead
+    smoothed = signal.savgol_filter(np.where(nan, 0, values), window_len,
+                                    polyorder=polyorder, deriv=deriv, delta=delta, axis=0)
+    half = window_len // 2
+    windows = np.lib.stride_tricks.sliding_window_view(nan, window_len, axis=0).any(axis=-1)
+    spoiled = np.concatenate([np.repeat(windows[:1], half, axis=0), windows,
+                              np.repeat(windows[-1:], half, axis=0)])
+    smoothed[spoiled] = np.nan
+    return smoothed
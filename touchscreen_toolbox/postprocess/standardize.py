@@ -2,86 +2,62 @@ import numpy as np
 import pandas as pd
 import touchscreen_toolbox.config as cfg
 import touchscreen_toolbox.utils as utils
+from typing import Union
+from touchscreen_toolbox.utils import PoseArray
 
 
 
-def standardize_data(data: pd.DataFrame) -> pd.DataFrame:
+def standardize_data(data: Union[pd.DataFrame, PoseArray]) -> Union[pd.DataFrame, PoseArray]:
     """Standardize pose estimation data"""
-    
-    data = data.copy()
-    
-    # flip
-    data[cfg.YCOLS] *= -1
-
-    data = replace_w_median(data, cfg.REFE)
-    data = set_origin(data, "food_port")
-
-    # apply transformation (rotate + scale)
-    adj = data["m_screen_y"].iloc[0]
-    opp = data["m_screen_x"].iloc[0]
-    hyp = utils.dist1((adj, opp))
-    transformer = L_transformer(
-        cos=(adj / hyp), sin=(opp / hyp), scale=(cfg.TRAY_WIDTH / hyp)                      #### <- 
-    )
-    for xcol, ycol in zip(cfg.XCOLS, cfg.YCOLS):
-        data[[xcol, ycol]] = transformer.transform(data[[xcol, ycol]].values)
-    
-    data = fillna(data)
-    
-    return data.round(decimals=cfg.DECIMALS)
+    if isinstance(data, PoseArray):
+        return data.replace(standardize_array(data.values[..., :2].copy(), data.keypoints))
 
+    # (frames, keypoints, 2) buffer, transformed in place
+    points = data[cfg.XYCOLS].to_numpy(copy=True).reshape(len(data), -1, 2)
+    points = standardize_array(points)
 
-# corner version
-# def standardize_data(data: pd.DataFrame) -> None:
-#     """Standardize pose estimation data"""
+    return pd.DataFrame(points.reshape(len(data), -1), index=data.index, columns=cfg.XYCOLS)
 
-#     data = data.copy()
 
-#     # flip
-#     data[cfg.YCOLS] *= -1
-
-#     data = replace_w_median(data, cfg.REFE)
-#     data = set_origin(data, "ll_corner")
-
-#     # apply transformation (rotate + scale)
-#     adj = data["lr_corner_x"].iloc[0]
-#     opp = -data["lr_corner_y"].iloc[0]
-#     hyp = utils.dist1((adj, opp))
-#     transformer = L_transformer(
-#         cos=(adj / hyp), sin=(opp / hyp), scale=(cfg.TRAY_LENGTH / hyp)
-#     )
-#     for xcol, ycol in zip(cfg.XCOLS, cfg.YCOLS):
-#         data[[xcol, ycol]] = transformer.transform(data[[xcol, ycol]].values)
-
-#     data = fillna(data)
+def standardize_array(points: np.ndarray, keypoints: tuple = cfg.MICE + cfg.REFE) -> np.ndarray:
+    """
+    Standardize (frames, keypoints, 2) coordinates in place:
+    flip, fix references at their medians, then translate, rotate and scale in one pass
+    so that food port is the origin and mid screen is at (0, TRAY_WIDTH); then fillna + round
+    """
+    transform_points(points, keypoints)
+    fill_gaps(points.reshape(len(points), -1))
 
-#     return data.round(decimals=cfg.DECIMALS)
+    return np.round(points, cfg.DECIMALS, out=points)
 
 
+def transform_points(points: np.ndarray, keypoints: tuple = cfg.MICE + cfg.REFE, medians: np.ndarray = None):
+    """
+    Flip, fix references and transform (frames, keypoints, 2) coordinates in place (see standardize_array)
 
-def replace_w_median(data: pd.DataFrame, columns: list):
-    """Replace the values in <columns> with its median value"""
-    data = data.copy()
-    
-    for col in columns:
-        data[col + "_x"] = data[col + "_x"].median()
-        data[col + "_y"] = data[col + "_y"].median()
-    return data
+    <medians>: (references, 2) medians of flipped reference coordinates in cfg.REFE order,
+    default to the medians over <points>
+    """
 
+    # flip
+    points[..., 1] *= -1
 
-def set_origin(data: pd.DataFrame, col: str):
-    """Set the [col] as origin for all coordinates"""
-    
-    data = data.copy()
-    
-    x_adjustment = data[col + "_x"].iloc[0]
-    y_adjustment = data[col + "_y"].iloc[0]
+    # references
+    refe = [keypoints.index(k) for k in cfg.REFE]
+    if medians is None:
+        medians = np.nanmedian(points[:, refe], axis=0)
+    points[:, refe] = medians = np.asarray(medians, dtype=points.dtype)
 
-    for col in cfg.XCOLS:
-        data[col] -= x_adjustment
-    for col in cfg.YCOLS:
-        data[col] -= y_adjustment
-    return data
+    # transformation (translate + rotate + scale)
+    origin = medians[cfg.REFE.index("food_port")]
+    opp, adj = medians[cfg.REFE.index("m_screen")] - origin
+    hyp = utils.dist1((adj, opp))
+    transformer = L_transformer(
+        cos=(adj / hyp), sin=(opp / hyp), scale=(cfg.TRAY_WIDTH / hyp)
+    )
+    points -= origin
+    points[...] = transformer.transform(points)
+    return points
 
 
 class L_transformer:
@@ -92,60 +68,53 @@ class L_transformer:
         self.rotation = np.array([[cos, -sin], [sin, cos]])
 
     def transform(self, x):
-        return np.dot(self.rotation, x.T).T * self.scale
+        """Transform (..., 2) array of points"""
+        return np.matmul(x, self.rotation.T) * self.scale
+
 
+def fillna(data: pd.DataFrame, max_gap: int = None):
+    """
+    Replace NaNs with step-average of neighbouring prediction,
+    leading/trailing NaNs are filled with the first/last prediction
 
-def fillna(data: pd.DataFrame):
+    Gaps longer than <max_gap> frames are left as NaN
     """
-    Replace NaNs with step-average of neighbouring prediction
+    return pd.DataFrame(fill_gaps(data.to_numpy(copy=True), max_gap), index=data.index, columns=data.columns)
+
+
+def fill_gaps(values: np.ndarray, max_gap: int = None, before: tuple = None, after: tuple = None) -> np.ndarray:
     """
+    Fill NaN gaps along axis 0 of 2D array in place (see fillna)
 
-    data = data.copy()
-
-    for col_name in data:
-        col = data[col_name]
-
-        # index of missing values
-        idx = col[col.isnull()].index
-
-        if idx.any():
-
-            # group consecutive index
-            temp = [idx[0]]
-            groups = []
-            for i in idx[1:]:
-                # add to temp list if the element is consecutive
-                if i - temp[-1] == 1:
-                    temp.append(i)
-                # if the element is not consecutive,
-                # complete the current group and reset temp list
-                else:
-                    groups.append(temp)
-                    temp = [i]
-            groups.append(temp)
-
-            # fillNaN progressively, using average step of next-prev value
-            out_of_bound = False
-            for group in groups:
-                try:
-                    pre = col[(group[0] - 1)]  # previous non-empty value
-                    nex = col[(group[-1] + 1)]  # next non-empty value
-                    steps = len(group)
-                    step = (nex - pre) / steps  # step value
-
-                    for i in group:
-                        pre += step
-                        col[i] = pre
-
-                # happens when the 1st/last element is NaN so there's no
-                # preceding/following value to fill
-                except KeyError:
-                    out_of_bound = True
-                    continue
-
-            # fill remaining value if error occurred
-            if out_of_bound:
-                col.fillna(method="bfill", inplace=True)
-                col.fillna(method="ffill", inplace=True)
-
-    return data
+    A gap of L frames between <pre> and <nex> is filled with pre + k * (nex - pre) / L, k = 1..L
+
+    <before>, <after>: (rows, values) of the last / next valid value of each column outside <values>
+    (NaN if none, rows relative to the 1st row of <values>), for filling <values> in chunks
+    """
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+
+    # previous / next valid row of every element
+    n, m = values.shape
+    before = before or (np.full(m, -1), np.full(m, np.nan))
+    after = after or (np.full(m, n), np.full(m, np.nan))
+    rows = np.arange(n)[:, None]
+    prev = np.maximum.accumulate(np.where(missing, before[0], rows), axis=0)
+    nex = np.minimum.accumulate(np.where(missing, after[0], rows)[::-1], axis=0)[::-1]
+
+    r, c = np.nonzero(missing)
+    p, q = prev[r, c], nex[r, c]
+    if max_gap is not None:
+        short = q - p - 1 <= max_gap
+        r, c, p, q = r[short], c[short], p[short], q[short]
+
+    pre = np.where(p >= 0, values[np.clip(p, 0, n - 1), c], np.asarray(before[1], dtype=values.dtype)[c])
+    post = np.where(q < n, values[np.clip(q, 0, n - 1), c], np.asarray(after[1], dtype=values.dtype)[c])
+    has_pre, has_nex = ~np.isnan(pre), ~np.isnan(post)
+
+    values[r, c] = np.where(
+        has_pre & has_nex, pre + (r - p) * ((post - pre) / (q - p - 1)),
+        np.where(has_nex, post, pre)  # NaN stays if the whole column is NaN
+    )
+    return values
@@ -3,6 +3,7 @@ import pandas as pd
 from itertools import groupby
 from touchscreen_toolbox import utils
 from touchscreen_toolbox import video_info
+from touchscreen_toolbox import catalog
 import touchscreen_toolbox.config as cfg
 from touchscreen_toolbox.pose_estimation.dlc import read_dlc_csv
 
@@ -39,11 +40,7 @@ def record_stats(folder_path: str):
     # format headers
     values = [cfg.HEAD1, cfg.HEAD2]
 
-    info_folder = os.path.join(folder_path, cfg.INF_FOLDER)
-    for file in utils.listdir(info_folder):
-
-        # get analyze output for the video
-        vid_info = video_info.load_info(os.path.join(info_folder, file))
+    for vid_info in list_infos(folder_path):
 
         # get data
         info = video_info.export_info(vid_info)
@@ -59,3 +56,15 @@ def record_stats(folder_path: str):
     pd.DataFrame(values).to_csv(save_path, index=False, header=False)
 
     logger.info(f"Recorded statistics for {folder_path}")
+
+
+def list_infos(folder_path: str, rescan: bool = False) -> list:
+    """
+    Saved vid_info of videos in <folder_path>, from the project catalog if cataloged
+    (after an incremental scan, see catalog.videos), else the INFO folder
+    """
+    if catalog.find_catalog(folder_path):
+        return [row['info'] for row in catalog.videos(folder_path, rescan=rescan, dir=os.path.abspath(folder_path))]
+
+    info_folder = os.path.join(folder_path, cfg.INF_FOLDER)
+    return [video_info.load_info(os.path.join(info_folder, file)) for file in utils.listdir(info_folder)]
@@ -1,99 +1,114 @@
 # functions for merging timestamp into behaviour data
-import h5py
 import numpy as np
 import pandas as pd
 import touchscreen_toolbox.config as cfg
+from touchscreen_toolbox.utils import lazy_import, compact_dtypes, timestamp_session
 from .feature import multiindex_col
 
+h5py = lazy_import("h5py")
+
 state_mapping = {1: 1, 2: 1, 3: 2, 4: 2, 5: 2, 6: 3, 7: 4, 8: 5, 9: 6, 0: 0, 10: 0, 99: 0}
+TRACE_REDUCERS = {'mean': np.add, 'min': np.minimum, 'max': np.maximum}  # see resample_trace
 
 
 def merge(vid_info, data, timestamp_file):
     """Merge information from touchscreen to pose estimation data"""
+    return data.join(merge_task(vid_info, data.index, timestamp_file), how='outer')
+
+
+def merge_task(vid_info, index: pd.Index, timestamp_file, first: int = None) -> pd.DataFrame:
+    """
+    Task information from touchscreen for frames in <index>, under top level column 'task',
+    trials are counted from frame <first> (default the 1st of <index>, see align_task)
+    """
     
     mouse_id = vid_info['mouse_id']
     exp_date = vid_info['exp_date']
     h5path = f"{mouse_id}/{exp_date}"
     
-    data2 = pd.DataFrame(data.index)
+    # states, trials & attributes from the shared index, only the window of trace is read from h5
+    session = timestamp_session(timestamp_file, mouse_id, exp_date)
+    frames = np.asarray(index)
+    fs, start_cut = session['attrs']['fs'][0], session['attrs']['DA_start'][0]
+    start, stop = trace_window((frames.min(), frames.max()), fs, start_cut, vid_info['fps'],
+                               session['trace_length']) if len(frames) else (0, 0)
     with h5py.File(timestamp_file, 'r') as ts:
-        data2 = merge_attrs(data2, ts, mouse_id)
-        data2 = merge_states(data2, ts, h5path, vid_info['fps'])
-        data2 = merge_trials(data2, ts, h5path)
-        data2 = merge_trace(data2, ts, h5path, vid_info['fps'])
+        trace = np.transpose(np.array(ts[h5path + '/trace'][..., start:stop], dtype=float))
+    trace = resample_trace(trace, fs, start_cut, vid_info['fps'], offset=start)
+    data2 = align_task(frames, session, trace, vid_info['fps'], first)
         
-    data2 = multiindex_col(data2, 'task')
-    return pd.concat([data, data2], axis=1)
-
-
-def merge_attrs(data: pd.DataFrame, ts: h5py._hl.files.File, mouse_id: str):
-    """Add mouse attributes (knockout, male) to dataframe"""
-    attrs = dict(ts[mouse_id].attrs)
-    for a in attrs.keys():
-        data[a] = attrs[a][0]
-    return data
+    return compact_dtypes(multiindex_col(data2, 'task'))
 
 
-def merge_states(data: pd.DataFrame, ts: h5py._hl.files.File, path: str, fps: float):
-    """Merge state timestamp"""
-    
-    # retrieve state dataframe
-    states = pd.DataFrame(np.transpose(ts[path + '/states']), columns=ts[path + '/states'].attrs['headers']).convert_dtypes()
+def align_task(frames: np.ndarray, session: dict, trace: pd.DataFrame, fps: float, first: int = None) -> pd.DataFrame:
+    """
+    Align mouse attributes, states, trials of an indexed <session> & frame indexed photometry <trace>
+    (see utils.timestamp_session) to <frames> in a single pass,
+    as left joins on sorted keys (no hash merges):
+    states are joined by frame (rows repeated for frames with several states),
+    trials by trial number & trace by frame, through searchsorted on the sorted keys
+
+    Trials are counted from states at frame <first> (default the 1st of <frames>), so that consecutive
+    chunks of frames, each aligned with the same <first>, give the same result as all frames at once
+    """
     
-    # align starting time, with buffer
+    # states, sorted by frame (stable, to keep the order of states within a frame)
+    states = pd.DataFrame(session['states'], columns=session['state_headers'])
     states['frame'] = (states['time'] * fps).astype(int)
     states = states.drop('time', axis=1)
-
     increment_duplicates(states, 'frame')
-    states = states.set_index('frame')
-    merged = data.reset_index().merge(states, how='left', on='frame')
-    merged = merged.set_index('frame')
-    merged['state_'] = merged['state'].fillna(method='ffill')
-
-    # simplify state_ (###harcoded###)
-    merged['state_'] = merged['state_'].replace(state_mapping).fillna(0)
-
-    ##############
-    # TODO
-    # fix this
-    try:
-        merged.drop('index', axis=1, inplace=True)
-    except:
-        pass
-
-    # count trial numbers
-    merged = count_trials(merged)
-    merged = merged.fillna(np.nan)
-
-    return merged.convert_dtypes()
-
-
-def count_trials(data: pd.DataFrame):
-    """Count trial number"""
+    state_frames = states.pop('frame').to_numpy()
+    order = np.argsort(state_frames, kind='stable')
+
+    # 1 row per matching state, or 1 row without state
+    lo = np.searchsorted(state_frames[order], frames, side='left')
+    hi = np.searchsorted(state_frames[order], frames, side='right')
+    counts = np.maximum(hi - lo, 1)
+    rows = np.repeat(np.arange(len(frames)), counts)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    matched = np.repeat(hi > lo, counts)
+    pos = np.full(len(rows), -1)
+    pos[matched] = order[np.repeat(lo, counts)[matched] + within[matched]]
+
+    # states between <first> & the 1st frame, carried over
+    carried = np.empty(0)
+    if len(frames):
+        first = frames[0] if first is None else first
+        before = (state_frames[order] >= first) & (state_frames[order] < frames[0])
+        carried = states['state'].to_numpy()[order[before]]
+
+    merged = pd.DataFrame(index=pd.Index(frames[rows], name='frame'))
+    for a, value in session['mouse_attrs'].items():
+        merged[a] = value[0]
+    merged[states.columns] = take_rows(states, pos).to_numpy()
+    last_state = carried[-1] if len(carried) else np.nan
+    merged['state_'] = merged['state'].ffill().fillna(last_state).replace(state_mapping).fillna(0)
+    merged = count_trials(merged, int((carried == 1).sum()))
+
+    # trials, by trial number
+    trials = process_trials(pd.DataFrame(session['trials'], columns=session['trial_headers']))
+    pos = lookup(trials['trial'].to_numpy(), merged['trial'].to_numpy())
+    trials = take_rows(trials.drop('trial', axis=1), pos).ffill()
+
+    # photometry trace, by frame
+    trace = take_rows(trace, lookup(trace.index.to_numpy(), merged.index.to_numpy()))
+
+    trials.index = trace.index = merged.index
+    return pd.concat([merged, trials, trace], axis=1)
+
+
+def count_trials(data: pd.DataFrame, started: int = 0):
+    """Count trial number, after <started> trials (e.g. in previous chunks)"""
     data = data.copy()
-    data['trial'] = np.nan
-    idxs = data.index[data['state'].fillna(0) == 1]
-    for idx, i in zip(idxs, np.arange(len(idxs))):
-        data.loc[idx, 'trial'] = i + 1
-    data.loc[:, 'trial'] = data['trial'].fillna(method='ffill')
+    start = (data['state'].fillna(0) == 1).to_numpy()
+    trial = pd.Series(np.where(start, started + np.cumsum(start), np.nan), index=data.index)
+    if not data.index.is_unique:
+        # rows of a duplicated frame share the number of the last trial started in them
+        trial = trial.groupby(level=0, sort=False).transform('max')
+    data['trial'] = trial.ffill().fillna(started or np.nan)
     return data
 
 
-def merge_trials(data: pd.DataFrame, ts: h5py._hl.files.File, path: str):
-    """Merge trial information (reward probability etc.)"""
-    
-    # retrieve trials data
-    trials = pd.DataFrame(np.transpose(ts[path + '/trials']), columns=ts[path + '/trials'].attrs['headers']).convert_dtypes()
-    
-    trials = process_trials(trials)
-    merged = data.reset_index().merge(trials, how='left', on='trial')
-    merged = merged.set_index('frame')
-    for col in trials.columns:
-        merged[col] = merged[col].fillna(method='ffill')
-
-    return merged
-
-
 def process_trials(data: pd.DataFrame) -> pd.DataFrame:
     data = data.astype(float)
     data['P_contrast'] = data['P_left'] - data['P_right']
@@ -109,29 +124,26 @@ def process_trials(data: pd.DataFrame) -> pd.DataFrame:
 
     data.drop(['right_response', 'P_left', 'P_right', 'prev_response'], axis=1, inplace=True)
 
-    return data.convert_dtypes()
+    return data
 
 
 def consecutive_reward(data: pd.DataFrame) -> pd.DataFrame:
     # consecutive reward / loss
-    cons_reward = 0
-    ls_cons_reward = []
-    ls_unexpectation = []
-
-    for reward in data['reward']:
-        unexpectation = 0
-        if cons_reward >= 0 and reward:
-            cons_reward += 1
-        elif cons_reward <= 0 and not reward:
-            cons_reward -= 1
-        else:
-            cons_reward = 1 if reward else -1
-            unexpectation = -ls_cons_reward[-1]
-        ls_cons_reward.append(cons_reward)
-        ls_unexpectation.append(unexpectation)
-
-    data['cons_reward'] = ls_cons_reward
-    data['unexpectation'] = ls_unexpectation
+    # runs of rewards count up 1, 2, ..., runs of losses count down -1, -2, ...
+    # unexpectation is minus the length of the previous run, at the 1st trial of each run
+    reward = (data['reward'] != 0).to_numpy()
+    start = np.ones(len(reward), dtype=bool)
+    start[1:] = reward[1:] != reward[:-1]
+
+    run_starts = np.flatnonzero(start)
+    position = np.arange(len(reward)) - run_starts[np.cumsum(start) - 1] + 1
+    cons_reward = np.where(reward, position, -position)
+
+    unexpectation = np.zeros(len(reward), dtype=cons_reward.dtype)
+    unexpectation[run_starts[1:]] = -cons_reward[run_starts[1:] - 1]
+
+    data['cons_reward'] = cons_reward
+    data['unexpectation'] = unexpectation
     
     return data
 
@@ -185,29 +197,10 @@ def get_session_type(df: pd.DataFrame) -> pd.DataFrame:
 
 # DA trace related
 # ------
-def merge_trace(data: pd.DataFrame, ts: h5py._hl.files.File, path: str, fps: int):
-    """Merge trial information (reward probability etc.)"""
-    
-    # retrieve trace data
-    trace = np.array(ts[path + '/trace'], dtype=float)
-    exp_attrs = dict(ts[path].attrs)
-    fs = exp_attrs.get('fs')[0]                # photometry sampling rate
-    start_cut = exp_attrs.get('DA_start')[0]   # photometry start time (in secs, aligned with start of video)
-    
-    # prune data to align with video frames
-    trace = prune_trace(trace, fs, start_cut, fps=fps)
-    
-    # merge
-    merged = data.reset_index().merge(trace, how='left', on='frame')
-    merged = merged.set_index('frame')
-
-    return merged
-
-
 def prune_trace(trace: np.ndarray, fs: float, start_cut: float, fps: int) -> pd.DataFrame:
     """
     Match sampling rate of photometry recording to video frame per second, 
-    by pruning excess data points
+    by pruning excess data points (keeping the 1st sample of each frame, see resample_trace)
     * photometry fs must > video fps for this function to work
     
     Args
@@ -229,38 +222,91 @@ def prune_trace(trace: np.ndarray, fs: float, start_cut: float, fps: int) -> pd.
     trace: pd.DataFrame
         dataframe with index representing video frame number, and a single column representing photometry value
     """
+    return resample_trace(trace, fs, start_cut, fps, how='first')
+
+
+def resample_trace(trace: np.ndarray, fs: float, start_cut: float, fps: float,
+                   how: str = cfg.TRACE_RESAMPLE, offset: int = 0) -> pd.DataFrame:
+    """
+    Resample photometry trace to video frames, by reducing the samples of each frame
+    * photometry fs must > video fps for this function to work
     
-    assert fps < fs, "Photometry fs must be larger than video fps"
+    Args
+    ------
+    trace: np.ndarray
+        (samples,) photometry signal or (samples, channels) signals across time
     
-    # create index for the trace array
-    # each increment represent 1/fs sec in time
-    idx = np.arange(0, len(trace))
+    fs, start_cut, fps:
+        see prune_trace
     
-    # convert index to actual time
-    idx = idx / fs + start_cut
+    how: str
+        reduction of the samples in a frame, 'first' / 'mean' / 'min' / 'max'
     
-    # convert to frame (dependent on video fps)
-    idx = (idx * fps).round().astype(int)
-
-    # remove duplicates
-    val, idx = np.unique(idx, return_index=True)
+    offset: int
+        sample number of the 1st sample in <trace>, if only a window is read (see trace_window)
+        
+    Returns
+    -----
+    trace: pd.DataFrame
+        dataframe indexed by video frame number, column 'DA' (or 'DA_<channel>' for multiple channels)
+    """
+    
+    assert fps < fs, "Photometry fs must be larger than video fps"
     
-    # combine to create dataframe
-    # index: frame
-    # 'DA': trace value
-    trace = pd.DataFrame(trace[idx], index=val, columns=['DA'])
-    trace.index.name = 'frame'
+    # frame of each sample, each sample is 1/fs sec after the previous
+    frames = ((np.arange(offset, offset + len(trace)) / fs + start_cut) * fps).round().astype(int)
     
-    return trace.convert_dtypes()
+    # samples of a frame are consecutive, reduce between the 1st samples of frames
+    starts = np.flatnonzero(np.diff(frames, prepend=frames[:1] - 1))
+    if how == 'first':
+        values = trace[starts]
+    elif how in TRACE_REDUCERS:
+        values = TRACE_REDUCERS[how].reduceat(trace, starts, axis=0) if len(trace) else trace[:0]
+        if how == 'mean':
+            values = values / np.diff(starts, append=len(trace)).reshape((-1,) + (1,) * (trace.ndim - 1))
+    else:
+        raise ValueError(f"Invalid resampling '{how}'")
+    
+    values = values.reshape(len(starts), int(np.prod(trace.shape[1:])))
+    columns = ['DA'] if values.shape[1] == 1 else [f'DA_{i}' for i in range(values.shape[1])]
+    return pd.DataFrame(values, index=pd.Index(frames[starts], name='frame'), columns=columns)
+
+
+def trace_window(frames: tuple, fs: float, start_cut: float, fps: float, length: int) -> tuple:
+    """Samples [start, stop) of a trace of <length> samples, covering all samples of frames[0] to frames[1]"""
+    start = int(np.floor(((frames[0] - 0.5) / fps - start_cut) * fs)) - 1
+    stop = int(np.ceil(((frames[1] + 0.5) / fps - start_cut) * fs)) + 2
+    return min(max(start, 0), length), min(max(stop, 0), length)
 
 
 
 # helper
 # ------
+def lookup(keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Positions of <values> in sorted unique <keys>, -1 where not found"""
+    pos = np.searchsorted(keys, values)
+    found = pos < len(keys)
+    found[found] = keys[pos[found]] == values[found]
+    return np.where(found, pos, -1)
+
+
+def take_rows(df: pd.DataFrame, pos: np.ndarray) -> pd.DataFrame:
+    """Rows of <df> at positions <pos>, NaN rows for -1"""
+    return df.reset_index(drop=True).reindex(pos)
+
+
 def increment_duplicates(df: pd.DataFrame, col: str):
-    """Remove duplicates by incrementing the latter by 1"""
-    col = df.columns.get_loc(col)
-    for i in range(1, len(df)):
-        prev, curr = df.iloc[[i - 1, i], col]
-        if curr <= prev:
-            df.iloc[i, col] = curr + 1
+    """
+    Remove duplicates by incrementing the latter by 1,
+    a value is incremented if it is not larger than the (incremented) previous value
+    """
+    values = df[col].to_numpy()
+    if len(values) < 2:
+        return
+
+    # incremented iff diff <= previous increment, i.e. diff <= 0 always, diff >= 2 never,
+    # diff == 1 carries over the previous increment
+    diff = np.diff(values)
+    increment = pd.Series(np.where(diff <= 0, 1.0, np.where(diff >= 2, 0.0, np.nan)))
+    increment = np.concatenate([[0], increment.ffill().fillna(0).to_numpy(dtype=values.dtype)])
+    df[col] = values + increment
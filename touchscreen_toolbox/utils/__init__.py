@@ -1,3 +1,9 @@
 from .io import *
+from .log import *
+from .lazy import *
 from .video import *
+from .pose_array import *
+from .dtypes import *
+from .cache import *
+from .timestamps import *
 from .arithmetic import *
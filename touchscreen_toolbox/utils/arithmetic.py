@@ -31,39 +31,58 @@ def dist2(point1, point2):
     return np.linalg.norm(point2 - point1, ord=2)
 
 
+def batch_dist1(points, out=None):
+    """Euclidean distances from the origin of (..., 2) <points>, along the last axis"""
+    points = np.asarray(points)
+    return np.sqrt(np.add(points[..., 0] ** 2, points[..., 1] ** 2, out=out), out=out)
+
+
+def batch_dist2(points1, points2, out=None):
+    """Euclidean distances between (..., 2) <points1> & <points2>, along the last axis"""
+    return batch_dist1(np.subtract(points2, points1), out=out)
+
+
 # angles
 # ------
+# points / vectors are (..., 2) arrays, broadcast against each other
+
+
 def convert_angles(angles, radians: bool):
-    """Convert range of angles from [-pi, pi] to [0, 2pi] + optional degree conversion"""
-    angles += (angles < 0).astype(int) * 2 * pi
+    """
+    Convert range of angles from [-pi, pi] to [0, 2pi] + optional degree conversion,
+    in place for writable float arrays (a converted copy otherwise, e.g. for scalars)
+    """
+    if not (isinstance(angles, np.ndarray) and angles.dtype.kind == "f" and angles.flags.writeable):
+        angles = np.array(angles, dtype=float)
+    np.add(angles, 2 * pi, out=angles, where=angles < 0)
     if not radians:
         angles *= 180 / pi
-    return angles
+    return angles if angles.ndim else angles[()]
 
 
-def angle1(v, radians=False):
+def angle1(v, radians=False, out=None):
     """Angle between vector <v> and horizontal axis"""
-    angles = np.arctan2(v[:, 1], v[:, 0])
+    angles = np.arctan2(v[..., 1], v[..., 0], out=out)
     return convert_angles(angles, radians)
 
 
-def angle2(v, u, radians=False):
+def angle2(v, u, radians=False, out=None):
     """Relative angle between two vectors <v> & <u> with respect to the origin"""
-    angles = np.arctan2(u[:, 1], u[:, 0]) - np.arctan2(v[:, 1], v[:, 0])
+    angles = np.subtract(np.arctan2(u[..., 1], u[..., 0]), np.arctan2(v[..., 1], v[..., 0]), out=out)
     return convert_angles(angles, radians)
 
 
-def angle3(pts1, pts2, pts3, radians=False):
+def angle3(pts1, pts2, pts3, radians=False, out=None):
     """Relative angle between three points, taking <pts2> as vertice"""
     pts1 = pts1 - pts2
     pts3 = pts3 - pts2
-    return angle2(pts1, pts3, radians=radians)
+    return angle2(pts1, pts3, radians=radians, out=out)
 
 
-def absangle(v, u, radians=False):
+def absangle(v, u, radians=False, out=None):
     """Absolute angle, defined as the angle between pt1, pt2, horizontal axis"""
     w = v - u
-    angles = np.arctan2(w[:, 1], w[:, 0])
+    angles = np.arctan2(w[..., 1], w[..., 0], out=out)
     return convert_angles(angles, radians)
 
 
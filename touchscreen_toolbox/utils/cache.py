@@ -0,0 +1,160 @@
+# Content-addressed on-disk cache of pipeline stage outputs
+
+import os
+import glob
+import json
+import hashlib
+import logging
+import importlib
+import numpy as np
+import pandas as pd
+from .pose_array import PoseArray
+
+__all__ = ["file_hash", "source_hash", "stage_key", "run_stages", "cache_path", "save_cache",
+           "save_npz", "load_npz"]
+
+logger = logging.getLogger(__name__)
+
+_file_hashes = {}  # (path, size, mtime) -> hash, for files shared by many videos (e.g. timestamps)
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """Hash of file content"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                h.update(block)
+        _file_hashes[memo_key] = h.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def source_hash(modules: tuple) -> str:
+    """Hash of the source code of <modules> (names)"""
+    h = hashlib.sha1()
+    for name in modules:
+        with open(importlib.import_module(name).__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def stage_key(name: str, upstream: str, config: dict, modules: tuple) -> str:
+    """Key of a stage output, hashed from the key of its input, config values and code"""
+    content = json.dumps([name, upstream, config, source_hash(modules)], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def run_stages(stages: list, key: str, folder: str, prefix: str = "") -> object:
+    """
+    Run a pipeline of <stages>, resuming from the last stage with cached output
+
+    Args
+    -------
+    stages: list[tuple]
+        (name, func, config, modules) of each stage; func maps the previous output to the stage output
+        (the 1st takes None), config is a dict of config values and modules the names of modules
+        whose code the output depends on
+
+    key: str
+        key of the pipeline input, e.g. file_hash of the input file
+
+    folder: str
+        cache folder, each stage output (PoseArray or DataFrame, see save_npz) is saved as
+        <prefix>.<name>.<key>.npz replacing outputs of the stage under other keys
+
+    Returns
+    -------
+    output of the last stage
+    """
+    keys = []
+    for name, _, config, modules in stages:
+        key = stage_key(name, key, config, modules)
+        keys.append(key)
+
+    # resume from the last cached stage
+    start, value = 0, None
+    for i in reversed(range(len(stages))):
+        path = cache_path(folder, prefix, stages[i][0], keys[i])
+        if os.path.exists(path):
+            try:
+                start, value = i + 1, load_npz(path)
+                logger.debug(f"Loaded cached {stages[i][0]}")
+                break
+            except (OSError, ValueError, KeyError):
+                logger.warning(f"Invalid cache {path}")
+
+    for (name, func, _, _), key in zip(stages[start:], keys[start:]):
+        value = func(value)
+        save_cache(value, folder, prefix, name, key)
+
+    return value
+
+
+def cache_path(folder: str, prefix: str, name: str, key: str) -> str:
+    return os.path.join(folder, f"{prefix}.{name}.{key[:20]}.npz")
+
+
+def save_cache(value, folder: str, prefix: str, name: str, key: str) -> None:
+    """Save stage output atomically, then remove outputs of the stage under other keys"""
+    os.makedirs(folder, exist_ok=True)
+    path = cache_path(folder, prefix, name, key)
+    temp = path + f".{os.getpid()}.tmp"
+    try:
+        save_npz(value, temp)
+    except TypeError as err:
+        logger.warning(f"Not caching {name}: {err}")
+        return
+    os.replace(temp, path)
+
+    for old in glob.glob(cache_path(glob.escape(folder), glob.escape(prefix), name, "*")):
+        if old != path:
+            os.remove(old)
+
+
+def save_npz(value, path: str) -> None:
+    """
+    Save a PoseArray or DataFrame to an npz file, as plain arrays (no pickled objects):
+    DataFrame columns are saved one array each, categoricals as codes with their categories
+    """
+    if isinstance(value, PoseArray):
+        meta = {"type": "PoseArray", "keypoints": value.keypoints, "offset": value.offset, "fps": value.fps}
+        arrays = {"values": value.values}
+    elif isinstance(value, pd.DataFrame):
+        meta = {"type": "DataFrame", "columns": value.columns.tolist(), "column_names": value.columns.names,
+                "index_name": value.index.name, "categories": {}}
+        arrays = {"index": value.index.to_numpy()}
+        for i, (_, col) in enumerate(value.items()):
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                meta["categories"][i] = col.cat.categories.tolist()
+                arrays[f"c{i}"] = col.cat.codes.to_numpy()
+            else:
+                arrays[f"c{i}"] = col.to_numpy()
+    else:
+        raise TypeError(f"Unsupported type {type(value).__name__}")
+
+    with open(path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_npz(path: str):
+    """Load a PoseArray or DataFrame saved by save_npz, raise ValueError if it holds pickled objects"""
+    with np.load(path, allow_pickle=False) as f:
+        meta = json.loads(f["meta"][()])
+        if meta["type"] == "PoseArray":
+            return PoseArray(f["values"], meta["keypoints"], meta["offset"], meta["fps"], f["values"].dtype)
+
+        columns = [tuple(c) if isinstance(c, list) else c for c in meta["columns"]]
+        index = pd.Index(f["index"], name=meta["index_name"])
+        data = {}
+        for i in range(len(columns)):
+            values = f[f"c{i}"]
+            if str(i) in meta["categories"]:
+                values = pd.Categorical.from_codes(values, meta["categories"][str(i)])
+            data[i] = values
+
+    data = pd.DataFrame(data, index=index, copy=False)
+    data.columns = pd.MultiIndex.from_tuples(columns, names=meta["column_names"]) \
+        if columns and isinstance(columns[0], tuple) else pd.Index(columns, name=meta["column_names"][0])
+    return data
@@ -0,0 +1,45 @@
+# Compact dtypes for results
+
+import numpy as np
+import pandas as pd
+import touchscreen_toolbox.config as cfg
+
+__all__ = ["compact_dtypes", "infer_dtype"]
+
+
+def compact_dtypes(data: pd.DataFrame, schema: dict = None) -> pd.DataFrame:
+    """
+    Cast columns of <data> to compact numpy dtypes, instead of nullable extension dtypes
+
+    Columns named in <schema> (default cfg.SCHEMA, by column name or top level of multiindex columns)
+    are cast to the given dtype, or (dtype, sentinel) with NaN replaced by the sentinel,
+    so results have the same dtypes in every session / chunk; the others are inferred:
+        strings -> category
+        integer values without NaN -> smallest fitting type in cfg.INT_DTYPES
+        other numbers -> cfg.FLOAT_DTYPE
+    """
+    schema = cfg.SCHEMA if schema is None else schema
+    dtypes, fills = {}, {}
+    for col in data.columns:
+        names = [col, col[0], col[-1]] if isinstance(col, tuple) else [col]
+        dtype = next((schema[n] for n in names if n in schema), None)
+        if isinstance(dtype, tuple):
+            dtype, fills[col] = dtype
+        dtypes[col] = dtype or infer_dtype(data[col])
+    if fills:
+        data = data.fillna(fills)
+    return data.astype(dtypes)
+
+
+def infer_dtype(series: pd.Series):
+    """Compact dtype for values in <series> (see compact_dtypes)"""
+    if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series.dtype):
+        return "category"
+
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    if len(values) and np.isfinite(values).all() and (values == np.round(values)).all():
+        for dtype in cfg.INT_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= values.min() and values.max() <= info.max:
+                return dtype
+    return cfg.FLOAT_DTYPE
@@ -1,4 +1,5 @@
 import os
+import glob
 import json
 import shutil
 import logging
@@ -51,6 +52,7 @@ def is_generated(folder_path):
         cfg.DLC_FOLDER,
         cfg.RST_FOLDER,
         cfg.INF_FOLDER,
+        cfg.CACHE_FOLDER,
     ]
 
 
@@ -0,0 +1,34 @@
+import sys
+import importlib.util
+
+__all__ = ["lazy_import", "MissingModule"]
+
+
+def lazy_import(name: str):
+    """
+    Module <name>, imported on first attribute access,
+    keeps heavy dependencies (cv2, h5py, scipy) out of package import time
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return MissingModule(name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class MissingModule:
+    """Placeholder of a module that is not installed, raises when used"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError(f"No module named '{self.name}'")
@@ -0,0 +1,34 @@
+import os
+import sys
+import logging
+
+__all__ = ["setup_logging"]
+
+
+def setup_logging(log_dir: str = ".") -> logging.Logger:
+    """
+    Log to stdout, and to log.log & err.log (warnings) in <log_dir>,
+    called by the analysis entry points rather than at import
+    """
+    logger = logging.getLogger("touchscreen_toolbox")
+    if logger.handlers:  # already set up in this process
+        return logger
+
+    logger.setLevel(logging.DEBUG)
+
+    file_handler = logging.FileHandler(filename=os.path.join(log_dir, "log.log"))
+    erro_handler = logging.FileHandler(filename=os.path.join(log_dir, "err.log"))
+    erro_handler.setLevel(30)
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setLevel(10)
+
+    formatter = logging.Formatter("%(asctime)s : %(levelname)s : %(name)s : %(message)s")
+    file_handler.setFormatter(formatter)
+    erro_handler.setFormatter(formatter)
+
+    logger.addHandler(file_handler)
+    logger.addHandler(erro_handler)
+    logger.addHandler(stdout_handler)
+
+    logger.debug("Initialized")
+    return logger
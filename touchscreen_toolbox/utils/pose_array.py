@@ -0,0 +1,88 @@
+# Compact container of pose estimation data for postprocessing
+
+import numpy as np
+import pandas as pd
+import touchscreen_toolbox.config as cfg
+
+__all__ = ["PoseArray", "SUFFIXES"]
+
+SUFFIXES = ("_x", "_y", "_cfd")
+
+
+class PoseArray:
+    """
+    Contiguous (frames, keypoints, channels) array of keypoint coordinates,
+    channels are (x, y, confidence) or (x, y)
+
+    Args
+    -------
+    values: ndarray
+        (frames, keypoints, channels) array, stored as cfg.POSE_DTYPE
+
+    keypoints: tuple[str]
+        keypoint names, in order of axis 1
+
+    offset: int
+        frame number of the 1st row
+
+    fps: float
+        frame rate of the video
+    """
+
+    def __init__(self, values: np.ndarray, keypoints: tuple = tuple(cfg.MICE + cfg.REFE),
+                 offset: int = 0, fps: float = cfg.FPS, dtype=cfg.POSE_DTYPE):
+        self.values = np.ascontiguousarray(values, dtype=dtype)
+        self.keypoints = tuple(keypoints)
+        self.offset = int(offset)
+        self.fps = fps
+
+        if self.values.ndim != 3 or self.values.shape[1] != len(self.keypoints):
+            raise ValueError(f"Expected (frames, {len(self.keypoints)}, channels) array, got {self.values.shape}")
+
+    @classmethod
+    def from_dataframe(cls, data: pd.DataFrame, keypoints: tuple = None, fps: float = cfg.FPS, dtype=cfg.POSE_DTYPE):
+        """
+        From DataFrame with columns <keypoint>_x, <keypoint>_y (, <keypoint>_cfd) and continuous frame index,
+        <keypoints> default to all of cfg.MICE + cfg.REFE found in <data>
+        """
+        keypoints = keypoints or [k for k in cfg.MICE + cfg.REFE if k + "_x" in data.columns]
+        suffixes = SUFFIXES if keypoints[0] + "_cfd" in data.columns else SUFFIXES[:2]
+        columns = [k + s for k in keypoints for s in suffixes]
+
+        values = data[columns].to_numpy(dtype=dtype).reshape(len(data), len(keypoints), len(suffixes))
+        offset = data.index[0] if len(data) else 0
+        return cls(values, keypoints, offset, fps, dtype)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """To DataFrame with columns <keypoint>_x, <keypoint>_y (, <keypoint>_cfd) indexed by frame"""
+        return pd.DataFrame(self.values.reshape(len(self), -1), index=self.index, columns=self.columns)
+
+    def replace(self, values: np.ndarray):
+        """New PoseArray of <values> with the same keypoints, offset & fps"""
+        return self.__class__(values, self.keypoints, self.offset, self.fps, values.dtype)
+
+    def copy(self):
+        return self.replace(self.values.copy())
+
+    @property
+    def index(self) -> pd.RangeIndex:
+        return pd.RangeIndex(self.offset, self.offset + len(self), name="frame")
+
+    @property
+    def columns(self) -> list:
+        return [k + s for k in self.keypoints for s in SUFFIXES[:self.values.shape[2]]]
+
+    def loc(self, keypoint: str) -> int:
+        """Position of <keypoint> in axis 1"""
+        return self.keypoints.index(keypoint)
+
+    def __getitem__(self, keypoint: str) -> np.ndarray:
+        """(frames, 2) view of <keypoint> coordinates"""
+        return self.values[:, self.loc(keypoint), :2]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return f"PoseArray(frames={self.offset}..{self.offset + len(self)}, keypoints={len(self.keypoints)}, " \
+               f"channels={self.values.shape[2]}, dtype={self.values.dtype})"
@@ -0,0 +1,128 @@
+# Index of the timestamps h5, built once and shared through a sidecar file
+
+import os
+import hashlib
+import logging
+import tempfile
+import numpy as np
+import touchscreen_toolbox.config as cfg
+from .lazy import lazy_import
+
+__all__ = ["timestamp_session", "timestamp_index", "build_timestamp_index", "read_session"]
+
+h5py = lazy_import("h5py")
+logger = logging.getLogger(__name__)
+
+_ts_indexes = {}  # in-process memo, timestamps path -> ((size, mtime_ns) of the indexed h5, index path)
+_ts_sessions = {}  # in-process memo, (timestamps path, (size, mtime_ns), session key) -> session
+
+
+def timestamp_session(timestamps: str, mouse_id: str, exp_date: str) -> dict:
+    """
+    Indexed session of <mouse_id> on <exp_date> from <timestamps>, raise KeyError if not found
+
+    Only the group of the session is read from the index sidecar (see timestamp_index)
+
+    Returns
+    -------
+    session: dict
+        mouse_attrs, attrs (session attributes, e.g. task_start, fs, DA_start),
+        states & trials ((n, columns) arrays) with their headers,
+        end (time of the last state) and trace_length
+    """
+    path = os.path.abspath(timestamps)
+    index_path = timestamp_index(path)
+    key = (path, _ts_indexes[path][0], f"{mouse_id}/{exp_date}")
+    if key not in _ts_sessions:
+        _ts_sessions[key] = read_session(index_path, key[-1])
+    return _ts_sessions[key]
+
+
+def timestamp_index(timestamps: str) -> str:
+    """
+    Path of the index of the <timestamps> h5, a hidden h5 sidecar next to it without the photometry traces
+    (in the temporary folder if that is read only), built once (e.g. before starting workers)
+    and rebuilt when the h5 changes (size / mtime)
+    """
+    path = os.path.abspath(timestamps)
+    stat = os.stat(path)
+    source = (stat.st_size, stat.st_mtime_ns)
+    if _ts_indexes.get(path, (None,))[0] == source:
+        return _ts_indexes[path][1]
+
+    for index_path in _ts_index_paths(path):
+        if _index_source(index_path) == source:
+            break
+        try:
+            build_timestamp_index(path, index_path, source)
+            break
+        except OSError as err:
+            logger.warning(f"Failed to write timestamp index {index_path}: {err}")
+    else:
+        raise OSError(f"No writable location for the index of {path}")
+
+    _ts_indexes[path] = (source, index_path)
+    return index_path
+
+
+def build_timestamp_index(timestamps: str, index_path: str, source: tuple) -> None:
+    """
+    Copy everything but the photometry traces of the <timestamps> h5 (<mouse_id>/<exp_date> groups)
+    to <index_path>, with attributes, states & trials transposed to (n, columns), replaced atomically
+    """
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with h5py.File(timestamps, "r") as f, h5py.File(temp_path, "w") as index:
+        for mouse_id, mouse in f.items():
+            if not isinstance(mouse, h5py.Group):
+                continue
+            mouse_index = index.create_group(mouse_id)
+            mouse_index.attrs.update(mouse.attrs)
+
+            for exp_date, group in mouse.items():
+                if not isinstance(group, h5py.Group):
+                    continue
+                session = mouse_index.create_group(exp_date)
+                session.attrs.update(group.attrs)
+
+                for name in ("states", "trials"):
+                    if name in group:
+                        dataset = session.create_dataset(name, data=np.transpose(group[name]))
+                        dataset.attrs["headers"] = group[name].attrs["headers"]
+                if "trace" in group:
+                    session["trace_length"] = group["trace"].shape[-1]  # (channels,) samples
+
+        index.attrs["source"] = source
+    os.replace(temp_path, index_path)
+    logger.info(f"Indexed timestamps {timestamps}")
+
+
+def read_session(index_path: str, key: str) -> dict:
+    """Session <key> ('<mouse_id>/<exp_date>') from the index at <index_path>, see timestamp_session"""
+    with h5py.File(index_path, "r") as index:
+        group = index[key]
+        session = {"mouse_attrs": dict(group.parent.attrs), "attrs": dict(group.attrs)}
+        for name in ("states", "trials"):
+            if name in group:
+                session[name] = group[name][()]
+                session[name[:-1] + "_headers"] = group[name].attrs["headers"]
+        if "states" in session and session["states"].size:
+            session["end"] = float(session["states"][-1, -1])
+        if "trace_length" in group:
+            session["trace_length"] = int(group["trace_length"][()])
+    return session
+
+
+def _ts_index_paths(path: str) -> tuple:
+    """Candidate locations of the index of <path>, next to it or in the temporary folder"""
+    name = "." + os.path.basename(path) + cfg.TS_INDEX
+    return (os.path.join(os.path.dirname(path), name),
+            os.path.join(tempfile.gettempdir(), hashlib.md5(path.encode()).hexdigest()[:8] + name))
+
+
+def _index_source(index_path: str) -> tuple:
+    """(size, mtime_ns) of the h5 indexed at <index_path>, None if not found / unreadable"""
+    try:
+        with h5py.File(index_path, "r") as index:
+            return tuple(int(i) for i in index.attrs["source"])
+    except (OSError, KeyError):
+        return None
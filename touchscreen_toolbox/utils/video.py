@@ -1,4 +1,12 @@
-import cv2
+import os
+import json
+import logging
+import numpy as np
+import touchscreen_toolbox.config as cfg
+from .lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+logger = logging.getLogger(__name__)
 
 
 def map_video(
@@ -8,6 +16,10 @@ def map_video(
         fourcc: str = "mp4v",
         fps: int = 25,
         dim=(640, 480),
+        batch_size: int = 0,
+        n_workers: int = 0,
+        queue_size: int = None,
+        window: tuple = None,
 ):
     """
     Map video with the given [func]
@@ -20,37 +32,257 @@ def map_video(
     video_out : str
         path to output video
 
-    func : (:: ndarray -> ndarray)
-        function to be mapped to each frame
+    func : (:: ndarray, int -> ndarray) or batch function (see batch_func)
+        function to be mapped to each frame, with the frame number
+
+    batch_size : int
+        number of frames per block passed to [func], 0 to map frame by frame
+        (or in blocks of cfg.BATCH_SIZE for batch functions)
+
+    n_workers : int
+        number of worker threads, 0 maps frames serially in the calling thread
+
+    queue_size : int
+        maximum number of blocks in flight for the threaded pipeline
+
+    window : tuple[int]
+        [start, stop) frames to map, only these frames are written
 
     """
 
+    # initialize opencv
+    fourcc = cv2.VideoWriter_fourcc(*fourcc)
+    writer = cv2.VideoWriter(video_out, fourcc, fps, dim)
+
+    if not batch_size:
+        batch_size = cfg.BATCH_SIZE if is_batch_func(func) else 1
+
+    # iterate each block and apply function
     try:
-        # initialize opencv
-        cap = cv2.VideoCapture(video_in)
-        fourcc = cv2.VideoWriter_fourcc(*fourcc)
-        writer = cv2.VideoWriter(video_out, fourcc, fps, dim)
-
-        # iterate each frame and apply function
-        count = 0
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                frame = func(frame, count)
+        for _, block in map_batches(func, video_in, batch_size=batch_size, n_workers=n_workers,
+                                    queue_size=queue_size, window=window):
+            for frame in block:
                 writer.write(frame)
-            else:
-                break
-            count += 1
-
-    except Exception as exc:
-        raise exc
 
     # release file before terminating
     finally:
-        cap.release()
         writer.release()
 
 
+def map_frames(func, video_in: str, n_workers: int = 0, queue_size: int = None):
+    """
+    Generator of frames from <video_in> mapped with [func], in frame order
+
+    * frame buffers are reused, a yielded frame is only valid until the next one
+    """
+    for _, block in map_batches(func, video_in, batch_size=1, n_workers=n_workers, queue_size=queue_size):
+        yield block[0]
+
+
+def map_batches(
+        func,
+        video_in: str,
+        batch_size: int = cfg.BATCH_SIZE,
+        n_workers: int = 0,
+        queue_size: int = None,
+        window: tuple = None,
+):
+    """
+    Generator of (start, block) from <video_in> mapped with [func], in frame order
+
+    <block> is an (N, H, W, C) array of frames [start, start + N),
+    decoded into a preallocated buffer that is reused,
+    so a yielded block is only valid until the next one
+
+    With <n_workers> > 0 blocks are decoded in a separate thread and mapped by
+    a pool of worker threads, connected by a bounded queue of <queue_size> blocks
+
+    With <window> = (start, stop) only frames [start, stop) are decoded,
+    frame numbers stay aligned with the whole video
+    """
+    func = as_batch_func(func)
+
+    if n_workers > 0:
+        yield from _map_batches_threaded(func, video_in, batch_size, n_workers, queue_size or n_workers + 1, window)
+        return
+
+    cap, start, stop = open_video(video_in, window)
+    try:
+        buffer = None
+        while True:
+            buffer, n = read_batch(cap, min(batch_size, stop - start), buffer, batch_size)
+            if n == 0:
+                break
+            yield start, func(buffer[:n], (start, start + n))
+            start += n
+    finally:
+        cap.release()
+
+
+def _map_batches_threaded(func, video_in: str, batch_size: int, n_workers: int, queue_size: int, window: tuple):
+    """
+    Decoder thread -> worker pool -> caller, block order preserved by queueing futures,
+    at most <queue_size> + 2 buffers are allocated and recycled
+    """
+    from queue import Queue, Full, Empty
+    from threading import Thread, Event
+    from concurrent.futures import ThreadPoolExecutor
+
+    futures = Queue(maxsize=queue_size)
+    buffers = Queue()
+    n_buffers = queue_size + 2
+    stop = Event()
+
+    # give up if the consumer has stopped, so the decoder never blocks forever
+    def put(item):
+        while not stop.is_set():
+            try:
+                futures.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def take_buffer():
+        while not stop.is_set():
+            try:
+                return buffers.get(timeout=0.1)
+            except Empty:
+                continue
+        return None
+
+    def decode(pool):
+        cap, start, end = open_video(video_in, window)
+        try:
+            allocated = 0
+            while not stop.is_set():
+                buffer = None
+                if allocated >= n_buffers:
+                    buffer = take_buffer()
+                    if buffer is None:
+                        break
+                else:
+                    allocated += 1
+
+                buffer, n = read_batch(cap, min(batch_size, end - start), buffer, batch_size)
+                if n == 0:
+                    break
+                if not put((start, buffer, pool.submit(func, buffer[:n], (start, start + n)))):
+                    break
+                start += n
+        except Exception as exc:
+            put(exc)
+        finally:
+            cap.release()
+            put(None)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        decoder = Thread(target=decode, args=(pool,), daemon=True)
+        decoder.start()
+        try:
+            while True:
+                item = futures.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                start, buffer, future = item
+                yield start, future.result()
+                buffers.put(buffer)
+        finally:
+            stop.set()
+            # drain queued blocks so the decoder can exit
+            while decoder.is_alive() or not futures.empty():
+                try:
+                    item = futures.get(timeout=0.1)
+                except Empty:
+                    continue
+                if isinstance(item, tuple):
+                    item[2].cancel()
+            decoder.join()
+
+
+def open_video(video_in: str, window: tuple = None):
+    """
+    Open video with cv2, positioned at the start of <window>
+
+    Returns
+    -------
+    cap: cv2.VideoCapture
+
+    start, stop: int
+        [start, stop) frames to read
+    """
+    start, stop = window if window is not None else (0, None)
+    if stop is None:
+        stop = float("inf")
+
+    cap = cv2.VideoCapture(video_in)
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    return cap, start, stop
+
+
+def read_batch(cap, batch_size: int, buffer=None, buffer_size: int = None):
+    """
+    Read up to <batch_size> frames from an opened cv2.VideoCapture into <buffer>,
+    which is allocated from the first frame (of <buffer_size> frames) if not given
+
+    Returns
+    -------
+    buffer: ndarray
+        (batch_size, H, W, C) frame buffer
+
+    n: int
+        number of frames read
+    """
+    n = 0
+    while n < batch_size and cap.isOpened():
+        ret, frame = cap.read() if buffer is None else cap.read(buffer[n])
+        if not ret:
+            break
+        if buffer is None:
+            buffer = np.empty((buffer_size or batch_size,) + frame.shape, dtype=frame.dtype)
+        if not np.shares_memory(frame, buffer[n]):
+            buffer[n] = frame
+        n += 1
+    return buffer, n
+
+
+# batch functions
+# ------
+def batch_func(func):
+    """
+    Mark [func] as a batch function, (:: ndarray, (int, int) -> ndarray),
+    mapped to an (N, H, W, C) block of frames with its [start, stop) frame range
+    """
+    func.batched = True
+    return func
+
+
+def is_batch_func(func) -> bool:
+    return getattr(func, "batched", False)
+
+
+def as_batch_func(func):
+    """Adapt a per-frame [func] (:: ndarray, int -> ndarray) to a batch function"""
+    if is_batch_func(func):
+        return func
+
+    @batch_func
+    def batch(block, frames):
+        out = None
+        for i, count in enumerate(range(*frames)):
+            frame = func(block[i], count)
+            if out is None:
+                # write back into the block unless the frame shape changed
+                out = block if frame.shape == block.shape[1:] else np.empty((len(block),) + frame.shape, frame.dtype)
+            out[i] = frame
+        return out
+
+    return batch
+
+
 def text_writer(data, col, position=(0, 0), fontScale=1):
     """
     Blahblahblah
@@ -61,20 +293,123 @@ def text_writer(data, col, position=(0, 0), fontScale=1):
     data = data[col]
     frame_start_end = (data.index[0], data.index[-1])
 
-    def func(frame, count):
-        if count < frame_start_end[0] or count > frame_start_end[-1]:
-            return frame
+    @batch_func
+    def func(block, frames):
+        # only frames within the data range are written
+        first = max(frames[0], frame_start_end[0])
+        last = min(frames[1] - 1, frame_start_end[-1])
 
-        # read text from dataframe
-        text = f"{col}: {data.loc[count]}"
+        for count in range(first, last + 1):
+            # read text from dataframe
+            text = f"{col}: {data.loc[count]}"
 
-        # calculate text size and set position
-        text_size = cv2.getTextSize(text=text, fontFace=cv2.FONT_HERSHEY_DUPLEX, fontScale=fontScale, thickness=1)
-        height = text_size[0][1]
-        position2 = (position[0], int(position[1] + height * 1.5))
+            # calculate text size and set position
+            text_size = cv2.getTextSize(text=text, fontFace=cv2.FONT_HERSHEY_DUPLEX, fontScale=fontScale, thickness=1)
+            height = text_size[0][1]
+            position2 = (position[0], int(position[1] + height * 1.5))
 
-        # write
-        frame = cv2.putText(frame, text, position2, cv2.FONT_HERSHEY_SIMPLEX, fontScale, (0, 0, 255), 1)
-        return frame
+            # write in place
+            cv2.putText(block[count - frames[0]], text, position2, cv2.FONT_HERSHEY_SIMPLEX, fontScale, (0, 0, 255), 1)
+        return block
 
     return func
+
+
+# video probing
+# ------
+_probe_cache = {}  # in-memory cache, {abspath: probe}
+
+
+def probe_video(video_path: str, cache: bool = True) -> dict:
+    """
+    Collect video properties in a single open,
+    duration, fps, frame count, resolution, bitrate, codec & brightness
+
+    Results are cached in memory and in a hidden file next to the video (one per video),
+    keyed by path + size + mtime so unchanged videos are never re-probed;
+    brightness is None if no frame could be read
+
+    Raise ValueError if the video cannot be opened (e.g. still being written), nothing is cached then
+    """
+    path = os.path.abspath(video_path)
+    stat = os.stat(path)
+
+    if cache:
+        probe = _probe_cache.get(path) or _load_probe_cache(path)
+        if probe and probe["size"] == stat.st_size and probe["mtime"] == stat.st_mtime:
+            _probe_cache[path] = probe
+            return probe
+
+    video = cv2.VideoCapture(path)
+    try:
+        fps = video.get(cv2.CAP_PROP_FPS)
+        if not video.isOpened() or not fps > 0:
+            raise ValueError(f"Unreadable video, cannot open or no frame rate: {video_path}")
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        duration = frame_count / fps
+        fourcc = int(video.get(cv2.CAP_PROP_FOURCC))
+        bit_rate = int(video.get(cv2.CAP_PROP_BITRATE) * 1000)  # kbps -> bps
+        if not bit_rate and duration:
+            bit_rate = int(stat.st_size * 8 / duration)
+
+        probe = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "duration": duration,
+            "fps": fps,
+            "frame_count": frame_count,
+            "width": int(video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "bit_rate": bit_rate,
+            "codec": "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)),
+            "brightness": sample_brightness(video),
+        }
+    finally:
+        video.release()
+
+    if cache:
+        _probe_cache[path] = probe
+        _save_probe_cache(path, probe)
+
+    return probe
+
+
+def sample_brightness(video, frame_no: int = cfg.FRAME2READ):
+    """
+    Median brightness of the <frame_no>th frame from an opened cv2.VideoCapture
+    (of 1st channel, this is GRAYSCALE ONLY)
+    """
+    frame = None
+    for _ in range(frame_no):
+        ret, new = video.read()
+        if not ret:
+            break
+        frame = new
+
+    if frame is None:
+        return None
+    return float(np.median(frame[:, :, 0]))
+
+
+def _probe_cache_path(path: str) -> str:
+    return os.path.join(os.path.dirname(path), "." + os.path.basename(path) + cfg.PROBE_CACHE)
+
+
+def _load_probe_cache(path: str) -> dict:
+    try:
+        with open(_probe_cache_path(path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_probe_cache(path: str, probe: dict) -> None:
+    """Write the cache file of the video, replaced atomically"""
+    cache_path = _probe_cache_path(path)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(probe, f, indent=4, sort_keys=True)
+        os.replace(temp_path, cache_path)
+    except OSError as err:
+        logger.warning(f"Failed to write probe cache {cache_path}: {err}")
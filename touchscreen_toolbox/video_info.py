@@ -1,15 +1,14 @@
 import os
 import re
-import cv2
 import json
-import h5py
 import logging
 import numpy as np
 import pandas as pd
 from typing import Union
-from moviepy.editor import VideoFileClip
 
 from . import config as cfg
+from . import catalog
+from .utils import probe_video, timestamp_session
 
 logger = logging.getLogger(__name__)
 
@@ -42,8 +41,10 @@ def get_vid_info(video_path: str, overwrite: bool = False, verbose: bool = True)
         success, name_info = decode_name(vid_info["vid_name"])
         vid_info.update(name_info)
         
-        vid_info["length"] = get_vid_len(video_path)
-        vid_info["fps"] = get_vid_fps(video_path)
+        probe = probe_video(video_path)
+        vid_info["length"] = probe["duration"]
+        vid_info["fps"] = probe["fps"]
+        vid_info["frame_count"] = probe["frame_count"]
 
     return vid_info
 
@@ -81,19 +82,12 @@ def decode_name(video_name: str):
 
 def get_vid_len(video_path):
     """Get video duration (sec)"""
-    clip = VideoFileClip(video_path)
-    return clip.duration
+    return probe_video(video_path)["duration"]
 
 
 def get_vid_fps(video_path):
     """Get video fps"""
-
-    video = cv2.VideoCapture(video_path)
-    fps = video.get(cv2.CAP_PROP_FPS)
-#     frame = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    video.release()
-
-    return fps
+    return probe_video(video_path)["fps"]
 
 
 def get_time(vid_info: dict, timestamps: str, buffer=cfg.TIME_BUFFER) -> bool:
@@ -133,35 +127,33 @@ def get_time(vid_info: dict, timestamps: str, buffer=cfg.TIME_BUFFER) -> bool:
 #     except KeyError:  # when the id-date pair is not found in time_file
 #         return False
     try:
-        with h5py.File(timestamps, 'r') as f:
-            
-            group = f[f"{vid_info['mouse_id']}/{vid_info['exp_date']}"]
-            
-            start = dict(group.attrs)['task_start'][0]  # read 'task_start' attribute
-            
-            end = np.asarray(group['states'],dtype=float)[-1,-1]     # read the last entry from 'states' dataset
-            
-            # ds = f[f"{vid_info['mouse_id']}/{vid_info['exp_date']}/video"]
-            # ds = pd.DataFrame(ds, columns=ds.attrs['headers'])
-            start = max(0, start + buffer[0])
-            end = min(vid_info['length'], end + buffer[1])
-            assert start < end
-            vid_info["time"] = (start, end)
-            vid_info['frames'] = (round(start * vid_info['fps']),
-                                  round(end * vid_info['fps']))
-
-            return True
+        # from the shared index of the timestamps file (see utils.timestamp_index)
+        session = timestamp_session(timestamps, vid_info['mouse_id'], vid_info['exp_date'])
+
+        start = session['attrs']['task_start'][0]  # 'task_start' attribute
+
+        end = session['end']  # last entry from 'states' dataset
+
+        start = max(0, start + buffer[0])
+        end = min(vid_info['length'], end + buffer[1])
+        assert start < end
+        vid_info["time"] = (start, end)
+        vid_info['frames'] = (round(start * vid_info['fps']),
+                              round(end * vid_info['fps']))
+
+        return True
     
     except KeyError:
         return False
 
 
 def save_info(vid_info: dict) -> None:
-    """Save vid info to the INFO child folder"""
+    """Save vid info to the INFO child folder, and the project catalog"""
 
     file_path = os.path.join(vid_info["dir"], cfg.INF_FOLDER, vid_info["vid_name"]+'.json')
     with open(file_path, 'w') as f:
         json.dump(vid_info, f, indent=4, sort_keys=True)
+    catalog.record(vid_info)  # if the video is in a cataloged project
 
 
 def load_info(vid_info: Union[str, dict]) -> dict:
@@ -187,14 +179,14 @@ def export_info(vid_info: dict) -> list:
     return val_ls
 
 
-def save_data(vid_info: dict, data: pd.DataFrame, csv: bool = True) -> None:
-    """Save data to result folder, default in hd5f format"""
+def save_data(vid_info: dict, data: pd.DataFrame, csv: bool = True, append: bool = False) -> None:
+    """Save data to result folder, default in hd5f format, with <append> data is added to the saved file"""
     save_path = os.path.join(cfg.RST_FOLDER, vid_info["vid_name"])
     if csv:
         save_path += ".csv"
-        data.to_csv(os.path.join(vid_info["dir"], save_path))
+        data.to_csv(os.path.join(vid_info["dir"], save_path), mode="a" if append else "w", header=not append)
     else:
         save_path += ".h5"
         h5key = vid_info['mouse_id'] + '-' + vid_info['exp_date']
-        data.astype(float).replace({pd.NA: np.nan}).to_hdf(os.path.join(vid_info["dir"], save_path), h5key)  # <- TODO: fix this stupid type conversion
+        data.to_hdf(os.path.join(vid_info["dir"], save_path), key=h5key, format="table", append=append)
     vid_info['post_result'] = save_path
@@ -0,0 +1,175 @@
+# Incremental scanner for new recordings, see core.watch_folder
+
+import os
+import time
+import logging
+
+from . import utils
+from . import catalog
+from . import config as cfg
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+    """
+    Polling scanner of videos under <root>
+
+    Only directories whose mtime changed are listed again (with os.scandir), new or changed videos
+    (size / mtime) are pending until unchanged for <settle> seconds, i.e. the recorder has finished
+    writing; videos already postprocessed in the project catalog are not returned again unless changed.
+    Returned videos are only done once reported successful (see finish), failed ones are retried
+    after <retry> seconds, and marked failed in the catalog after <attempts> attempts (not returned again
+    unless changed). Every directory is listed again each <recheck> polls, for in-place rewrites (not changing
+    the directory mtime) and file systems with coarse mtimes.
+    """
+
+    def __init__(self, root: str, settle: float = cfg.WATCH_SETTLE, recheck: int = cfg.WATCH_RECHECK,
+                 retry: float = cfg.WATCH_RETRY, attempts: int = cfg.WATCH_ATTEMPTS):
+        self.root = os.path.abspath(root)
+        self.settle = settle
+        self.recheck = recheck
+        self.retry = retry
+        self.attempts = attempts
+        self.polls = 0
+
+        self.dirs = {}  # dir -> (mtime, subdirs, videos) at last listing
+        self.files = {}  # video -> (size, mtime) last seen
+        self.pending = {}  # video -> ((size, mtime), time it is ready if unchanged)
+        self.processing = {}  # video -> (size, mtime) when returned, until finished
+        self.failures = {}  # video -> ((size, mtime), failed attempts at that version)
+
+        # video -> (size, mtime) when processed / given up, seeded from the catalog
+        rows = catalog.videos(self.root)
+        self.done = {row["path"]: (row["size"], row["mtime"]) for row in rows if row["status"] == "post"}
+        self.failed = {row["path"]: (row["size"], row["mtime"]) for row in rows if row["status"] == "failed"}
+
+    def poll(self, now: float = None) -> list:
+        """
+        Scan for changes, and return videos stable for <settle> seconds
+
+        Returns
+        -------
+        ready: list[tuple]
+            (path, changed) of videos to process, changed if a previous version was processed,
+            each is to be reported with finish
+        """
+        now = time.time() if now is None else now
+        full = self.recheck and self.polls % self.recheck == 0
+        if full:
+            self.dirs.clear()  # list every directory again
+        changed = self.scan()
+        if full:
+            listed = {video for _, _, videos in self.dirs.values() for video in videos}
+            self.files = {path: signature for path, signature in self.files.items() if path in listed}
+        self.polls += 1
+
+        for path in changed:
+            if path not in self.pending and path not in self.processing \
+                    and self.files.get(path) not in (self.done.get(path), self.failed.get(path)):
+                self.pending[path] = (self.files[path], now + self.settle)
+
+        ready = []
+        for path, (signature, ready_at) in list(self.pending.items()):
+            current = stat_video(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                self.pending[path] = (current, now + self.settle)  # still being written
+            elif now >= ready_at:
+                del self.pending[path]
+                self.processing[path] = current
+                ready.append((path, path in self.done))
+
+        return ready
+
+    def finish(self, path: str, success: bool, now: float = None) -> None:
+        """
+        Report a video returned by poll as processed, or failed to be retried after <retry> seconds,
+        up to <attempts> attempts at the same version of the video
+        """
+        now = time.time() if now is None else now
+        signature = self.processing.pop(path)
+        previous, failures = self.failures.pop(path, (None, 0))
+        if success:
+            self.done[path] = signature
+        else:
+            failures = failures + 1 if previous == signature else 1
+            if failures < self.attempts:
+                self.failures[path] = (signature, failures)
+                self.pending[path] = (signature, now + self.retry)
+                return
+            logger.warning(f"Giving up on {path} after {failures} failed attempts, until it changes")
+            self.failed[path] = signature
+            catalog.mark_failed(path, catalog.find_catalog(self.root))
+
+        if self.files.get(path, signature) != signature:  # changed while processing
+            self.pending[path] = (self.files[path], now + self.settle)
+
+    def scan(self) -> list:
+        """Videos new or changed since the last scan, in directories changed since"""
+        changed = []
+        self._scan_dir(self.root, changed)
+        return changed
+
+    def _scan_dir(self, path: str, changed: list) -> None:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._forget(path)
+            return
+
+        known = self.dirs.get(path)
+        if known is None or known[0] != mtime:
+            subdirs, videos = [], []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not utils.is_generated(entry.name):
+                            subdirs.append(entry.path)
+                    elif is_video(entry.name):
+                        videos.append(entry.path)
+            self.dirs[path] = (mtime, subdirs, videos)
+
+            if known is not None:
+                for old in set(known[1]) - set(subdirs):
+                    self._forget(old)
+                for old in set(known[2]) - set(videos):
+                    self.files.pop(old, None)
+            changed += [video for video in videos if self.restat(video)]
+
+        for subdir in self.dirs[path][1]:
+            self._scan_dir(subdir, changed)
+
+    def restat(self, path: str) -> bool:
+        """Update the last seen (size, mtime) of video <path>, whether it changed"""
+        signature = stat_video(path)
+        if signature is None:
+            self.files.pop(path, None)
+            return False
+        changed = self.files.get(path) != signature
+        self.files[path] = signature
+        return changed
+
+    def _forget(self, path: str) -> None:
+        """Drop directory <path> and everything under it"""
+        known = self.dirs.pop(path, None)
+        if known is not None:
+            for subdir in known[1]:
+                self._forget(subdir)
+            for video in known[2]:
+                self.files.pop(video, None)
+
+
+def is_video(file_name: str) -> bool:
+    """Whether <file_name> is a recording, excluding videos created by preprocess"""
+    return os.path.splitext(file_name)[1] in cfg.FORMATS and 'DLC' not in file_name
+
+
+def stat_video(path: str) -> tuple:
+    """(size, mtime) of <path>, None if not found"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime